@@ -7,13 +7,13 @@ historical transactions and fits an IsolationForest to produce an
 Designed for demo/testing. Not intended as production-grade pipeline.
 """
 from typing import Dict, Any
-import numpy as np
 try:
     import networkx as nx
 except Exception:
     nx = None
 from sklearn.ensemble import IsolationForest
-import database
+import feature_schema
+import storage
 
 # module-level state
 G = None
@@ -23,13 +23,14 @@ _score_max = None
 
 
 def init_analytics(recalculate: bool = False):
-    """Build graph from DB and fit an IsolationForest on simple numeric features."""
+    """Build graph from stored transactions and fit an IsolationForest on simple numeric features."""
     global G, if_model, _score_min, _score_max
     if nx is None:
         print('analytics: networkx not available; skipping graph analytics')
         return
 
-    txs = database.get_all_transactions()
+    # streamed page by page; `features` is decrypted only when the row's time is read
+    txs = storage.backend.iter_transactions(columns=('upi', 'merchant', 'amount', 'features'))
     G = nx.Graph()
 
     rows = []
@@ -48,23 +49,21 @@ def init_analytics(recalculate: bool = False):
             time_val = float(feats.get('time') or 0)
         except Exception:
             time_val = 0
-        rows.append((amount, time_val, upi, merchant))
+        rows.append({'amount': amount, 'hour': time_val, 'upi': upi, 'merchant': merchant})
 
-    # build numeric matrix
-    X = []
-    for amount, time_val, upi, merchant in rows:
-        upi_deg = G.degree(upi) if G.has_node(upi) else 0
-        m_deg = G.degree(merchant) if G.has_node(merchant) else 0
-        X.append([amount, time_val, upi_deg, m_deg])
+    # build numeric matrix (degrees are final only once the whole graph is built)
+    for r in rows:
+        r['upi_degree'] = G.degree(r['upi']) if G.has_node(r['upi']) else 0
+        r['merchant_degree'] = G.degree(r['merchant']) if G.has_node(r['merchant']) else 0
 
-    if len(X) < 5:
+    if len(rows) < 5:
         # not enough data to fit a model
         if_model = None
         _score_min = None
         _score_max = None
         return
 
-    X = np.array(X)
+    X = feature_schema.ANOMALY.matrix(rows).copy()
     if_model = IsolationForest(contamination=0.05, random_state=42)
     try:
         if_model.fit(X)
@@ -108,7 +107,7 @@ def compute_features_for_tx(tx: Dict[str, Any]) -> Dict[str, Any]:
     # numeric vector for anomaly model
     amount = float(tx.get('amount') or 0)
     time_val = float(tx.get('hour') or 0)
-    vec = np.array([[amount, time_val, upi_deg, m_deg]])
+    vec = feature_schema.ANOMALY.vector({'amount': amount, 'hour': time_val, 'upi_degree': upi_deg, 'merchant_degree': m_deg})
 
     if if_model is not None:
         try:
@@ -1,12 +1,21 @@
-from flask import Flask, request, jsonify, render_template, Response, session, redirect, url_for
+from flask import Flask, request, jsonify, render_template, Response, session, redirect, url_for, stream_with_context
 import os
 import pickle
+import zlib
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 import queue
 import json
 import database
+import export
+import feature_schema
+import model_compiler
+import sketches
+import snapshot
+import storage
+import velocity
+from pipeline import ScoringPipeline
+from writer import writer as write_behind
 
 try:
     import analytics
@@ -21,8 +30,8 @@ except Exception:
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-change-this')
 
-# Initialize database
-database.init_db()
+# Initialize storage (STORAGE_BACKEND=sqlite|memory)
+storage.backend.init()
 
 
 @app.after_request
@@ -33,6 +42,12 @@ def add_no_cache_headers(response):
     response.headers['Expires'] = '0'
     return response
 
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    # hand this request thread's pooled SQLite connection back for reuse
+    storage.backend.release()
+
 # Load models
 models = {}
 model_names = ['logistic_regression', 'decision_tree', 'random_forest', 'support_vector_machine']
@@ -40,12 +55,20 @@ for name in model_names:
     try:
         # model pickles moved to `models/` for repository cleanliness
         with open(os.path.join('models', f'{name}_model.pkl'), 'rb') as f:
-            models[name] = pickle.load(f)
+            # checked against the feature schema, then scored with plain arrays
+            models[name] = feature_schema.TRANSACTION.bind_model(pickle.load(f))
         print(f"✓ Loaded {name} model")
     except Exception as e:
         print(f"✗ Error loading {name}: {e}")
         models[name] = None
 
+# trees and the logistic regression are scored by NumPy evaluators compiled from the pickles
+# (MODEL_COMPILE=0 scores with the pickles); SHAP explanations always use the pickles
+scoring_models = model_compiler.compile_models(models)
+compiled_names = [name for name, m in scoring_models.items() if m is not None and m is not models[name]]
+if compiled_names:
+    print(f"✓ Compiled {', '.join(compiled_names)}")
+
 # Optional SHAP explainability (import lazily inside compute_shap_explanation to avoid heavy startup cost)
 shap = None
 shap_available = False
@@ -53,10 +76,36 @@ shap_available = False
 
 # Load recent transaction history from DB (persistent)
 
-transaction_history = database.get_recent_transactions(100)
+transaction_history = storage.backend.get_recent_transactions(100)
+
+# Serve velocity windows from memory; the DB snapshot query stays as fallback
+VELOCITY_IN_MEMORY = os.environ.get('VELOCITY_IN_MEMORY', '1') != '0'
+
+
+def _on_sqlite():
+    """Velocity engine, sketches and snapshots are fed by/read from the SQLite DB only."""
+    return storage.backend.name == 'sqlite'
 
-# In-memory cache of user profiles; on-demand fallback to DB
-user_profiles = {}
+
+if _on_sqlite():
+    if VELOCITY_IN_MEMORY:
+        try:
+            velocity.engine.rehydrate()
+        except Exception as e:
+            print(f'⚠️ Velocity engine rehydrate failed: {e}')
+
+    try:
+        sketches.registry.ensure_built()
+    except Exception as e:
+        print(f'⚠️ Sketch rebuild failed: {e}')
+
+    # reporting endpoints read a periodically refreshed copy of the DB (SNAPSHOT_INTERVAL_SECONDS=0 disables)
+    snapshot.manager.start()
+
+
+def _age(seconds):
+    """Snapshot age for responses (None when the primary DB was read)."""
+    return round(seconds, 1) if seconds is not None else None
 
 @app.route('/')
 def index():
@@ -82,13 +131,13 @@ def register():
         if not upi or not password:
             return render_template('register.html', error='Missing fields')
         # check exists
-        if database.get_user_by_upi(upi):
+        if storage.backend.get_user_by_upi(upi):
             return render_template('register.html', error='User already exists')
         # hash password
         from security import hash_password, generate_totp_secret
         pw_hash = hash_password(password)
         # create user with no mfa initially (mfa setup can be done later)
-        database.create_user(upi, display_name, pw_hash, None)
+        storage.backend.create_user(upi, display_name, pw_hash, None)
         return render_template('login.html', error='Account created, please sign in')
     except Exception as e:
         return render_template('register.html', error=str(e))
@@ -103,7 +152,7 @@ def login():
         password = request.form.get('password')
         if not upi or not password:
             return render_template('login.html', error='Missing credentials')
-        user = database.get_user_by_upi(upi)
+        user = storage.backend.get_user_by_upi(upi)
         if not user:
             return render_template('login.html', error='Invalid credentials')
         from security import verify_password
@@ -134,7 +183,7 @@ def mfa():
         pending = session.get('pending_mfa_user')
         if not pending:
             return redirect('/login')
-        user = database.get_user_by_upi(pending)
+        user = storage.backend.get_user_by_upi(pending)
         from security import verify_totp, generate_totp_secret, totp_uri
         if request.method == 'GET':
             if not user.get('mfa_enabled'):
@@ -152,8 +201,7 @@ def mfa():
             return render_template('mfa_verify.html', error='MFA not setup')
 
         # allow backup code usage as fallback
-        from database import get_and_consume_backup_code
-        if token and len(token) == 8 and get_and_consume_backup_code(pending, token):
+        if token and len(token) == 8 and storage.backend.get_and_consume_backup_code(pending, token):
             # backup code accepted
             session.pop('pending_mfa_user', None)
             session['user'] = {'upi': user.get('upi'), 'display_name': user.get('display_name')}
@@ -166,7 +214,7 @@ def mfa():
             # generate backup codes
             import secrets
             codes = [secrets.token_hex(4) for _ in range(8)]
-            database.set_mfa_for_user(pending, secret, enabled=True, backup_codes=codes)
+            storage.backend.set_mfa_for_user(pending, secret, enabled=True, backup_codes=codes)
             # show codes to user
             session.pop('pending_mfa_user', None)
             session['user'] = {'upi': user.get('upi'), 'display_name': user.get('display_name')}
@@ -261,7 +309,7 @@ def account():
         return redirect('/login')
     upi = user.get('upi')
     # fetch webauthn credentials for the user
-    creds = database.get_webauthn_credentials(upi) or []
+    creds = storage.backend.get_webauthn_credentials(upi) or []
     return render_template('account.html', current_user=user, webauthn_creds=creds)
 
 
@@ -274,7 +322,7 @@ def webauthn_credential_delete():
     cred_id = payload.get('id')
     if not cred_id:
         return jsonify({'success': False, 'error': 'missing_id'}), 400
-    ok = database.remove_webauthn_credential(user.get('upi'), cred_id)
+    ok = storage.backend.remove_webauthn_credential(user.get('upi'), cred_id)
     return jsonify({'success': ok})
 
 
@@ -283,9 +331,15 @@ def health():
     return jsonify({'status': 'ok'})
 
 
+@app.route('/api/scoring/timings')
+def scoring_timings():
+    """Cumulative time per scoring stage and per model (latency, calls, errors)."""
+    return jsonify({'stages': scoring.stage_timings(), 'models': scoring.model_timings()})
+
+
 @app.route('/api/explain/<int:tx_id>')
 def get_explanation(tx_id):
-    tx = database.get_transaction_by_id(tx_id)
+    tx = storage.backend.get_transaction_by_id(tx_id)
     if not tx:
         return jsonify({'success': False, 'error': 'not_found'}), 404
     if not tx.get('explanation'):
@@ -308,22 +362,17 @@ def clear_transactions():
                 print('Forbidden: invalid or missing CLEAR_TRANSACTIONS_TOKEN')
                 return jsonify({'success': False, 'error': 'forbidden'}), 403
 
-        database.clear_transactions()
+        # let queued writes land first so they are cleared too
+        write_behind.flush()
+        storage.backend.clear_transactions()
         # audit log the clear action
         try:
-            database.log_audit('clear_transactions', actor='admin', details={'remote_addr': request.remote_addr, 'protected': bool(expected)})
+            storage.backend.log_audit('clear_transactions', actor='admin', details={'remote_addr': request.remote_addr, 'protected': bool(expected)})
         except Exception:
             pass
-        # clear in-memory history
-        global transaction_history, user_profiles
+        # clear in-memory history (profile aggregates were cleared with the transactions)
+        global transaction_history
         transaction_history = []
-        # also clear transactions field in user_profiles
-        for upi, prof in list(user_profiles.items()):
-            prof['transactions'] = []
-            try:
-                database.save_user_profile(upi, prof)
-            except Exception:
-                pass
         # push a stream event to notify clients
         push_event({'type': 'clear', 'message': 'All transactions cleared by operator'})
         return jsonify({'success': True})
@@ -335,15 +384,8 @@ def analyze_fraud_indicators(upi, amount, hour, category, merchant, location):
     """Analyze multiple fraud indicators"""
     indicators = []
     fraud_score = 0
-    # load profile from cache or DB
-    if upi not in user_profiles:
-        p = database.get_user_profile(upi)
-        if p:
-            user_profiles[upi] = p
-        else:
-            user_profiles[upi] = {'transactions': []}
-
-    profile = user_profiles[upi]
+    # aggregated history for this UPI (None for a first-time payer)
+    profile = storage.backend.get_profile_aggregates(upi, merchant=merchant)
     
     if amount > 50000:
         indicators.append({
@@ -375,8 +417,7 @@ def analyze_fraud_indicators(upi, amount, hour, category, merchant, location):
         })
         fraud_score += 10
     
-    merchant_history = [t.get('merchant', '') for t in profile['transactions']]
-    if merchant not in merchant_history and len(merchant_history) > 0:
+    if profile and not profile['merchant_seen']:
         indicators.append({
             'name': 'Unknown Merchant',
             'description': f'First time transaction to {merchant}',
@@ -402,12 +443,12 @@ def push_event(event: dict):
             pass
 
 
-def build_feature_dataframe(amount, hour):
-    # Keep feature names consistent with training script (`amount`, `time`)
-    return pd.DataFrame([[amount, hour]], columns=['amount', 'time'])
+def build_feature_vector(amount, hour):
+    # Same column order as the training script (`amount`, `time`)
+    return feature_schema.TRANSACTION.vector({'amount': amount, 'hour': hour})
 
 
-def compute_shap_explanation(features_df):
+def compute_shap_explanation(features):
     """Compute SHAP explanation for the given features using the RandomForest model (if available). Returns a dict or None."""
     # Try to import shap lazily (may be heavy); if not available, return empty explanation
     global shap, shap_available
@@ -424,12 +465,12 @@ def compute_shap_explanation(features_df):
 
     # Try the newer high-level API first (returns consistent arrays)
     try:
-        explainer = shap.Explainer(models['random_forest'], features_df)
-        res = explainer(features_df)
+        explainer = shap.Explainer(models['random_forest'], features)
+        res = explainer(features)
         vals = np.asarray(res.values)
         if vals.ndim == 1:
             vals = vals.reshape(1, -1)
-        contributions = {col: float(vals[0, i]) for i, col in enumerate(features_df.columns.tolist())}
+        contributions = {col: float(vals[0, i]) for i, col in enumerate(feature_schema.TRANSACTION.names)}
         base_value = None
         try:
             bv = res.base_values
@@ -443,7 +484,7 @@ def compute_shap_explanation(features_df):
         # fallback to TreeExplainer API
         try:
             explainer = shap.TreeExplainer(models['random_forest'])
-            shap_values = explainer.shap_values(features_df)
+            shap_values = explainer.shap_values(features)
         except Exception as e:
             print(f"Error computing shap_values (fallback): {e}")
             return {'base_value': None, 'contributions': {}}
@@ -459,7 +500,7 @@ def compute_shap_explanation(features_df):
             # ensure 2D: samples x features
             if arr.ndim == 1:
                 arr = arr.reshape(1, -1)
-            contributions = {col: float(arr[0, i]) for i, col in enumerate(features_df.columns.tolist())}
+            contributions = {col: float(arr[0, i]) for i, col in enumerate(feature_schema.TRANSACTION.names)}
         except Exception as e:
             print(f"Error parsing SHAP values into contributions (fallback): {e}")
             return {'base_value': None, 'contributions': {}}
@@ -481,293 +522,195 @@ def compute_shap_explanation(features_df):
         return {'base_value': base_value, 'contributions': contributions}
 
 
-def process_transaction(upi_number, amount, hour, day, month, year, merchant, category, location, device_id=None):
-    """Process a transaction: run models, indicators, persist, and publish event. Optional device_id for fingerprinting."""
-    features_df = build_feature_dataframe(amount, hour)
-
-    predictions = {}
-    for name, model in models.items():
-        if model is None:
-            predictions[name] = {'prediction': 0, 'confidence': None}
-            continue
-        try:
-            pred = model.predict(features_df)[0]
-            conf = None
-            if hasattr(model, 'predict_proba'):
-                proba = model.predict_proba(features_df)[0]
-                conf = round(max(proba) * 100, 2)
-            predictions[name] = {'prediction': int(pred), 'confidence': conf}
-        except Exception as e:
-            print(f"Error predicting with {name}: {e}")
-            predictions[name] = {'prediction': 0, 'confidence': None}
-
-    # compute frequency features (rolling windows: 1h, 6h, 24h, 7d)
-    last_1h = database.count_transactions_for_upi(upi_number, minutes=60)
-    last_6h = database.count_transactions_for_upi(upi_number, minutes=6*60)
-    last_24h = database.count_transactions_for_upi(upi_number, minutes=24*60)
-    last_7d = database.count_transactions_for_upi(upi_number, minutes=7*24*60)
-
-    # last transaction info
-    last_tx = database.get_last_transaction_for_upi(upi_number)
-
-    # add frequency and optional device_id to features
-    features_obj = {
-        'count_1h': last_1h,
-        'count_6h': last_6h,
-        'count_24h': last_24h,
-        'count_7d': last_7d
-    }
-    if device_id:
-        features_obj['device_id'] = device_id
-
-    # analyze indicators (base)
-    indicators, indicator_score = analyze_fraud_indicators(upi_number, amount, hour, category, merchant, location)
-
-    # Enrich features with analytics (graph + anomaly) when available
-    try:
-        if 'analytics' in globals() and analytics is not None:
-            extra_feats = analytics.compute_features_for_tx({'upi': upi_number, 'merchant': merchant, 'amount': amount, 'hour': hour})
-            if extra_feats:
-                # merge into features and consider anomaly in indicator scoring
-                features_obj.update(extra_feats)
-                a_score = float(extra_feats.get('anomaly_score') or 0)
-                if a_score > 0.7:
-                    indicators.append({'name': 'Anomalous Behavior', 'description': f'Anomaly score {a_score:.2f}', 'risk': 30})
-                    indicator_score += 30
-    except Exception as e:
-        print(f'Analytics error: {e}')
+# Max seconds a request waits for its transaction row to be committed
+WRITE_TIMEOUT_SECONDS = float(os.environ.get('WRITE_TIMEOUT_SECONDS', '10'))
 
-    # location change indicator: if last tx exists and location differs within 2 hours
-    if last_tx:
-        try:
-            # parse timestamp
-            last_ts = datetime.strptime(last_tx['timestamp'], '%Y-%m-%d %H:%M:%S')
-            diff_minutes = (datetime.now() - last_ts).total_seconds() / 60.0
-            if last_tx.get('location') and last_tx.get('location') != location and diff_minutes < 120:
-                indicators.append({'name': 'Location Changed', 'description': f'Location changed from {last_tx.get("location")} to {location} within {int(diff_minutes)} minutes', 'risk': 20})
-                indicator_score += 20
-            # attach last tx features for reference
-            features_obj['last_location'] = last_tx.get('location')
-            features_obj['minutes_since_last'] = int(diff_minutes)
-
-            # device change indicator (if device differs from last tx's device within 2 hours)
-            try:
-                last_dev = (last_tx.get('features') or {}).get('device_id')
-                if last_dev and device_id and last_dev != device_id and diff_minutes < 120:
-                    indicators.append({'name': 'Device Changed', 'description': f'Device changed from {last_dev} to {device_id} within {int(diff_minutes)} minutes', 'risk': 15})
-                    indicator_score += 15
-            except Exception:
-                pass
-        except Exception:
-            pass
 
-    fraud_votes = sum(1 for p in predictions.values() if p['prediction'] == 1)
-    model_fraud_score = 25 if fraud_votes > len(models) / 2 else 0
+def build_feature_matrix(rows):
+    """One model input for a batch of rows (each needs `amount` and `hour`)."""
+    return feature_schema.TRANSACTION.matrix(rows)
 
-    fraud_score = min(100, indicator_score + model_fraud_score)
 
-    overall_prediction = 1 if fraud_score >= 50 else 0
+def velocity_snapshot(upi, windows):
+    """Rolling-window counts and last-transaction context (in-memory engine, DB as fallback)."""
+    snapshot = velocity.engine.snapshot(upi, windows) if VELOCITY_IN_MEMORY and _on_sqlite() else None
+    if snapshot is None:
+        snapshot = storage.backend.get_velocity_snapshot(upi, windows=windows)
+    return snapshot
 
 
-    transaction = {
-        'id': None,
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'upi': upi_number,
-        'amount': amount,
-        'merchant': merchant,
-        'category': category,
-        'location': location,
-        'risk_score': fraud_score,
-        'status': 'Fraud' if overall_prediction == 1 else 'Legitimate',
-        'status_color': '#e74c3c' if overall_prediction == 1 else '#27ae60',
-        'indicators': indicators,
-        'blocked': 1 if overall_prediction == 1 else 0,
-        'blocked_by': 'system' if overall_prediction == 1 else None,
-        'blocked_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S') if overall_prediction == 1 else None
-    }
-
+def explain_transaction(features):
     # compute explanation (lazy import inside function); only require model
-    explanation = None
-    if models.get('random_forest') is not None:
-        try:
-            explanation = compute_shap_explanation(features_df)
-            transaction['explanation'] = explanation
-        except Exception as e:
-            print(f"Error computing explanation: {e}")
-            transaction['explanation'] = None
-    else:
-        transaction['explanation'] = None
+    if models.get('random_forest') is None:
+        return None
+    return compute_shap_explanation(features)
 
-    # attach computed features for persistence
-    transaction['features'] = features_obj
 
-    # persist
-    try:
-        tx_id = database.save_transaction(transaction)
-        transaction['id'] = tx_id
-    except Exception as e:
-        print(f"Error saving transaction to DB: {e}")
-    transaction_history.append(transaction)
+scoring = ScoringPipeline(
+    scoring_models,
+    build_features=build_feature_matrix,
+    rule_indicators=analyze_fraud_indicators,
+    velocity_snapshot=velocity_snapshot,
+    writer=write_behind,
+    publish=push_event,
+    record=lambda tx: transaction_history.append(tx),
+    analytics=analytics,
+    explain=explain_transaction,
+    write_timeout=WRITE_TIMEOUT_SECONDS,
+)
 
-    # audit: if system blocked the transaction, log it
-    try:
-        if transaction.get('blocked'):
-            database.log_audit('auto_block', actor='system', details={'tx_id': transaction.get('id'), 'upi': upi_number, 'risk_score': fraud_score})
-    except Exception:
-        pass
 
-    # update user profile in memory and persist
-    if upi_number not in user_profiles:
-        user_profiles[upi_number] = {'transactions': []}
-    user_profiles[upi_number]['transactions'].append(transaction)
-    try:
-        database.save_user_profile(upi_number, user_profiles[upi_number])
-    except Exception as e:
-        print(f"Error saving user profile to DB: {e}")
+def process_transaction(upi_number, amount, hour, day, month, year, merchant, category, location, device_id=None):
+    """Process a transaction: run models, indicators, persist, and publish event. Optional device_id for fingerprinting."""
+    return scoring.run([{'upi_number': upi_number, 'amount': amount, 'hour': hour, 'day': day, 'month': month, 'year': year,
+                         'merchant': merchant, 'category': category, 'location': location, 'device_id': device_id}])[0]
+
 
-    # push event to realtime clients
-    push_event({'type': 'transaction', 'transaction': transaction, 'predictions': predictions, 'explanation': explanation})
+def score_batch(payloads):
+    """Score, persist and publish a batch of transaction payloads; returns [(transaction, predictions), ...] in order."""
+    return scoring.run(payloads)
 
-    return transaction, predictions
 
 @app.route('/predict', methods=['POST'])
 def predict():
     """Real-time fraud detection endpoint with behavioral signals"""
     try:
-        # Primary form fields
-        amount = float(request.form.get('amount', 0))
-        hour = int(request.form.get('hour', 0))
-        day = int(request.form.get('day', 1))
-        month = int(request.form.get('month', 1))
-        year = int(request.form.get('year', 2024))
-        payer_upi = request.form.get('payer_upi', 'N/A')
-        payee_upi = request.form.get('payee_upi', 'N/A')
-        merchant = request.form.get('merchant', 'Unknown Merchant')
-        category = request.form.get('category', 'Transfer')
-        location = request.form.get('location', 'Unknown')
-        device_id = request.form.get('device_id', None)
-
-        # Behavioral signals (optional)
-        typing_speed = float(request.form.get('typing_speed', 0))
-        backspace_ratio = float(request.form.get('backspace_ratio', 0))
-        hesitation_time = float(request.form.get('hesitation_time', 0))
-        paste_detected = int(request.form.get('paste_detected', 0))
-        focus_changes = int(request.form.get('focus_changes', 0))
-
-        # Use payer_upi as the primary UPI (for backward compat, also accept upi_number)
-        upi_number = payer_upi if payer_upi != 'N/A' else request.form.get('upi_number', 'N/A')
-        
-        features_df = build_feature_dataframe(amount, hour)
-        
-        predictions = {}
-        for name, model in models.items():
-            if model is None:
-                predictions[name] = {'prediction': 0, 'confidence': None}
-                continue
-            try:
-                pred = model.predict(features_df)[0]
-                conf = None
-                if hasattr(model, 'predict_proba'):
-                    proba = model.predict_proba(features_df)[0]
-                    conf = round(max(proba) * 100, 2)
-                predictions[name] = {'prediction': pred, 'confidence': conf}
-            except Exception as e:
-                print(f"Error predicting with {name}: {e}")
-                predictions[name] = {'prediction': 0, 'confidence': None}
-        
-        indicators, indicator_score = analyze_fraud_indicators(upi_number, amount, hour, category, merchant, location)
-
-        # Optional: Boost fraud score based on behavioral signals
-        # High paste ratio or rapid typing with lots of backspacing can be suspicious
-        if paste_detected and backspace_ratio > 0.2:
-            indicators.append({'name': 'Suspicious Paste Pattern', 'description': 'Detected paste with high backspace ratio', 'risk': 10})
-            indicator_score += 10
-        
-        if focus_changes > 5:
-            indicators.append({'name': 'Multiple Focus Changes', 'description': f'Window focus changed {focus_changes} times', 'risk': 5})
-            indicator_score += 5
-        
-        fraud_votes = sum(1 for p in predictions.values() if p['prediction'] == 1)
-        model_fraud_score = 25 if fraud_votes > len(models) / 2 else 0
-        
-        fraud_score = min(100, indicator_score + model_fraud_score)
-        
-        overall_prediction = 1 if fraud_score >= 50 else 0
-        prediction_text = 'Fraud Detected' if overall_prediction == 1 else 'Legitimate Transaction'
-        
-        # process and persist transaction via helper
-        transaction, predictions = process_transaction(upi_number, amount, hour, day, month, year, merchant, category, location, device_id=device_id)
+        form = request.form.to_dict()
+        # one pass through the scoring pipeline (payer_upi is the primary UPI; upi_number for backward compat)
+        transaction, predictions = score_batch([form])[0]
+        indicators = transaction['indicators']
+        prediction_text = 'Fraud Detected' if transaction['status'] == 'Fraud' else 'Legitimate Transaction'
 
         # fetch recent 10 transactions for the UI (prefer DB)
         try:
-            recent_tx = database.get_recent_transactions(10)
+            recent_tx = storage.backend.get_recent_transactions(10)
         except Exception:
             recent_tx = transaction_history[-10:]
 
         return render_template('index.html', 
                              prediction=prediction_text,
-                             risk_score=fraud_score,
+                             risk_score=transaction['risk_score'],
                              status=transaction['status'],
                              status_color=transaction['status_color'],
                              model_predictions=predictions,
                              fraud_indicators=indicators,
-                             merchant=merchant,
-                             category=category,
-                             location=location,
-                             amount=amount,
-                             hour=hour,
-                             payer_upi=payer_upi,
-                             payee_upi=payee_upi,
+                             merchant=transaction['merchant'],
+                             category=transaction['category'],
+                             location=transaction['location'],
+                             amount=transaction['amount'],
+                             hour=int(form.get('hour', 0)),
+                             payer_upi=form.get('payer_upi', 'N/A'),
+                             payee_upi=form.get('payee_upi', 'N/A'),
                              predictions=predictions,
                              indicators=indicators,
                              transactions=recent_tx,
-                             upi=upi_number)
+                             upi=transaction['upi'])
     
     except Exception as e:
         return render_template('index.html', error=f'Error: {str(e)}')
 
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
-    """API endpoint to get recent transactions"""
+    """API endpoint to get recent transactions (optionally only those flagged with `?indicator=<name>`)"""
+    indicator = request.args.get('indicator')
+    age = None
+    try:
+        with snapshot.manager.reader() as age:
+            if indicator:
+                txs = storage.backend.get_transactions_with_indicator(indicator, 20)
+            else:
+                txs = storage.backend.get_recent_transactions(20)
+    except Exception:
+        age = None
+        txs = [t for t in transaction_history
+               if not indicator or any(database.indicator_name(i) == indicator for i in t.get('indicators') or [])][-20:]
+    return jsonify({'transactions': txs, 'snapshot_age_seconds': _age(age)})  # Last 20 transactions
+
+
+@app.route('/api/transactions/export', methods=['GET'])
+def export_transactions_stream():
+    """Stream transactions as NDJSON (default) or CSV with constant memory.
+
+    Query parameters: `format=ndjson|csv`, `since_id` (resume after the last id
+    received), `until` (epoch seconds or local `YYYY-MM-DD[ HH:MM:SS]`).
+    Gzip-compressed when the client sends `Accept-Encoding: gzip`. Protected
+    by EXPORT_TOKEN (X-Admin-Token header) if set.
+    """
+    expected = os.environ.get('EXPORT_TOKEN')
+    if expected and request.headers.get('X-Admin-Token') != expected:
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'error': 'format must be ndjson or csv'}), 400
+    try:
+        since_id = int(request.args.get('since_id') or 0)
+        until_epoch = _parse_report_time(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     try:
-        txs = database.get_recent_transactions(20)
+        storage.backend.log_audit('export_transactions', actor='api', details={'remote_addr': request.remote_addr, 'format': fmt,
+                                                                        'since_id': since_id, 'until': request.args.get('until')})
     except Exception:
-        txs = transaction_history[-20:]
-    return jsonify({'transactions': txs})  # Last 20 transactions
+        pass
+
+    gzip_out = 'gzip' in request.headers.get('Accept-Encoding', '')
+    age = snapshot.manager.age()
+
+    def generate():
+        # read from the snapshot so long exports do not contend with scoring writes
+        with snapshot.manager.reader():
+            chunks = export.iter_text(fmt, since_id=since_id, until_epoch=until_epoch)
+            if not gzip_out:
+                for text in chunks:
+                    yield text
+                return
+            z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+            for text in chunks:
+                # sync-flush each chunk so the client receives data as it is read
+                yield z.compress(text.encode('utf-8')) + z.flush(zlib.Z_SYNC_FLUSH)
+            yield z.flush()
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    resp = Response(stream_with_context(generate()), mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename=transactions.{fmt}'
+    if age is not None:
+        resp.headers['X-Snapshot-Age'] = str(_age(age))
+    if gzip_out:
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
 
 
 @app.route('/api/ingest', methods=['POST'])
 def api_ingest():
-    """Ingest transaction via API (JSON) for real-time processing"""
+    """Ingest transaction via API (JSON) for real-time processing.
+
+    Accepts one transaction object, or a list of them (or {"transactions": [...]})
+    which is scored as one batch.
+    """
     try:
-        payload = request.get_json() or request.form
-        amount = float(payload.get('amount', 0))
-        hour = int(payload.get('hour', 0))
-        day = int(payload.get('day', 1))
-        month = int(payload.get('month', 1))
-        year = int(payload.get('year', 2024))
-        upi_number = payload.get('upi_number', 'N/A')
-        merchant = payload.get('merchant', 'Unknown Merchant')
-        category = payload.get('category', 'Transfer')
-        location = payload.get('location', 'Unknown')
+        payload = request.get_json(silent=True)
+        if payload is None:
+            payload = request.form.to_dict()
+        batch = payload if isinstance(payload, list) else payload.get('transactions')
+        # parse up front so malformed payloads fail here rather than in the worker
+        for p in (batch if batch is not None else [payload]):
+            scoring.parse(p)
         # If Celery is configured, enqueue background task for processing
         try:
-            from tasks import process_transaction_task
-            task = process_transaction_task.delay({
-                'upi_number': upi_number,
-                'amount': amount,
-                'hour': hour,
-                'day': day,
-                'month': month,
-                'year': year,
-                'merchant': merchant,
-                'category': category,
-                'location': location,
-            })
+            if batch is not None:
+                from tasks import score_batch_task
+                task = score_batch_task.delay(batch)
+            else:
+                from tasks import process_transaction_task
+                task = process_transaction_task.delay(payload)
             return jsonify({'success': True, 'deferred': True, 'task_id': task.id})
         except Exception:
             # fallback to synchronous processing
-            tx, predictions = process_transaction(upi_number, amount, hour, day, month, year, merchant, category, location)
+            results = score_batch(batch if batch is not None else [payload])
+            if batch is not None:
+                return jsonify({'success': True, 'results': [{'transaction': tx, 'predictions': predictions} for tx, predictions in results]})
+            tx, predictions = results[0]
             return jsonify({'success': True, 'transaction': tx, 'predictions': predictions})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -781,7 +724,7 @@ def api_heartbeat():
         upi = payload.get('upi_number')
         if not upi:
             return jsonify({'success': False, 'error': 'missing upi_number'}), 400
-        profile = database.set_user_last_seen(upi)
+        profile = storage.backend.set_user_last_seen(upi)
         return jsonify({'success': True, 'profile': profile})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -790,9 +733,16 @@ def api_heartbeat():
 @app.route('/api/user/<path:upi>', methods=['GET'])
 def api_get_user(upi):
     try:
-        profile = database.get_user_profile(upi)
-        if not profile:
+        profile = storage.backend.get_user_profile(upi)
+        aggregates = storage.backend.get_profile_aggregates(upi)
+        if not profile and not aggregates:
             return jsonify({'success': False, 'error': 'not found'}), 404
+        profile = dict(profile or {})
+        profile['aggregates'] = aggregates
+        try:
+            profile['distinct_devices_estimate'] = sketches.registry.distinct_devices(upi) if _on_sqlite() else None
+        except Exception:
+            profile['distinct_devices_estimate'] = None
         return jsonify({'success': True, 'profile': profile})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -804,7 +754,7 @@ def api_reputation(vpa_hash):
     try:
         # Try database lookup if available
         try:
-            rep = database.get_vpa_reputation(vpa_hash)
+            rep = storage.backend.get_vpa_reputation(vpa_hash)
         except Exception:
             rep = None
 
@@ -857,8 +807,8 @@ def api_block():
         payload = request.get_json() or request.form
         tx_id = int(payload.get('id'))
         blocked_by = payload.get('blocked_by', 'operator')
-        ok = database.mark_transaction_blocked(tx_id, blocked_by=blocked_by)
-        tx = database.get_transaction_by_id(tx_id) if ok else None
+        ok = storage.backend.mark_transaction_blocked(tx_id, blocked_by=blocked_by)
+        tx = storage.backend.get_transaction_by_id(tx_id) if ok else None
         if tx:
             # reflect in-memory cache
             for i, t in enumerate(transaction_history):
@@ -873,21 +823,28 @@ def api_block():
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """API endpoint to get fraud detection statistics"""
-    # prefer authoritative DB values
+    # running totals maintained on every insert/block: O(1) instead of a table scan
+    counters = None
+    age = None
     try:
-        all_tx = database.get_all_transactions()
-    except Exception:
-        all_tx = transaction_history
-
-    total_transactions = len(all_tx)
-    fraud_count = sum(1 for t in all_tx if t['status'] == 'Fraud')
+        with snapshot.manager.reader() as age:
+            counters = storage.backend.get_stats_counters()
+    except Exception as e:
+        print(f"Error reading stats counters: {e}")
+    if counters is not None:
+        total_transactions = counters['tx_count']
+        fraud_count = counters['fraud_count']
+        total_at_risk = counters['fraud_amount']
+        risk_sum = counters['risk_sum']
+    else:
+        total_transactions = len(transaction_history)
+        fraud_count = sum(1 for t in transaction_history if t['status'] == 'Fraud')
+        total_at_risk = sum(t['amount'] or 0 for t in transaction_history if t['status'] == 'Fraud')
+        risk_sum = sum(t['risk_score'] or 0 for t in transaction_history)
     fraud_rate = (fraud_count / total_transactions * 100) if total_transactions > 0 else 0
 
-    # Calculate total amount at risk
-    total_at_risk = sum(t['amount'] for t in all_tx if t['status'] == 'Fraud')
-
     # Calculate average risk score
-    avg_risk = sum(t['risk_score'] for t in all_tx) / len(all_tx) if all_tx else 0
+    avg_risk = risk_sum / total_transactions if total_transactions else 0
     
     return jsonify({
         'total_transactions': total_transactions,
@@ -897,54 +854,127 @@ def get_stats():
         'total_amount_at_risk': round(total_at_risk, 2),
         'average_risk_score': round(avg_risk, 2),
         'money_saved': round(total_at_risk, 2),  # Amount that would have been lost
-        'prevention_efficiency': round((fraud_count / total_transactions * 100) if total_transactions > 0 else 0, 2)
+        'prevention_efficiency': round((fraud_count / total_transactions * 100) if total_transactions > 0 else 0, 2),
+        'snapshot_age_seconds': _age(age)
     })
 
+# default look-back per bucket size when `from` is not given
+TIMESERIES_DEFAULT_SPAN = {'1m': 24 * 3600, '1h': 7 * 24 * 3600, '1d': 365 * 24 * 3600}
+
+
+@app.route('/api/stats/timeseries', methods=['GET'])
+def get_stats_timeseries():
+    """Per-bucket transaction counts, fraud counts, amount at risk and mean risk.
+
+    `bucket=1m|1h|1d` (default 1h); `from` / `to` as in the banking report
+    (default: a look-back window ending now). Served from pre-aggregated
+    buckets; buckets without transactions are omitted.
+    """
+    bucket = request.args.get('bucket', '1h')
+    if bucket not in TIMESERIES_DEFAULT_SPAN:
+        return jsonify({'success': False, 'error': 'bucket must be 1m, 1h or 1d'}), 400
+    try:
+        to_epoch = _parse_report_time(request.args.get('to'))
+        from_epoch = _parse_report_time(request.args.get('from'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if to_epoch is None:
+        to_epoch = int(datetime.now().timestamp())
+    if from_epoch is None:
+        from_epoch = to_epoch - TIMESERIES_DEFAULT_SPAN[bucket]
+    try:
+        with snapshot.manager.reader() as age:
+            points = storage.backend.get_stats_timeseries(bucket, from_epoch, to_epoch)
+    except Exception as e:
+        print(f"Error reading stats timeseries: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    for p in points:
+        p['start'] = datetime.fromtimestamp(p['bucket']).strftime('%Y-%m-%d %H:%M:%S')
+        p['amount_at_risk'] = round(p['amount_at_risk'], 2)
+        p['mean_risk'] = round(p['mean_risk'], 2)
+    return jsonify({'success': True, 'bucket': bucket, 'from': from_epoch, 'to': to_epoch, 'points': points,
+                    'snapshot_age_seconds': _age(age)})
+
+
 @app.route('/api/banking-report', methods=['GET'])
 def get_banking_report():
-    """Generate a banking compliance report"""
-    try:
-        all_tx = database.get_all_transactions()
-    except Exception:
-        all_tx = transaction_history
+    """Generate a banking compliance report.
 
-    total_transactions = len(all_tx)
-    fraud_count = sum(1 for t in all_tx if t['status'] == 'Fraud')
+    Optional `from` / `to` query parameters (local `YYYY-MM-DD[ HH:MM:SS]` or
+    epoch seconds) limit the report to [from, to) at hour granularity.
+    """
+    try:
+        from_epoch = _parse_report_time(request.args.get('from'))
+        to_epoch = _parse_report_time(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
-    # Group by fraud indicators
-    indicator_stats = {}
-    for t in all_tx:
-        for indicator in t.get('indicators', []):
-            name = indicator.get('name') if isinstance(indicator, dict) else str(indicator)
-            if name not in indicator_stats:
-                indicator_stats[name] = 0
-            indicator_stats[name] += 1
+    # aggregate the hourly rollups (a few rows per hour) rather than every transaction
+    try:
+        with snapshot.manager.reader() as age:
+            rollup = storage.backend.get_banking_rollup(from_epoch, to_epoch)
+            approximate = _approximate_report()
+    except Exception as e:
+        print(f"Error reading banking rollups: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-    # Group by merchant
     merchant_risk = {}
-    for t in all_tx:
-        merchant = t.get('merchant', 'Unknown')
-        if merchant not in merchant_risk:
-            merchant_risk[merchant] = {'count': 0, 'fraud_count': 0, 'total_amount': 0}
-        merchant_risk[merchant]['count'] += 1
-        merchant_risk[merchant]['total_amount'] += t.get('amount', 0)
-        if t['status'] == 'Fraud':
-            merchant_risk[merchant]['fraud_count'] += 1
-    
+    total_transactions = 0
+    fraud_count = 0
+    total_at_risk = 0
+    for merchant, m in rollup['merchants'].items():
+        total_transactions += m['count']
+        fraud_count += m['fraud_count']
+        total_at_risk += m['fraud_amount']
+        merchant_risk[merchant] = {'count': m['count'], 'fraud_count': m['fraud_count'], 'total_amount': m['total_amount']}
+    indicator_stats = rollup['indicators']
+
     return jsonify({
         'report_type': 'Banking Compliance Report',
+        'from': request.args.get('from'),
+        'to': request.args.get('to'),
         'total_transactions_analyzed': total_transactions,
         'fraud_detected': fraud_count,
         'fraud_rate_percent': round((fraud_count / total_transactions * 100) if total_transactions > 0 else 0, 2),
-        'total_amount_at_risk': round(sum(t.get('amount', 0) for t in all_tx if t['status'] == 'Fraud'), 2),
+        'total_amount_at_risk': round(total_at_risk, 2),
         'indicator_statistics': indicator_stats,
         'merchant_risk_analysis': merchant_risk,
         'top_fraud_indicators': sorted(indicator_stats.items(), key=lambda x: x[1], reverse=True)[:5],
         'system_uptime': 'Active',
-        'last_fraud_detected': all_tx[-1]['timestamp'] if all_tx and any(t['status'] == 'Fraud' for t in all_tx) else 'None',
-        'compliance_status': 'COMPLIANT' if fraud_count > 0 else 'MONITORING'
+        'last_fraud_detected': rollup['last_fraud_timestamp'] or 'None',
+        'compliance_status': 'COMPLIANT' if fraud_count > 0 else 'MONITORING',
+        'approximate': approximate,
+        'snapshot_age_seconds': _age(age)
     })
 
+
+def _approximate_report():
+    """All-time sketch estimates (HyperLogLog distinct counts, Space-Saving top-k)."""
+    if not _on_sqlite():
+        return None
+    try:
+        return {
+            'scope': 'all_time',
+            'distinct_upis_per_merchant': sketches.registry.distinct_upis_by_merchant(),
+            'top_fraud_merchants': sketches.registry.top_fraud_merchants(5),
+            'top_fraud_locations': sketches.registry.top_fraud_locations(5),
+        }
+    except Exception as e:
+        print(f"Error reading sketches: {e}")
+        return None
+
+
+def _parse_report_time(value):
+    """Parse a report range bound: epoch seconds or a local date/datetime string."""
+    if value is None or value == '':
+        return None
+    if value.isdigit():
+        return int(value)
+    epoch = database.timestamp_to_epoch(value)
+    if epoch is None:
+        raise ValueError(f'invalid time: {value!r}')
+    return epoch
+
 if __name__ == '__main__':
     print("✓ Starting UPI Fraud Detection App...")
     # run single-process for faster startup and avoid extra reloader on Windows
@@ -0,0 +1,217 @@
+"""Time-partitioned archival of old transactions.
+
+Rows older than `ARCHIVE_RETENTION_DAYS` are moved out of the hot database
+into one SQLite file per month (`<ARCHIVE_DIR>/transactions_2025_01.db`),
+keeping their ids. Their indicator rows go along (by name, since the interned
+ids live in the hot DB). The scoring path only ever touches the small hot table;
+`query_transactions` attaches the relevant monthly files read-only and fans a
+time-range query out across them and the hot DB.
+
+Aggregates derived at insert time (stats counters, rollups, profile
+aggregates) are lifetime totals and are not reduced when rows are archived.
+Keep the retention longer than the velocity horizon (7 days by default).
+"""
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List
+from urllib.parse import quote
+
+import database
+
+RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', '90'))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')  # default: archive_partitions/ next to the hot DB
+# SQLite allows 10 attached databases by default; leave room for callers
+MAX_ATTACHED = 8
+
+_PARTITION_RE = re.compile(r'^transactions_(\d{4})_(\d{2})\.db$')
+
+
+def archive_dir() -> str:
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), 'archive_partitions')
+
+
+def partition_path(month: str, directory: str = None) -> str:
+    """Archive file for `month` ('YYYY-MM')."""
+    return os.path.join(directory or archive_dir(), f"transactions_{month.replace('-', '_')}.db")
+
+
+def list_partitions(directory: str = None) -> List[str]:
+    """Months ('YYYY-MM') that have an archive file, oldest first."""
+    directory = directory or archive_dir()
+    if not os.path.isdir(directory):
+        return []
+    months = []
+    for name in os.listdir(directory):
+        m = _PARTITION_RE.match(name)
+        if m:
+            months.append(f'{m.group(1)}-{m.group(2)}')
+    return sorted(months)
+
+
+def _create_archive_table(cur, alias: str):
+    cur.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'transactions'")
+    ddl = cur.fetchone()[0]
+    # same columns as the hot table (including migrated ones); ids are copied, not generated
+    ddl = re.sub(r'^CREATE TABLE\s+("?transactions"?)', f'CREATE TABLE IF NOT EXISTS {alias}.transactions', ddl, count=1)
+    ddl = ddl.replace('AUTOINCREMENT', '')
+    cur.execute(ddl)
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_archive_ts ON transactions(ts_epoch)')
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_archive_upi_ts ON transactions(upi, ts_epoch)')
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_archive_upi_token_ts ON transactions(upi_token, ts_epoch)')
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {alias}.transaction_indicators (
+            tx_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            risk REAL
+        )
+    ''')
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_archive_indicators_tx ON transaction_indicators(tx_id)')
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_archive_indicators_name ON transaction_indicators(name, tx_id)')
+
+
+def archive_old_transactions(older_than_days: int = None, directory: str = None, batch: int = 5000) -> Dict[str, int]:
+    """Move transactions older than `older_than_days` into monthly archive files.
+
+    Returns {month: rows moved}. Each batch is copied, then deleted from the
+    hot DB. The copy is `INSERT OR IGNORE` on the preserved ids, so a run
+    interrupted between the two steps is finished by the next one without
+    duplicating anything; until then `query_transactions` returns such rows
+    once.
+    """
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+    if days <= 0:
+        raise ValueError('older_than_days must be positive')
+    cutoff = int(time.time()) - days * 86400
+    directory = directory or archive_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    conn = database.get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT DISTINCT substr(timestamp, 1, 7) FROM transactions WHERE ts_epoch < ?', (cutoff,))
+    months = sorted(r[0] for r in cur.fetchall() if r[0])
+    moved = {}
+    for month in months:
+        if conn.in_transaction:
+            conn.commit()  # ATTACH is not allowed inside a transaction
+        cur.execute('ATTACH DATABASE ? AS arc', (partition_path(month, directory),))
+        try:
+            _create_archive_table(cur, 'arc')
+            conn.commit()
+            moved[month] = 0
+            where = 'ts_epoch < ? AND substr(timestamp, 1, 7) = ?'
+            while True:
+                cur.execute(f'SELECT MAX(id), COUNT(*) FROM (SELECT id FROM transactions WHERE {where} ORDER BY id LIMIT ?)',
+                            (cutoff, month, batch))
+                max_id, n = cur.fetchone()
+                if not n:
+                    break
+                params = (cutoff, month, max_id)
+                # commits across attached WAL databases are not atomic together, so copy
+                # and delete in separate transactions: a crash in between leaves the rows in
+                # both files (the next run skips the copy and deletes them), never a lost row
+                batch_ids = f'SELECT id FROM main.transactions WHERE {where} AND id <= ?'
+                with database.transaction() as tx:
+                    tx.execute(f'INSERT OR IGNORE INTO arc.transactions SELECT * FROM main.transactions WHERE {where} AND id <= ?', params)
+                    # replaced rather than appended, so a re-run after a crash does not double them
+                    tx.execute(f'DELETE FROM arc.transaction_indicators WHERE tx_id IN ({batch_ids})', params)
+                    tx.execute(f'INSERT INTO arc.transaction_indicators (tx_id, name, risk) '
+                               f'SELECT ti.tx_id, n.name, ti.risk FROM main.transaction_indicators ti '
+                               f'JOIN main.indicator_names n ON n.id = ti.name_id WHERE ti.tx_id IN ({batch_ids})', params)
+                with database.transaction() as tx:
+                    tx.execute(f'DELETE FROM main.transaction_indicators WHERE tx_id IN ({batch_ids})', params)
+                    tx.execute(f'DELETE FROM main.transactions WHERE {where} AND id <= ?', params)
+                moved[month] += n
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            cur.execute('DETACH DATABASE arc')
+    return moved
+
+
+def _months_in_range(months: List[str], from_epoch: int = None, to_epoch: int = None) -> List[str]:
+    lo = datetime.fromtimestamp(from_epoch).strftime('%Y-%m') if from_epoch is not None else None
+    hi = datetime.fromtimestamp(to_epoch).strftime('%Y-%m') if to_epoch is not None else None
+    return [m for m in months if (lo is None or m >= lo) and (hi is None or m <= hi)]
+
+
+@contextmanager
+def attached(months: List[str], directory: str = None):
+    """Attach the archive files for `months` read-only; yields their schema aliases."""
+    conn = database.get_conn()
+    cur = conn.cursor()
+    aliases = []
+    try:
+        for month in months:
+            alias = 'arc_' + month.replace('-', '_')
+            uri = 'file:' + quote(os.path.abspath(partition_path(month, directory))) + '?mode=ro'
+            cur.execute('ATTACH DATABASE ? AS ' + alias, (uri,))
+            aliases.append(alias)
+        yield aliases
+    finally:
+        for alias in aliases:
+            cur.execute('DETACH DATABASE ' + alias)
+
+
+def _has_table(cur, schema: str, table: str) -> bool:
+    cur.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cur.fetchone() is not None
+
+
+def query_transactions(from_epoch: int = None, to_epoch: int = None, upi: str = None, limit: int = 1000,
+                       directory: str = None, indicator: str = None) -> List[Dict[str, Any]]:
+    """Transactions in [from_epoch, to_epoch] from the hot DB and archives, ordered by (ts_epoch, id).
+
+    Only monthly archives overlapping the range are attached. At most `limit`
+    rows are returned (the earliest ones in the range). `indicator` keeps rows
+    flagged with that indicator name; partitions written before indicators
+    were archived have none to match.
+    """
+    where, params = [], []
+    if from_epoch is not None:
+        where.append('ts_epoch >= ?')
+        params.append(int(from_epoch))
+    if to_epoch is not None:
+        where.append('ts_epoch <= ?')
+        params.append(int(to_epoch))
+    if upi is not None:
+        # rows written in tokenized mode carry `upi_token`; match either, like the hot-path lookups
+        where.append('(upi = ? OR upi_token = ?)')
+        params.extend((upi, database.tokenize_upi(upi)))
+
+    def select(schema):
+        conds = list(where)
+        if indicator is not None:
+            if schema == 'main':
+                conds.append('id IN (SELECT ti.tx_id FROM main.transaction_indicators ti '
+                             'JOIN main.indicator_names n ON n.id = ti.name_id WHERE n.name = ?)')
+            else:
+                conds.append(f'id IN (SELECT tx_id FROM {schema}.transaction_indicators WHERE name = ?)')
+        clause = (' WHERE ' + ' AND '.join(conds)) if conds else ''
+        return f'SELECT * FROM (SELECT * FROM {schema}.transactions{clause} ORDER BY ts_epoch, id LIMIT ?)'
+
+    if indicator is not None:
+        params.append(indicator)
+
+    conn = database.get_conn()
+    if conn.in_transaction:
+        conn.commit()
+    cur = conn.cursor()
+    cur.execute(select('main'), (*params, limit))
+    rows = [database.TransactionRow(r) for r in cur.fetchall()]
+    months = _months_in_range(list_partitions(directory), from_epoch, to_epoch)
+    for i in range(0, len(months), MAX_ATTACHED):
+        with attached(months[i:i + MAX_ATTACHED], directory) as aliases:
+            if indicator is not None:
+                aliases = [a for a in aliases if _has_table(cur, a, 'transaction_indicators')]
+                if not aliases:
+                    continue
+            sql = ' UNION ALL '.join(select(a) for a in aliases)
+            cur.execute(sql, [p for _ in aliases for p in (*params, limit)])
+            rows.extend(database.TransactionRow(r) for r in cur.fetchall())
+    # a row can be in both files if an archive run was interrupted; ids are preserved, so keep one
+    rows = list({r['id']: r for r in reversed(rows)}.values())
+    rows.sort(key=lambda r: (r['ts_epoch'] is None, r['ts_epoch'] or 0, r['id']))
+    return rows[:limit]
@@ -1,17 +1,151 @@
 import sqlite3
 import json
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator
+
+try:
+    import security
+except Exception:
+    security = None
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'upi.db')
 
+# Connection tuning (override via env for benchmarks / constrained hosts)
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+CACHE_SIZE_KIB = int(os.environ.get('DB_CACHE_SIZE_KIB', '16384'))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', str(128 * 1024 * 1024)))
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+
+# Each thread holds at most one connection per DB path. Threads that finish a
+# request hand it back via `release_conn()` so short-lived request threads
+# reuse connections instead of reconnecting.
+_local = threading.local()
+_idle = {}  # db path -> list of idle connections
+_idle_lock = threading.Lock()
+
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+def _connect(path: str) -> sqlite3.Connection:
+    # uri=True so read-only archive partitions can be attached as file:...?mode=ro
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False, uri=True)
     conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    try:
+        # WAL lets readers proceed while a writer commits; it is persistent per file
+        cur.execute('PRAGMA journal_mode = WAL')
+    except sqlite3.DatabaseError:
+        pass
+    cur.execute('PRAGMA synchronous = NORMAL')
+    cur.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    cur.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    cur.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    """Return this thread's pooled connection to `DB_PATH`, opening one if needed.
+
+    Inside `use_db(path)` the connection is to `path` instead. Callers must not
+    close the returned connection; use `release_conn()` at the end of a request
+    instead.
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    path = getattr(_local, 'path_override', None) or DB_PATH
+    conn = conns.get(path)
+    if conn is None:
+        with _idle_lock:
+            idle = _idle.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = _connect(path)
+        conns[path] = conn
     return conn
 
 
+@contextmanager
+def use_db(path: str = None):
+    """Route this thread's `get_conn()` (and so every helper here) to `path`, e.g. a read snapshot.
+
+    `path=None` keeps the primary database.
+    """
+    previous = getattr(_local, 'path_override', None)
+    _local.path_override = path
+    try:
+        yield
+    finally:
+        _local.path_override = previous
+
+
+def release_conn():
+    """Return the current thread's connections to the idle pool (end of request)."""
+    conns = getattr(_local, 'conns', None)
+    if not conns:
+        return
+    for path, conn in list(conns.items()):
+        if conn.in_transaction:
+            conn.rollback()
+        with _idle_lock:
+            idle = _idle.setdefault(path, [])
+            if len(idle) < POOL_SIZE:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+    conns.clear()
+
+
+def close_all_connections():
+    """Close the current thread's and all idle pooled connections."""
+    conns = getattr(_local, 'conns', None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+    with _idle_lock:
+        for idle in _idle.values():
+            for conn in idle:
+                conn.close()
+        _idle.clear()
+
+
+# In-process listeners for write events, e.g. the velocity engine:
+#   'transaction_saved'    -> fn(tx, tx_id) after the row is committed (tx_id is None for bulk inserts)
+#   'transactions_cleared' -> fn() after clear_transactions()
+_listeners = {'transaction_saved': [], 'transactions_cleared': []}
+
+
+def add_listener(event: str, fn):
+    if fn not in _listeners[event]:
+        _listeners[event].append(fn)
+
+
+def emit(event: str, *args):
+    """Call the listeners for `event`; a failing listener is logged, not raised."""
+    for fn in list(_listeners[event]):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f'database: {event} listener failed: {e}')
+
+
+@contextmanager
+def transaction():
+    """Yield a cursor on the pooled connection; commit on success, roll back on error."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
 def init_db(db_path: str = None):
     global DB_PATH
     if db_path:
@@ -47,6 +181,18 @@ def init_db(db_path: str = None):
         cur.execute("ALTER TABLE transactions ADD COLUMN features TEXT")
     if 'upi_token' not in cols:
         cur.execute("ALTER TABLE transactions ADD COLUMN upi_token TEXT")
+    if 'ts_epoch' not in cols:
+        # integer epoch seconds so velocity windows are index range scans;
+        # 'utc' converts the stored local-time strings the same way timestamp_to_epoch() does
+        cur.execute("ALTER TABLE transactions ADD COLUMN ts_epoch INTEGER")
+        cur.execute("UPDATE transactions SET ts_epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) WHERE timestamp IS NOT NULL")
+    if 'device_id' not in cols:
+        # kept in the clear (like location) so velocity snapshots need not decrypt `features`
+        cur.execute("ALTER TABLE transactions ADD COLUMN device_id TEXT")
+        _backfill_device_ids(cur)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_upi_token_ts ON transactions(upi_token, ts_epoch)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_upi_ts ON transactions(upi, ts_epoch)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_ts ON transactions(ts_epoch)")
 
     # audit log table for admin actions
     cur.execute('''
@@ -73,6 +219,132 @@ def init_db(db_path: str = None):
             profile_json TEXT
         )
     ''')
+    # fixed-size per-UPI behaviour aggregates, maintained incrementally on insert
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'profile_aggregates'")
+    backfill_profiles = cur.fetchone() is None
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS profile_aggregates (
+            upi TEXT PRIMARY KEY,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            fraud_count INTEGER NOT NULL DEFAULT 0,
+            amount_sum REAL NOT NULL DEFAULT 0,
+            amount_sq_sum REAL NOT NULL DEFAULT 0,
+            amount_min REAL,
+            amount_max REAL,
+            first_epoch INTEGER,
+            last_epoch INTEGER,
+            last_timestamp TEXT,
+            last_device_id TEXT,
+            last_location TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS profile_merchants (
+            upi TEXT NOT NULL,
+            merchant TEXT NOT NULL,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            last_epoch INTEGER,
+            PRIMARY KEY (upi, merchant)
+        ) WITHOUT ROWID
+    ''')
+    if backfill_profiles:
+        _backfill_profile_aggregates(cur)
+    # single-row running totals behind /api/stats
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            fraud_count INTEGER NOT NULL DEFAULT 0,
+            fraud_amount REAL NOT NULL DEFAULT 0,
+            risk_sum REAL NOT NULL DEFAULT 0,
+            blocked_count INTEGER NOT NULL DEFAULT 0,
+            last_fraud_epoch INTEGER,
+            last_fraud_timestamp TEXT
+        )
+    ''')
+    cur.execute('SELECT 1 FROM stats_counters WHERE id = 1')
+    if cur.fetchone() is None:
+        _rebuild_stats_counters(cur)
+    # hourly rollups behind /api/banking-report; bucket = ts_epoch rounded down to the local hour
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_merchant_hourly'")
+    backfill_rollups = cur.fetchone() is None
+    if not backfill_rollups:
+        # rollups written before buckets followed local hours are off by the zone's half hour (IST); rebuild them
+        cur.execute('SELECT bucket FROM rollup_merchant_hourly WHERE bucket != 0 LIMIT 1')
+        row = cur.fetchone()
+        if row is not None and row[0] != rollup_bucket(row[0]):
+            cur.execute('DELETE FROM rollup_merchant_hourly')
+            cur.execute('DELETE FROM rollup_indicator_hourly')
+            backfill_rollups = True
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_merchant_hourly (
+            bucket INTEGER NOT NULL,
+            merchant TEXT NOT NULL,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            fraud_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0,
+            fraud_amount REAL NOT NULL DEFAULT 0,
+            last_fraud_epoch INTEGER,
+            last_fraud_timestamp TEXT,
+            PRIMARY KEY (bucket, merchant)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_indicator_hourly (
+            bucket INTEGER NOT NULL,
+            indicator TEXT NOT NULL,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, indicator)
+        ) WITHOUT ROWID
+    ''')
+    if backfill_rollups:
+        _backfill_rollups(cur)
+    # indicators as rows (interned names) so grouping/filtering by indicator is indexed SQL
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transaction_indicators'")
+    backfill_indicators = cur.fetchone() is None
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS indicator_names (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_indicators (
+            tx_id INTEGER NOT NULL,
+            name_id INTEGER NOT NULL,
+            risk REAL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transaction_indicators_tx ON transaction_indicators(tx_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transaction_indicators_name ON transaction_indicators(name_id, tx_id)")
+    if backfill_indicators:
+        _backfill_transaction_indicators(cur)
+    # per-minute/hour/day totals behind /api/stats/timeseries
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_buckets'")
+    backfill_buckets = cur.fetchone() is None
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stats_buckets (
+            resolution TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            fraud_count INTEGER NOT NULL DEFAULT 0,
+            fraud_amount REAL NOT NULL DEFAULT 0,
+            risk_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    if backfill_buckets:
+        _rebuild_stats_buckets(cur)
+    # serialized approximate sketches (see sketches.py), one row per sketch
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS sketches (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    ''')
     
     # Users table for authentication
     cur.execute('''
@@ -98,137 +370,690 @@ def init_db(db_path: str = None):
     except Exception:
         pass
     conn.commit()
-    conn.close()
 
 
-def save_transaction(tx: Dict[str, Any]) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    indicators_json = json.dumps(tx.get('indicators', []))
-    features_json = json.dumps(tx.get('features', {})) if tx.get('features') is not None else None
-    # tokenized upi for privacy-preserving storage and reputation lookups
-    upi_token = None
+_TX_INSERT_SQL = '''INSERT INTO transactions (timestamp, ts_epoch, upi, upi_token, amount, merchant, category, location, device_id, risk_score, status, indicators, blocked, blocked_by, blocked_timestamp, explanation, features)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+# one UPSERT per insert keeps profile_aggregates / profile_merchants current
+_PROFILE_UPSERT_SQL = '''INSERT INTO profile_aggregates (upi, tx_count, fraud_count, amount_sum, amount_sq_sum, amount_min, amount_max,
+        first_epoch, last_epoch, last_timestamp, last_device_id, last_location)
+    VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(upi) DO UPDATE SET
+        tx_count = tx_count + 1,
+        fraud_count = fraud_count + excluded.fraud_count,
+        amount_sum = amount_sum + excluded.amount_sum,
+        amount_sq_sum = amount_sq_sum + excluded.amount_sq_sum,
+        amount_min = min(coalesce(amount_min, excluded.amount_min), excluded.amount_min),
+        amount_max = max(coalesce(amount_max, excluded.amount_max), excluded.amount_max),
+        first_epoch = min(coalesce(first_epoch, excluded.first_epoch), excluded.first_epoch),
+        last_timestamp = CASE WHEN last_epoch IS NULL OR excluded.last_epoch >= last_epoch THEN excluded.last_timestamp ELSE last_timestamp END,
+        last_device_id = CASE WHEN last_epoch IS NULL OR excluded.last_epoch >= last_epoch THEN excluded.last_device_id ELSE last_device_id END,
+        last_location = CASE WHEN last_epoch IS NULL OR excluded.last_epoch >= last_epoch THEN excluded.last_location ELSE last_location END,
+        last_epoch = max(coalesce(last_epoch, excluded.last_epoch), excluded.last_epoch)'''
+
+_MERCHANT_UPSERT_SQL = '''INSERT INTO profile_merchants (upi, merchant, tx_count, last_epoch) VALUES (?, ?, 1, ?)
+    ON CONFLICT(upi, merchant) DO UPDATE SET
+        tx_count = tx_count + 1,
+        last_epoch = max(coalesce(last_epoch, excluded.last_epoch), excluded.last_epoch)'''
+
+
+def _profile_params(row: tuple):
+    """UPSERT parameters for the aggregates touched by one `_TX_INSERT_SQL` row (None if it has no upi)."""
+    ts, epoch, upi, amount, merchant, location, device_id, status = row[0], row[1], row[2], row[4], row[5], row[7], row[8], row[10]
+    if not upi:
+        return None
+    amount = float(amount or 0)
+    return ((upi, 1 if status == 'Fraud' else 0, amount, amount * amount, amount, amount, epoch, epoch, ts, device_id, location),
+            (upi, merchant or '', epoch))
+
+
+def _update_profiles(cur, rows: List[tuple]):
+    params = [p for p in map(_profile_params, rows) if p is not None]
+    if params:
+        cur.executemany(_PROFILE_UPSERT_SQL, [p[0] for p in params])
+        cur.executemany(_MERCHANT_UPSERT_SQL, [p[1] for p in params])
+
+
+_STATS_ADD_SQL = '''UPDATE stats_counters SET
+        tx_count = tx_count + ?,
+        fraud_count = fraud_count + ?,
+        fraud_amount = fraud_amount + ?,
+        risk_sum = risk_sum + ?,
+        blocked_count = blocked_count + ?,
+        last_fraud_timestamp = CASE WHEN ? IS NOT NULL AND (last_fraud_epoch IS NULL OR ? >= last_fraud_epoch) THEN ? ELSE last_fraud_timestamp END,
+        last_fraud_epoch = CASE WHEN ? IS NOT NULL AND (last_fraud_epoch IS NULL OR ? >= last_fraud_epoch) THEN ? ELSE last_fraud_epoch END
+    WHERE id = 1'''
+
+
+def _update_stats(cur, rows: List[tuple]):
+    """Add a batch of `_TX_INSERT_SQL` rows to stats_counters."""
+    fraud = fraud_amount = risk = blocked = 0
+    last_epoch = last_ts = None
+    for row in rows:
+        risk += row[9] or 0
+        blocked += 1 if row[12] else 0
+        if row[10] == 'Fraud':
+            fraud += 1
+            fraud_amount += row[4] or 0
+            if row[1] is not None and (last_epoch is None or row[1] >= last_epoch):
+                last_epoch, last_ts = row[1], row[0]
+    cur.execute(_STATS_ADD_SQL, (len(rows), fraud, fraud_amount, risk, blocked,
+                                 last_epoch, last_epoch, last_ts, last_epoch, last_epoch, last_epoch))
+
+
+ROLLUP_BUCKET_SECONDS = 3600
+
+_MERCHANT_ROLLUP_SQL = '''INSERT INTO rollup_merchant_hourly (bucket, merchant, tx_count, fraud_count, total_amount, fraud_amount, last_fraud_epoch, last_fraud_timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket, merchant) DO UPDATE SET
+        tx_count = tx_count + excluded.tx_count,
+        fraud_count = fraud_count + excluded.fraud_count,
+        total_amount = total_amount + excluded.total_amount,
+        fraud_amount = fraud_amount + excluded.fraud_amount,
+        last_fraud_timestamp = CASE WHEN excluded.last_fraud_epoch IS NOT NULL AND (last_fraud_epoch IS NULL OR excluded.last_fraud_epoch >= last_fraud_epoch)
+                                    THEN excluded.last_fraud_timestamp ELSE last_fraud_timestamp END,
+        last_fraud_epoch = max(coalesce(last_fraud_epoch, excluded.last_fraud_epoch), coalesce(excluded.last_fraud_epoch, last_fraud_epoch))'''
+
+_INDICATOR_ROLLUP_SQL = '''INSERT INTO rollup_indicator_hourly (bucket, indicator, tx_count) VALUES (?, ?, ?)
+    ON CONFLICT(bucket, indicator) DO UPDATE SET tx_count = tx_count + excluded.tx_count'''
+
+
+def rollup_bucket(epoch) -> int:
+    """Start of the local hour holding `epoch` (0 if None), the banking-report rollup key."""
+    # local hours, like the stats buckets, so report ranges parsed as local time line up;
+    # rows without a parseable timestamp land in bucket 0 so totals still add up
+    return local_bucket(int(epoch), ROLLUP_BUCKET_SECONDS) if epoch is not None else 0
+
+
+def indicator_name(indicator) -> str:
+    """Name of a stored indicator (a dict with `name`, or a plain string)."""
+    if isinstance(indicator, dict):
+        return str(indicator.get('name') or 'Unknown')
+    return str(indicator)
+
+
+def _insert_indicators(cur, items: List[tuple]):
+    """Write (tx_id, indicator) pairs to transaction_indicators, interning names in indicator_names."""
+    if not items:
+        return
+    rows = [(tx_id, indicator_name(ind), ind.get('risk') if isinstance(ind, dict) else None) for tx_id, ind in items]
+    cur.executemany('INSERT OR IGNORE INTO indicator_names (name) VALUES (?)', {(r[1],) for r in rows})
+    cur.executemany('INSERT INTO transaction_indicators (tx_id, name_id, risk) '
+                    'VALUES (?, (SELECT id FROM indicator_names WHERE name = ?), ?)', rows)
+
+
+def _backfill_device_ids(cur):
+    """Copy `features.device_id` into the `device_id` column (first run after upgrade)."""
+    read = cur.connection.cursor()
+    read.execute('SELECT id, features FROM transactions WHERE features IS NOT NULL ORDER BY id')
+    while True:
+        batch = read.fetchmany(5000)
+        if not batch:
+            break
+        raw = [r[1] for r in batch]
+        plain = security.decrypt_many(raw) if security is not None else raw
+        updates = []
+        for r, p in zip(batch, plain):
+            try:
+                device_id = (json.loads(p) or {}).get('device_id') if p else None
+            except Exception:
+                continue
+            if device_id:
+                updates.append((device_id, r[0]))
+        cur.executemany('UPDATE transactions SET device_id = ? WHERE id = ?', updates)
+
+
+def _backfill_transaction_indicators(cur):
+    """Populate transaction_indicators from the JSON `indicators` column (first run after upgrade)."""
+    read = cur.connection.cursor()
+    read.execute("SELECT id, indicators FROM transactions WHERE indicators IS NOT NULL AND indicators NOT IN ('', '[]') ORDER BY id")
+    while True:
+        batch = read.fetchmany(5000)
+        if not batch:
+            break
+        _insert_indicators(cur, [(r[0], ind) for r in batch for ind in _decode_indicators(r[1])])
+
+
+def get_top_indicators(limit: int = 5) -> List[tuple]:
+    """(name, transaction count) pairs, most frequent first."""
+    cur = get_conn().cursor()
+    cur.execute('''SELECT n.name, COUNT(*) AS cnt FROM transaction_indicators ti JOIN indicator_names n ON n.id = ti.name_id
+                   GROUP BY ti.name_id ORDER BY cnt DESC, n.name LIMIT ?''', (limit,))
+    return [(r[0], r[1]) for r in cur.fetchall()]
+
+
+def get_transactions_with_indicator(name: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent transactions flagged with indicator `name` (oldest first, like get_recent_transactions)."""
+    cur = get_conn().cursor()
+    cur.execute('''SELECT t.* FROM transactions t WHERE t.id IN (
+                       SELECT ti.tx_id FROM transaction_indicators ti
+                       WHERE ti.name_id = (SELECT id FROM indicator_names WHERE name = ?)
+                       ORDER BY ti.tx_id DESC LIMIT ?)
+                   ORDER BY t.id''', (name, limit))
+    return [TransactionRow(r) for r in cur.fetchall()]
+
+
+def add_to_rollups(merchants: dict, indicators: dict, epoch, ts, merchant, amount, status, tx_indicators):
+    """Accumulate one transaction into {(bucket, merchant): [...]} and {(bucket, indicator): count}."""
+    bucket = rollup_bucket(epoch)
+    key = (bucket, merchant or 'Unknown')
+    m = merchants.get(key)
+    if m is None:
+        m = merchants[key] = [0, 0, 0.0, 0.0, None, None]
+    amount = amount or 0
+    m[0] += 1
+    m[2] += amount
+    if status == 'Fraud':
+        m[1] += 1
+        m[3] += amount
+        if epoch is not None and (m[4] is None or epoch >= m[4]):
+            m[4], m[5] = epoch, ts
+    for indicator in tx_indicators or []:
+        ikey = (bucket, indicator_name(indicator))
+        indicators[ikey] = indicators.get(ikey, 0) + 1
+
+
+def _flush_rollups(cur, merchants: dict, indicators: dict):
+    if merchants:
+        cur.executemany(_MERCHANT_ROLLUP_SQL, [k + tuple(v) for k, v in merchants.items()])
+    if indicators:
+        cur.executemany(_INDICATOR_ROLLUP_SQL, [k + (n,) for k, n in indicators.items()])
+
+
+def _update_rollups(cur, txs: List[Dict[str, Any]], rows: List[tuple]):
+    merchants, indicators = {}, {}
+    for tx, row in zip(txs, rows):
+        add_to_rollups(merchants, indicators, row[1], row[0], row[5], row[4], row[10], tx.get('indicators'))
+    _flush_rollups(cur, merchants, indicators)
+
+
+def _backfill_rollups(cur):
+    """Build the hourly rollups from existing transactions (first run after upgrade)."""
+    read = cur.connection.cursor()
+    read.execute('SELECT ts_epoch, timestamp, merchant, amount, status, indicators FROM transactions ORDER BY id')
+    while True:
+        batch = read.fetchmany(5000)
+        if not batch:
+            break
+        merchants, indicators = {}, {}
+        for r in batch:
+            add_to_rollups(merchants, indicators, r[0], r[1], r[2], r[3], r[4], _decode_indicators(r[5]))
+        _flush_rollups(cur, merchants, indicators)
+
+
+def get_banking_rollup(from_epoch: int = None, to_epoch: int = None) -> Dict[str, Any]:
+    """Aggregate the hourly rollups over [from_epoch, to_epoch) (hour granularity; None = unbounded)."""
+    where, params = [], []
+    if from_epoch is not None:
+        where.append('bucket >= ?')
+        params.append(rollup_bucket(from_epoch))
+    if to_epoch is not None:
+        where.append('bucket < ?')
+        params.append(int(to_epoch))
+    clause = (' WHERE ' + ' AND '.join(where)) if where else ''
+    cur = get_conn().cursor()
+    cur.execute('SELECT merchant, SUM(tx_count), SUM(fraud_count), SUM(total_amount), SUM(fraud_amount) '
+                'FROM rollup_merchant_hourly' + clause + ' GROUP BY merchant', params)
+    merchants = {r[0]: {'count': r[1], 'fraud_count': r[2], 'total_amount': r[3], 'fraud_amount': r[4]} for r in cur.fetchall()}
+    cur.execute('SELECT indicator, SUM(tx_count) FROM rollup_indicator_hourly' + clause + ' GROUP BY indicator', params)
+    indicators = {r[0]: r[1] for r in cur.fetchall()}
+    cur.execute('SELECT last_fraud_timestamp FROM rollup_merchant_hourly' + clause +
+                (' AND' if where else ' WHERE') + ' last_fraud_epoch IS NOT NULL ORDER BY last_fraud_epoch DESC LIMIT 1', params)
+    row = cur.fetchone()
+    return {'merchants': merchants, 'indicators': indicators, 'last_fraud_timestamp': row[0] if row else None}
+
+
+def _rebuild_stats_counters(cur):
+    cur.execute('''INSERT OR REPLACE INTO stats_counters (id, tx_count, fraud_count, fraud_amount, risk_sum, blocked_count, last_fraud_epoch, last_fraud_timestamp)
+        SELECT 1, COUNT(*), coalesce(SUM(status = 'Fraud'), 0), TOTAL(CASE WHEN status = 'Fraud' THEN amount END), TOTAL(risk_score),
+               coalesce(SUM(blocked = 1), 0),
+               (SELECT ts_epoch FROM transactions WHERE status = 'Fraud' ORDER BY ts_epoch DESC, id DESC LIMIT 1),
+               (SELECT timestamp FROM transactions WHERE status = 'Fraud' ORDER BY ts_epoch DESC, id DESC LIMIT 1)
+        FROM transactions''')
+
+
+# bucket sizes served by get_stats_timeseries; buckets start on local-time boundaries
+STATS_RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+_STATS_BUCKET_SQL = '''INSERT INTO stats_buckets (resolution, bucket, tx_count, fraud_count, fraud_amount, risk_sum)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(resolution, bucket) DO UPDATE SET
+        tx_count = tx_count + excluded.tx_count,
+        fraud_count = fraud_count + excluded.fraud_count,
+        fraud_amount = fraud_amount + excluded.fraud_amount,
+        risk_sum = risk_sum + excluded.risk_sum'''
+
+
+def local_bucket(epoch: int, size: int) -> int:
+    """Start of the `size`-second bucket holding `epoch`, aligned to local time."""
+    # align to local midnight/hour (e.g. IST is UTC+5:30, so epoch // 3600 would split local hours)
+    return epoch - (epoch + time.localtime(epoch).tm_gmtoff) % size
+
+
+def add_to_stats_buckets(acc: dict, epoch, amount, status, risk):
+    """Accumulate one transaction into {(resolution, bucket): [count, fraud, fraud_amount, risk_sum]}."""
+    if epoch is None:
+        return
+    fraud = status == 'Fraud'
+    for res, size in STATS_RESOLUTIONS.items():
+        key = (res, local_bucket(epoch, size))
+        b = acc.get(key)
+        if b is None:
+            b = acc[key] = [0, 0, 0.0, 0.0]
+        b[0] += 1
+        b[3] += risk or 0
+        if fraud:
+            b[1] += 1
+            b[2] += amount or 0
+
+
+def _update_stats_buckets(cur, rows: List[tuple]):
+    acc = {}
+    for row in rows:
+        add_to_stats_buckets(acc, row[1], row[4], row[10], row[9])
+    if acc:
+        cur.executemany(_STATS_BUCKET_SQL, [k + tuple(v) for k, v in acc.items()])
+
+
+def _rebuild_stats_buckets(cur):
+    cur.execute('DELETE FROM stats_buckets')
+    read = cur.connection.cursor()
+    read.execute('SELECT ts_epoch, amount, status, risk_score FROM transactions WHERE ts_epoch IS NOT NULL')
+    while True:
+        batch = read.fetchmany(5000)
+        if not batch:
+            break
+        acc = {}
+        for r in batch:
+            add_to_stats_buckets(acc, r[0], r[1], r[2], r[3])
+        cur.executemany(_STATS_BUCKET_SQL, [k + tuple(v) for k, v in acc.items()])
+
+
+def rebuild_stats_buckets():
+    """Recompute stats_buckets from the full transaction history."""
+    with transaction() as cur:
+        _rebuild_stats_buckets(cur)
+
+
+def get_stats_timeseries(resolution: str, from_epoch: int = None, to_epoch: int = None) -> List[Dict[str, Any]]:
+    """Per-bucket totals for buckets starting in [from_epoch, to_epoch), oldest first.
+
+    Buckets without transactions are omitted.
+    """
+    if resolution not in STATS_RESOLUTIONS:
+        raise ValueError(f'unknown resolution: {resolution!r}')
+    where, params = ['resolution = ?'], [resolution]
+    if from_epoch is not None:
+        where.append('bucket >= ?')
+        params.append(local_bucket(int(from_epoch), STATS_RESOLUTIONS[resolution]))
+    if to_epoch is not None:
+        where.append('bucket < ?')
+        params.append(int(to_epoch))
+    cur = get_conn().cursor()
+    cur.execute('SELECT bucket, tx_count, fraud_count, fraud_amount, risk_sum FROM stats_buckets WHERE '
+                + ' AND '.join(where) + ' ORDER BY bucket', params)
+    return [{'bucket': r[0], 'count': r[1], 'fraud_count': r[2], 'amount_at_risk': r[3],
+             'mean_risk': r[4] / r[1] if r[1] else 0} for r in cur.fetchall()]
+
+
+def rebuild_stats_counters() -> Dict[str, Any]:
+    """Recompute stats_counters from the full transaction history."""
+    with transaction() as cur:
+        _rebuild_stats_counters(cur)
+    return get_stats_counters()
+
+
+def get_stats_counters() -> Dict[str, Any]:
+    cur = get_conn().cursor()
+    cur.execute('SELECT tx_count, fraud_count, fraud_amount, risk_sum, blocked_count, last_fraud_timestamp FROM stats_counters WHERE id = 1')
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def _backfill_profile_aggregates(cur):
+    """Build profile aggregates from existing transactions (first run after upgrade)."""
+    cur.execute('''INSERT INTO profile_aggregates (upi, tx_count, fraud_count, amount_sum, amount_sq_sum, amount_min, amount_max, first_epoch, last_epoch)
+        SELECT upi, COUNT(*), coalesce(SUM(status = 'Fraud'), 0), TOTAL(amount), TOTAL(amount * amount), MIN(coalesce(amount, 0)), MAX(coalesce(amount, 0)), MIN(ts_epoch), MAX(ts_epoch)
+        FROM transactions WHERE upi IS NOT NULL AND upi != '' GROUP BY upi''')
+    cur.execute('''UPDATE profile_aggregates SET (last_timestamp, last_device_id, last_location) = (
+            SELECT t.timestamp, t.device_id, t.location FROM transactions t
+            WHERE t.upi = profile_aggregates.upi ORDER BY t.ts_epoch DESC, t.id DESC LIMIT 1)''')
+    cur.execute('''INSERT INTO profile_merchants (upi, merchant, tx_count, last_epoch)
+        SELECT upi, coalesce(merchant, ''), COUNT(*), MAX(ts_epoch)
+        FROM transactions WHERE upi IS NOT NULL AND upi != '' GROUP BY upi, coalesce(merchant, '')''')
+    # profiles used to carry the full transaction history; it now lives only in `transactions`
+    try:
+        cur.execute("UPDATE user_profiles SET profile_json = json_remove(profile_json, '$.transactions') "
+                    "WHERE json_valid(profile_json) AND json_type(profile_json, '$.transactions') IS NOT NULL")
+    except sqlite3.OperationalError:
+        pass  # SQLite built without JSON1: the stale key is harmless
+
+
+def tokenize_upi(upi: str):
+    """Tokenized upi for privacy-preserving storage and reputation lookups (None if unavailable)."""
+    if not upi or security is None:
+        return None
     try:
-        from security import tokenize_identifier, encrypt_field
-        upi_token = tokenize_identifier(tx.get('upi')) if tx.get('upi') else None
-        enc_features = encrypt_field(features_json) if features_json is not None else None
-        explanation_plain = json.dumps(tx.get('explanation')) if tx.get('explanation') is not None else None
-        enc_explanation = encrypt_field(explanation_plain) if explanation_plain is not None else None
+        return security.tokenize_identifier(upi)
     except Exception:
-        upi_token = None
-        enc_features = features_json
-        explanation_plain = json.dumps(tx.get('explanation')) if tx.get('explanation') is not None else None
-        enc_explanation = explanation_plain
-    cur.execute(
-        '''INSERT INTO transactions (timestamp, upi, upi_token, amount, merchant, category, location, risk_score, status, indicators, blocked, blocked_by, blocked_timestamp, explanation, features)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-        (tx.get('timestamp'), tx.get('upi'), upi_token, tx.get('amount'), tx.get('merchant'), tx.get('category'),
-         tx.get('location'), tx.get('risk_score'), tx.get('status'), indicators_json, int(tx.get('blocked', 0)), tx.get('blocked_by'), tx.get('blocked_timestamp'), enc_explanation, enc_features)
-    )
-    conn.commit()
+        return None
+
+
+def _transaction_rows(txs: List[Dict[str, Any]]) -> List[tuple]:
+    """Build INSERT parameters for a batch of transactions (tokenizes and encrypts; no DB access)."""
+    features = [json.dumps(tx.get('features', {})) if tx.get('features') is not None else None for tx in txs]
+    explanations = [json.dumps(tx.get('explanation')) if tx.get('explanation') is not None else None for tx in txs]
+    if security is not None:
+        # one cipher lookup for the whole batch
+        features = security.encrypt_many(features)
+        explanations = security.encrypt_many(explanations)
+    rows = []
+    for tx, enc_features, enc_explanation in zip(txs, features, explanations):
+        device_id = tx.get('device_id') or (tx.get('features') or {}).get('device_id')
+        rows.append((tx.get('timestamp'), timestamp_to_epoch(tx.get('timestamp')), tx.get('upi'), tokenize_upi(tx.get('upi')), tx.get('amount'), tx.get('merchant'), tx.get('category'),
+                     tx.get('location'), device_id, tx.get('risk_score'), tx.get('status'), json.dumps(tx.get('indicators', [])), int(tx.get('blocked', 0)), tx.get('blocked_by'), tx.get('blocked_timestamp'), enc_explanation, enc_features))
+    return rows
+
+
+def prepare_transaction_row(tx: Dict[str, Any]) -> tuple:
+    """INSERT parameters for one transaction (tokenizes and encrypts; no DB access)."""
+    return _transaction_rows([tx])[0]
+
+
+def _update_derived(cur, txs: List[Dict[str, Any]], rows: List[tuple], ids: List[int]):
+    """Maintain the tables derived from `transactions` in the same DB transaction as the insert."""
+    _update_profiles(cur, rows)
+    _update_stats(cur, rows)
+    _update_stats_buckets(cur, rows)
+    _update_rollups(cur, txs, rows)
+    _insert_indicators(cur, [(tx_id, ind) for tx_id, tx in zip(ids, txs) for ind in tx.get('indicators') or []])
+
+
+def insert_transaction(cur, tx: Dict[str, Any], row: tuple = None) -> int:
+    """Insert one transaction on `cur` inside the caller's DB transaction; returns the new id."""
+    row = row if row is not None else prepare_transaction_row(tx)
+    cur.execute(_TX_INSERT_SQL, row)
     rowid = cur.lastrowid
-    conn.close()
+    _update_derived(cur, [tx], [row], [rowid])
+    return rowid
+
+
+def save_transaction(tx: Dict[str, Any]) -> int:
+    row = prepare_transaction_row(tx)
+    with transaction() as cur:
+        rowid = insert_transaction(cur, tx, row)
+    emit('transaction_saved', tx, rowid)
     return rowid
 
 
+def save_transactions_bulk(txs: Iterable[Dict[str, Any]], chunk_size: int = 1000) -> int:
+    """Insert many transactions; returns the number of rows written.
+
+    Rows are tokenized/encrypted and inserted with `executemany` one chunk at a
+    time, each chunk in its own DB transaction, so memory stays bounded by
+    `chunk_size` however long `txs` is.
+    """
+    total = 0
+    it = iter(txs)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            break
+        rows = _transaction_rows(chunk)
+        with transaction() as cur:
+            cur.executemany(_TX_INSERT_SQL, rows)
+            # AUTOINCREMENT ids are contiguous within one write transaction
+            last_id = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
+            _update_derived(cur, chunk, rows, list(range(last_id - len(rows) + 1, last_id + 1)))
+        total += len(rows)
+        if _listeners['transaction_saved']:
+            for tx in chunk:
+                emit('transaction_saved', tx, None)
+    return total
+
+
 def get_recent_transactions(limit: int = 20) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT * FROM transactions ORDER BY id DESC LIMIT ?', (limit,))
     rows = cur.fetchall()
-    conn.close()
-    transactions = []
-    for r in rows:
-        t = dict(r)
-        try:
-            t['indicators'] = json.loads(t.get('indicators') or '[]')
-        except Exception:
-            t['indicators'] = []
-        # parse explanation JSON if present (decrypt at-rest)
-        try:
-            from security import decrypt_field
-            raw = decrypt_field(t.get('explanation')) if t.get('explanation') else None
-            t['explanation'] = json.loads(raw) if raw else None
-        except Exception:
-            t['explanation'] = None
-        # parse features JSON if present
-        try:
-            from security import decrypt_field
-            rawf = decrypt_field(t.get('features')) if t.get('features') else None
-            t['features'] = json.loads(rawf) if rawf else None
-        except Exception:
-            t['features'] = None
-        transactions.append(t)
+    # explanation/features are decrypted only if a caller reads them
+    transactions = [TransactionRow(r) for r in rows]
     transactions.reverse()  # oldest first
     return transactions
 
 
 def get_all_transactions() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM transactions ORDER BY id ASC')
-    rows = cur.fetchall()
-    conn.close()
-    transactions = []
-    for r in rows:
-        t = dict(r)
-        try:
-            t['indicators'] = json.loads(t.get('indicators') or '[]')
-        except Exception:
-            t['indicators'] = []
+    """Materialize every transaction. Prefer `iter_transactions` for large tables."""
+    return list(iter_transactions())
+
+
+def _decode_indicators(raw):
+    try:
+        return json.loads(raw or '[]')
+    except Exception:
+        return []
+
+
+def _decode_encrypted_json(raw):
+    if not raw:
+        return None
+    try:
+        plain = security.decrypt_field(raw) if security is not None else raw
+        return json.loads(plain) if plain else None
+    except Exception:
+        return None
+
+
+_PENDING = object()
+
+
+class TransactionRow(dict):
+    """A transaction dict whose JSON and encrypted columns are decoded on first access.
+
+    Plain columns are stored as-is. `indicators` (JSON) and `explanation` /
+    `features` (encrypted JSON) stay raw until read, then the decoded value is
+    cached. Item access, `get`, `items()`, `dict(row)`, `json.dumps(row)` and
+    pickling all see decoded values, so callers can treat it as a plain dict.
+    """
+
+    __slots__ = ('_raw',)
+    _DECODERS = {'indicators': _decode_indicators, 'explanation': _decode_encrypted_json, 'features': _decode_encrypted_json}
+
+    def __init__(self, row):
+        dict.__init__(self)
+        self._raw = {}
+        for k in row.keys():
+            if k in self._DECODERS:
+                self._raw[k] = row[k]
+                dict.__setitem__(self, k, _PENDING)
+            else:
+                dict.__setitem__(self, k, row[k])
+
+    def is_decoded(self, key) -> bool:
+        return key not in self._raw
+
+    def _decode(self, key):
+        value = self._DECODERS[key](self._raw.pop(key))
+        dict.__setitem__(self, key, value)
+        return value
+
+    def _decode_all(self):
+        for key in list(self._raw):
+            self._decode(key)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        return self._decode(key) if value is _PENDING else value
+
+    def get(self, key, default=None):
         try:
-            from security import decrypt_field
-            raw = decrypt_field(t.get('explanation')) if t.get('explanation') else None
-            t['explanation'] = json.loads(raw) if raw else None
-        except Exception:
-            t['explanation'] = None
-        transactions.append(t)
-    return transactions
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._raw.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._raw.pop(key, None)
+        dict.__delitem__(self, key)
+
+    def __iter__(self):
+        # defined so dict(row) / {**row} go through keys() + __getitem__
+        return dict.__iter__(self)
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def pop(self, key, *default):
+        if key in self._raw:
+            self._decode(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._decode_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        self._decode_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self.items()),))
+
+
+def iter_transactions(since_id: int = None, chunk: int = 5000, columns: Iterable[str] = None,
+                      until_epoch: int = None) -> Iterator[Dict[str, Any]]:
+    """Stream transactions in id order, `chunk` rows per query.
+
+    Pages use keyset pagination (`id > last_id`), so no read transaction stays
+    open between pages and memory is bounded by `chunk`. `columns` limits the
+    selected columns (`id` is always included); leaving out `explanation` and
+    `features` skips decryption entirely. `until_epoch` stops at rows whose
+    `ts_epoch` is after that time.
+    """
+    if columns is None:
+        select = '*'
+    else:
+        cols = ['id'] + [c for c in columns if c != 'id']
+        unknown = [c for c in cols if not c.isidentifier()]
+        if unknown:
+            raise ValueError(f'invalid column names: {unknown}')
+        select = ', '.join(cols)
+    where, params = 'id > ?', []
+    if until_epoch is not None:
+        where += ' AND ts_epoch <= ?'
+        params.append(int(until_epoch))
+    last_id = since_id or 0
+    conn = get_conn()
+    while True:
+        cur = conn.cursor()
+        cur.execute(f'SELECT {select} FROM transactions WHERE {where} ORDER BY id LIMIT ?', (last_id, *params, chunk))
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            return
+        for r in rows:
+            yield TransactionRow(r)
+        last_id = rows[-1]['id']
+        if len(rows) < chunk:
+            return
+
+
+def reencrypt_transactions(chunk: int = 1000) -> int:
+    """Re-encrypt `explanation`/`features` under the primary key, one chunk per DB transaction.
+
+    Run offline after adding a new DB_ENCRYPTION_KEY and moving the old one to
+    DB_ENCRYPTION_KEYS. Returns the number of rows visited.
+    """
+    if security is None:
+        return 0
+    last_id, total = 0, 0
+    conn = get_conn()
+    while True:
+        rows = conn.execute('SELECT id, explanation, features FROM transactions WHERE id > ? ORDER BY id LIMIT ?',
+                            (last_id, chunk)).fetchall()
+        if not rows:
+            return total
+        explanations = security.rotate_many([r['explanation'] for r in rows])
+        features = security.rotate_many([r['features'] for r in rows])
+        with transaction() as cur:
+            cur.executemany('UPDATE transactions SET explanation = ?, features = ? WHERE id = ?',
+                            [(e, f, r['id']) for r, e, f in zip(rows, explanations, features)])
+        total += len(rows)
+        last_id = rows[-1]['id']
 
 
 def clear_transactions():
     """Delete all transactions from the DB and reset autoincrement."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM transactions')
-    # Reset sqlite_sequence for AUTOINCREMENT (if present)
-    try:
-        cur.execute("DELETE FROM sqlite_sequence WHERE name='transactions'")
-    except Exception:
-        pass
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('DELETE FROM transactions')
+        cur.execute('DELETE FROM profile_aggregates')
+        cur.execute('DELETE FROM profile_merchants')
+        cur.execute('DELETE FROM rollup_merchant_hourly')
+        cur.execute('DELETE FROM rollup_indicator_hourly')
+        cur.execute('DELETE FROM transaction_indicators')
+        cur.execute('DELETE FROM stats_buckets')
+        cur.execute('DELETE FROM sketches')
+        _rebuild_stats_counters(cur)
+        # Reset sqlite_sequence for AUTOINCREMENT (if present)
+        try:
+            cur.execute("DELETE FROM sqlite_sequence WHERE name='transactions'")
+        except Exception:
+            pass
+    emit('transactions_cleared')
     return True
 
 
 def save_user_profile(upi: str, profile: Dict[str, Any]):
-    conn = get_conn()
-    cur = conn.cursor()
     profile_json = json.dumps(profile)
-    cur.execute('REPLACE INTO user_profiles (upi, profile_json) VALUES (?, ?)', (upi, profile_json))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('REPLACE INTO user_profiles (upi, profile_json) VALUES (?, ?)', (upi, profile_json))
 
 
 # -- User auth helpers --
 def create_user(upi: str, display_name: str, password_hash: str, mfa_secret: str = None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
     ts = datetime_now_str()
-    cur.execute('INSERT INTO users (upi, display_name, password_hash, mfa_enabled, mfa_secret, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-                (upi, display_name, password_hash, 1 if mfa_secret else 0, mfa_secret, ts))
-    conn.commit()
-    uid = cur.lastrowid
-    conn.close()
+    with transaction() as cur:
+        cur.execute('INSERT INTO users (upi, display_name, password_hash, mfa_enabled, mfa_secret, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (upi, display_name, password_hash, 1 if mfa_secret else 0, mfa_secret, ts))
+        uid = cur.lastrowid
     return uid
 
 
 def get_user_by_upi(upi: str) -> Dict[str, Any]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT * FROM users WHERE upi = ?', (upi,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
     u = dict(row)
@@ -236,43 +1061,35 @@ def get_user_by_upi(upi: str) -> Dict[str, Any]:
 
 
 def set_mfa_for_user(upi: str, secret: str, enabled: bool = True, backup_codes: list = None) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
     codes_json = json.dumps(backup_codes) if backup_codes is not None else None
-    cur.execute('UPDATE users SET mfa_secret = ?, mfa_enabled = ?, mfa_backup_codes = ? WHERE upi = ?', (secret, 1 if enabled else 0, codes_json, upi))
-    conn.commit()
-    ok = cur.rowcount > 0
-    conn.close()
+    with transaction() as cur:
+        cur.execute('UPDATE users SET mfa_secret = ?, mfa_enabled = ?, mfa_backup_codes = ? WHERE upi = ?', (secret, 1 if enabled else 0, codes_json, upi))
+        ok = cur.rowcount > 0
     return ok
 
 
 def get_and_consume_backup_code(upi: str, code: str) -> bool:
     """Return True and consume (delete) the code if it exists for user."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT mfa_backup_codes FROM users WHERE upi = ?', (upi,))
-    row = cur.fetchone()
-    if not row or not row[0]:
-        conn.close()
-        return False
-    try:
-        codes = json.loads(row[0])
-    except Exception:
-        codes = []
-    if code not in codes:
-        conn.close()
-        return False
-    # remove and update
-    codes.remove(code)
-    cur.execute('UPDATE users SET mfa_backup_codes = ? WHERE upi = ?', (json.dumps(codes), upi))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('SELECT mfa_backup_codes FROM users WHERE upi = ?', (upi,))
+        row = cur.fetchone()
+        if not row or not row[0]:
+            return False
+        try:
+            codes = json.loads(row[0])
+        except Exception:
+            codes = []
+        if code not in codes:
+            return False
+        # remove and update
+        codes.remove(code)
+        cur.execute('UPDATE users SET mfa_backup_codes = ? WHERE upi = ?', (json.dumps(codes), upi))
     return True
 
 
 def set_user_last_seen(upi: str, ts: str = None):
     """Set last_seen timestamp on user profile and persist."""
-    profile = get_user_profile(upi) or {'transactions': []}
+    profile = get_user_profile(upi) or {}
     profile['last_seen'] = ts or datetime_now_str()
     save_user_profile(upi, profile)
     return profile
@@ -281,22 +1098,15 @@ def set_user_last_seen(upi: str, ts: str = None):
 # -- WebAuthn credential helpers --
 def set_webauthn_credentials(upi: str, credentials: list) -> bool:
     """Store a list of webauthn credentials (serialized as JSON) on the user record."""
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with transaction() as cur:
         cur.execute('UPDATE users SET webauthn_credentials = ? WHERE upi = ?', (json.dumps(credentials), upi))
-        conn.commit()
         return cur.rowcount > 0
-    finally:
-        conn.close()
 
 
 def get_webauthn_credentials(upi: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT webauthn_credentials FROM users WHERE upi = ?', (upi,))
     row = cur.fetchone()
-    conn.close()
     if not row or not row[0]:
         return []
     try:
@@ -321,42 +1131,24 @@ def remove_webauthn_credential(upi: str, credential_id: str) -> bool:
 
 
 def mark_transaction_blocked(tx_id: int, blocked_by: str = None) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
     ts = datetime_now_str()
-    cur.execute('UPDATE transactions SET blocked = 1, blocked_by = ?, blocked_timestamp = ? WHERE id = ?', (blocked_by, ts, tx_id))
-    conn.commit()
-    changed = cur.rowcount > 0
-    conn.close()
+    with transaction() as cur:
+        cur.execute('SELECT blocked FROM transactions WHERE id = ?', (tx_id,))
+        row = cur.fetchone()
+        cur.execute('UPDATE transactions SET blocked = 1, blocked_by = ?, blocked_timestamp = ? WHERE id = ?', (blocked_by, ts, tx_id))
+        changed = cur.rowcount > 0
+        if row is not None and not row[0]:
+            cur.execute('UPDATE stats_counters SET blocked_count = blocked_count + 1 WHERE id = 1')
     return changed
 
 
 def get_transaction_by_id(tx_id: int) -> Dict[str, Any]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT * FROM transactions WHERE id = ?', (tx_id,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
-    t = dict(row)
-    try:
-        t['indicators'] = json.loads(t.get('indicators') or '[]')
-    except Exception:
-        t['indicators'] = []
-    try:
-        from security import decrypt_field
-        raw = decrypt_field(t.get('explanation')) if t.get('explanation') else None
-        t['explanation'] = json.loads(raw) if raw else None
-    except Exception:
-        t['explanation'] = None
-    try:
-        from security import decrypt_field
-        rawf = decrypt_field(t.get('features')) if t.get('features') else None
-        t['features'] = json.loads(rawf) if rawf else None
-    except Exception:
-        t['features'] = None
-    return t
+    return TransactionRow(row)
 
 
 def datetime_now_str():
@@ -364,72 +1156,93 @@ def datetime_now_str():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 
-def count_transactions_for_upi(upi: str, minutes: int = 60) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    # compare timestamp to current time minus minutes; use tokenized upi if present
+def timestamp_to_epoch(ts: str):
+    """Convert a stored local-time `timestamp` string to epoch seconds (None if unparseable)."""
+    if not ts:
+        return None
+    from datetime import datetime
     try:
-        from security import tokenize_identifier
-        upi_token = tokenize_identifier(upi)
-    except Exception:
-        upi_token = None
-    cur.execute("SELECT COUNT(*) as cnt FROM transactions WHERE (upi = ? OR upi_token = ?) AND datetime(timestamp) > datetime('now', ?)", (upi, upi_token, f'-{minutes} minutes'))
+        return int(datetime.strptime(ts, '%Y-%m-%d %H:%M:%S').timestamp())
+    except (TypeError, ValueError):
+        try:
+            return int(datetime.fromisoformat(ts).timestamp())
+        except (TypeError, ValueError):
+            return None
+
+
+# Latest row for a UPI (plain or tokenized); each branch is a backwards index seek
+_LAST_TX_ID_SQL = '''
+    SELECT id FROM (
+        SELECT * FROM (SELECT id, ts_epoch FROM transactions WHERE upi = ? ORDER BY ts_epoch DESC, id DESC LIMIT 1)
+        UNION ALL
+        SELECT * FROM (SELECT id, ts_epoch FROM transactions WHERE upi_token = ? ORDER BY ts_epoch DESC, id DESC LIMIT 1)
+    ) ORDER BY ts_epoch DESC, id DESC LIMIT 1
+'''
+
+
+def count_transactions_for_upi(upi: str, minutes: int = 60) -> int:
+    cur = get_conn().cursor()
+    # range scan on (upi, ts_epoch) / (upi_token, ts_epoch); use tokenized upi if present
+    upi_token = tokenize_upi(upi)
+    cutoff = int(time.time()) - minutes * 60
+    cur.execute("SELECT COUNT(*) as cnt FROM transactions WHERE (upi = ? OR upi_token = ?) AND ts_epoch > ?", (upi, upi_token, cutoff))
     row = cur.fetchone()
-    conn.close()
     return int(row['cnt']) if row else 0
 
 
 def get_last_transaction_for_upi(upi: str) -> Dict[str, Any]:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        from security import tokenize_identifier
-        upi_token = tokenize_identifier(upi)
-    except Exception:
-        upi_token = None
-    cur.execute('SELECT * FROM transactions WHERE (upi = ? OR upi_token = ?) ORDER BY id DESC LIMIT 1', (upi, upi_token))
+    cur = get_conn().cursor()
+    upi_token = tokenize_upi(upi)
+    cur.execute(f'SELECT * FROM transactions WHERE id = ({_LAST_TX_ID_SQL})', (upi, upi_token))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
-    t = dict(row)
-    try:
-        t['indicators'] = json.loads(t.get('indicators') or '[]')
-    except Exception:
-        t['indicators'] = []
-    try:
-        from security import decrypt_field
-        raw = decrypt_field(t.get('explanation')) if t.get('explanation') else None
-        t['explanation'] = json.loads(raw) if raw else None
-    except Exception:
-        t['explanation'] = None
-    try:
-        from security import decrypt_field
-        rawf = decrypt_field(t.get('features')) if t.get('features') else None
-        t['features'] = json.loads(rawf) if rawf else None
-    except Exception:
-        t['features'] = None
-    return t
+    return TransactionRow(row)
+
+
+def get_velocity_snapshot(upi: str, windows=(60, 6 * 60, 24 * 60, 7 * 24 * 60)) -> Dict[str, Any]:
+    """Return per-window transaction counts and last-transaction context for a UPI in one query.
+
+    `windows` are look-back periods in minutes. Result:
+    `{'counts': {minutes: n, ...}, 'last_tx': {'timestamp', 'location', 'device_id'} or None}`.
+    Only plain columns are read, so nothing is decrypted.
+    """
+    windows = [int(w) for w in windows]
+    upi_token = tokenize_upi(upi)
+    now = int(time.time())
+    cutoffs = [now - w * 60 for w in windows]
+    sums = ', '.join(f'COALESCE(SUM(ts_epoch > ?), 0) AS c{i}' for i in range(len(windows))) or '0 AS c0'
+    cur = get_conn().cursor()
+    cur.execute(f'''
+        SELECT agg.*, last.timestamp AS last_timestamp, last.location AS last_location, last.device_id AS last_device_id
+        FROM (SELECT {sums} FROM transactions WHERE (upi = ? OR upi_token = ?) AND ts_epoch > ?) AS agg
+        LEFT JOIN (SELECT timestamp, location, device_id FROM transactions WHERE id = ({_LAST_TX_ID_SQL})) AS last ON 1
+    ''', (*cutoffs, upi, upi_token, min(cutoffs, default=now), upi, upi_token))
+    row = cur.fetchone()
+    counts = {w: int(row[f'c{i}']) for i, w in enumerate(windows)}
+    last_tx = None
+    if row['last_timestamp'] is not None:
+        last_tx = {'timestamp': row['last_timestamp'], 'location': row['last_location'], 'device_id': row['last_device_id']}
+    return {'counts': counts, 'last_tx': last_tx}
 
 
 def log_audit(action: str, actor: str = None, details: Dict[str, Any] = None):
-    conn = get_conn()
-    cur = conn.cursor()
-    ts = datetime_now_str()
-    cur.execute('INSERT INTO audit_log (timestamp, action, actor, details) VALUES (?, ?, ?, ?)', (ts, action, actor, json.dumps(details) if details is not None else None))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        insert_audit(cur, action, actor, details)
     return True
 
 
+def insert_audit(cur, action: str, actor: str = None, details: Dict[str, Any] = None, ts: str = None):
+    """Insert one audit entry on `cur` inside the caller's DB transaction."""
+    cur.execute('INSERT INTO audit_log (timestamp, action, actor, details) VALUES (?, ?, ?, ?)', (ts or datetime_now_str(), action, actor, json.dumps(details) if details is not None else None))
+
+
 # -- VPA reputation helpers --
 def get_vpa_reputation(vpa_hash: str) -> Dict[str, Any]:
     """Return reputation record for a tokenized VPA (vpa_hash) or None."""
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT * FROM vpa_reputation WHERE vpa_hash = ?', (vpa_hash,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
     rec = dict(row)
@@ -442,26 +1255,21 @@ def get_vpa_reputation(vpa_hash: str) -> Dict[str, Any]:
 
 def set_vpa_reputation(vpa_hash: str, flag_count: int = 0, reputation_score: float = 1.0, reasons: list = None) -> bool:
     """Insert or update reputation for a given tokenized VPA."""
-    conn = get_conn()
-    cur = conn.cursor()
     reasons_json = json.dumps(reasons) if reasons is not None else None
-    cur.execute('SELECT 1 FROM vpa_reputation WHERE vpa_hash = ?', (vpa_hash,))
-    exists = cur.fetchone()
-    if exists:
-        cur.execute('UPDATE vpa_reputation SET flag_count = ?, reputation_score = ?, reasons = ? WHERE vpa_hash = ?', (flag_count, reputation_score, reasons_json, vpa_hash))
-    else:
-        cur.execute('INSERT INTO vpa_reputation (vpa_hash, flag_count, reputation_score, reasons) VALUES (?, ?, ?, ?)', (vpa_hash, flag_count, reputation_score, reasons_json))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('SELECT 1 FROM vpa_reputation WHERE vpa_hash = ?', (vpa_hash,))
+        exists = cur.fetchone()
+        if exists:
+            cur.execute('UPDATE vpa_reputation SET flag_count = ?, reputation_score = ?, reasons = ? WHERE vpa_hash = ?', (flag_count, reputation_score, reasons_json, vpa_hash))
+        else:
+            cur.execute('INSERT INTO vpa_reputation (vpa_hash, flag_count, reputation_score, reasons) VALUES (?, ?, ?, ?)', (vpa_hash, flag_count, reputation_score, reasons_json))
     return True
 
 
 def get_user_profile(upi: str) -> Dict[str, Any]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT profile_json FROM user_profiles WHERE upi = ?', (upi,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
     try:
@@ -470,12 +1278,37 @@ def get_user_profile(upi: str) -> Dict[str, Any]:
         return None
 
 
+def get_profile_aggregates(upi: str, merchant: str = None) -> Dict[str, Any]:
+    """Aggregated behaviour for `upi` (None if it has no transactions).
+
+    With `merchant`, `merchant_seen` tells whether the UPI has paid that
+    merchant before.
+    """
+    cur = get_conn().cursor()
+    cur.execute('''SELECT a.*, (SELECT COUNT(*) FROM profile_merchants m WHERE m.upi = a.upi) AS merchant_count,
+                          EXISTS(SELECT 1 FROM profile_merchants m WHERE m.upi = a.upi AND m.merchant = ?) AS merchant_seen
+                   FROM profile_aggregates a WHERE a.upi = ?''', (merchant or '', upi))
+    row = cur.fetchone()
+    if not row:
+        return None
+    agg = dict(row)
+    n = agg['tx_count'] or 0
+    agg['amount_avg'] = agg['amount_sum'] / n if n else None
+    agg['amount_std'] = max(agg['amount_sq_sum'] / n - agg['amount_avg'] ** 2, 0.0) ** 0.5 if n else None
+    agg['merchant_seen'] = bool(agg['merchant_seen']) if merchant is not None else None
+    return agg
+
+
+def get_profile_merchants(upi: str) -> List[str]:
+    cur = get_conn().cursor()
+    cur.execute('SELECT merchant FROM profile_merchants WHERE upi = ? ORDER BY merchant', (upi,))
+    return [r[0] for r in cur.fetchall()]
+
+
 def get_recent_audit_logs(limit: int = 10):
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute('SELECT * FROM audit_log ORDER BY id DESC LIMIT ?', (limit,))
     rows = cur.fetchall()
-    conn.close()
     logs = []
     for r in rows:
         l = dict(r)
@@ -0,0 +1,169 @@
+"""Columnar export of transaction history for offline analytics and training.
+
+Streams `transactions` in id order (keyset pages via
+`storage.backend.iter_transactions`) and writes one file per day per chunk, in a
+Hive-style layout readable by pandas, pyarrow, DuckDB or Spark:
+
+    <out_dir>/date=2025-01-31/part-00000101-00005100.parquet
+
+Parquet is written when `pyarrow` is installed. Without it, the same layout
+falls back to gzip-compressed CSV (`.csv.gz`). Encrypted `explanation` and
+`features` are left out unless `decrypt=True`. The last exported id is kept
+in `<out_dir>/_export_state.json`, so re-running exports only new rows.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from typing import Dict, Any, List, Iterator
+
+import storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+STATE_FILE = '_export_state.json'
+
+# exported columns and their Arrow types (encrypted columns only with decrypt=True)
+COLUMNS = [
+    ('id', 'int64'), ('timestamp', 'string'), ('ts_epoch', 'int64'), ('upi', 'string'), ('upi_token', 'string'),
+    ('amount', 'float64'), ('merchant', 'string'), ('category', 'string'), ('location', 'string'),
+    ('device_id', 'string'), ('risk_score', 'float64'), ('status', 'string'), ('indicators', 'string'),
+    ('blocked', 'int64'), ('blocked_by', 'string'), ('blocked_timestamp', 'string'),
+]
+DECRYPTED_COLUMNS = [('explanation', 'string'), ('features', 'string')]
+_JSON_COLUMNS = {'indicators', 'explanation', 'features'}
+
+
+def available_formats() -> List[str]:
+    return ['parquet', 'csv'] if pa is not None else ['csv']
+
+
+def read_state(out_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(out_dir: str, state: Dict[str, Any]):
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # atomic: a crash never leaves a half-written state
+
+
+def _partition(ts) -> str:
+    return f'date={ts[:10]}' if ts and len(ts) >= 10 else 'date=unknown'
+
+
+def _write_parquet(path: str, columns, records: List[Dict[str, Any]]):
+    schema = pa.schema([(name, getattr(pa, typ)()) for name, typ in columns])
+    table = pa.Table.from_pydict({name: [r[name] for r in records] for name, _ in columns}, schema=schema)
+    pq.write_table(table, path, compression='zstd')
+
+
+def _write_csv(path: str, columns, records: List[Dict[str, Any]]):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow([name for name, _ in columns])
+        for r in records:
+            w.writerow(['' if r[name] is None else r[name] for name, _ in columns])
+
+
+def _records(since_id: int = None, until_epoch: int = None, decrypt: bool = False, chunk: int = 5000):
+    """Yield (columns, record) with JSON columns serialized to strings."""
+    columns = COLUMNS + (DECRYPTED_COLUMNS if decrypt else [])
+    for t in storage.backend.iter_transactions(since_id=since_id, chunk=chunk, columns=[c for c, _ in columns],
+                                               until_epoch=until_epoch):
+        record = {}
+        for name, _ in columns:
+            value = t[name]
+            if name in _JSON_COLUMNS and value is not None:
+                value = json.dumps(value)
+            record[name] = value
+        yield columns, record
+
+
+def iter_text(fmt: str = 'ndjson', since_id: int = None, until_epoch: int = None, decrypt: bool = False,
+              chunk: int = 1000) -> Iterator[str]:
+    """Stream transactions as NDJSON lines or CSV text, one string per `chunk` rows.
+
+    Rows come in id order, so a client that stops early resumes with
+    `since_id=<last id received>`.
+    """
+    if fmt not in ('ndjson', 'csv'):
+        raise ValueError(f'unknown format: {fmt!r}')
+    buf = io.StringIO()
+    w = csv.writer(buf) if fmt == 'csv' else None
+    if w is not None:
+        w.writerow([name for name, _ in COLUMNS + (DECRYPTED_COLUMNS if decrypt else [])])
+    n = 0
+    for columns, record in _records(since_id, until_epoch, decrypt, chunk):
+        if w is not None:
+            w.writerow(['' if record[name] is None else record[name] for name, _ in columns])
+        else:
+            buf.write(json.dumps(record))
+            buf.write('\n')
+        n += 1
+        if n % chunk == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def export_transactions(out_dir: str, fmt: str = None, since_id: int = None, decrypt: bool = False,
+                        chunk: int = 5000) -> Dict[str, Any]:
+    """Export transactions with id > `since_id` (default: the last exported id) into `out_dir`.
+
+    Returns a summary: format, rows written, files written and the new last id.
+    """
+    fmt = fmt or available_formats()[0]
+    if fmt not in available_formats():
+        raise ValueError(f'format {fmt!r} unavailable (install pyarrow for parquet)')
+    os.makedirs(out_dir, exist_ok=True)
+    state = read_state(out_dir)
+    if since_id is None:
+        since_id = state.get('last_id', 0)
+
+    columns = COLUMNS + (DECRYPTED_COLUMNS if decrypt else [])
+    write = _write_parquet if fmt == 'parquet' else _write_csv
+    ext = '.parquet' if fmt == 'parquet' else '.csv.gz'
+    rows = 0
+    files = []
+    last_id = since_id
+    batch = []
+
+    def flush():
+        by_day = {}
+        for r in batch:
+            by_day.setdefault(_partition(r['timestamp']), []).append(r)
+        for part, records in by_day.items():
+            part_dir = os.path.join(out_dir, part)
+            os.makedirs(part_dir, exist_ok=True)
+            # named by id range, so re-exporting the same rows overwrites rather than duplicates
+            path = os.path.join(part_dir, f"part-{records[0]['id']:08d}-{records[-1]['id']:08d}{ext}")
+            write(path, columns, records)
+            files.append(path)
+        # advance the checkpoint only once the chunk's files are on disk
+        _write_state(out_dir, {'last_id': batch[-1]['id'], 'format': fmt})
+        batch.clear()
+
+    for _, record in _records(since_id=since_id, decrypt=decrypt, chunk=chunk):
+        batch.append(record)
+        rows += 1
+        last_id = record['id']
+        if len(batch) >= chunk:
+            flush()
+    if batch:
+        flush()
+    return {'format': fmt, 'rows': rows, 'files': files, 'last_id': last_id}
@@ -0,0 +1,104 @@
+"""Feature-schema registry: ordered model inputs filled straight into NumPy.
+
+Each `FeatureSchema` names its features in the order a model was trained
+with and knows how to read each one from a row dict. `matrix(rows)` writes a
+batch into a preallocated, per-thread float64 buffer, so the scoring path
+builds no DataFrame per request.
+
+Models pickled from a DataFrame remember its column names
+(`feature_names_in_`) and warn when scored with a plain array.
+`bind_model` checks those names against the schema, in order, and only then
+drops the attribute, so an ndarray input is both accepted and known to be in
+the right column order. A model trained on different columns is rejected.
+
+Registered schemas:
+- `transaction`: the fraud models (`amount`, `time` = hour of day)
+- `anomaly`: the analytics IsolationForest (amount, hour, graph degrees)
+"""
+import threading
+from typing import Dict, Any, List, Callable, Iterable, Sequence, Tuple
+
+import numpy as np
+
+
+class FeatureSchema:
+    def __init__(self, name: str, features: Sequence[Tuple[str, Callable[[Dict[str, Any]], Any]]]):
+        self.name = name
+        self.names = [f for f, _ in features]
+        self._getters = [g for _, g in features]
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _buffer(self, n: int) -> np.ndarray:
+        buf = getattr(self._local, 'buf', None)
+        if buf is None or buf.shape[0] < n:
+            buf = self._local.buf = np.empty((max(n, 64), len(self.names)), dtype=np.float64)
+        return buf
+
+    def matrix(self, rows: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """(n, len(schema)) float64 view of this thread's buffer; valid until its next `matrix` call."""
+        rows = rows if isinstance(rows, list) else list(rows)
+        out = self._buffer(len(rows))[:len(rows)]
+        for i, row in enumerate(rows):
+            for j, get in enumerate(self._getters):
+                out[i, j] = get(row)
+        return out
+
+    def vector(self, row: Dict[str, Any]) -> np.ndarray:
+        """A fresh (1, len(schema)) array for one row."""
+        return np.array([[get(row) for get in self._getters]], dtype=np.float64)
+
+    def bind_model(self, model):
+        """Verify `model` was trained on this schema and let it take plain arrays.
+
+        Raises ValueError if its recorded feature names differ. Returns the model.
+        """
+        names = getattr(model, 'feature_names_in_', None)
+        if names is not None and list(names) != self.names:
+            raise ValueError(f'{type(model).__name__} was trained on {list(names)}, schema {self.name!r} is {self.names}')
+        if hasattr(model, 'n_features_in_') and model.n_features_in_ != len(self.names):
+            raise ValueError(f'{type(model).__name__} expects {model.n_features_in_} features, schema {self.name!r} has {len(self.names)}')
+        for est in _estimators(model):
+            if 'feature_names_in_' in vars(est):
+                del est.feature_names_in_
+        return model
+
+
+def _estimators(model) -> List[Any]:
+    """The model and, for a Pipeline, its steps (where the names are actually stored)."""
+    out = [model]
+    for _, step in getattr(model, 'steps', None) or []:
+        if step is not None and step != 'passthrough':
+            out.extend(_estimators(step))
+    return out
+
+
+_registry: Dict[str, FeatureSchema] = {}
+
+
+def register(schema: FeatureSchema) -> FeatureSchema:
+    _registry[schema.name] = schema
+    return schema
+
+
+def get(name: str) -> FeatureSchema:
+    return _registry[name]
+
+
+def _num(key, default=0.0):
+    return lambda row: float(row.get(key) or default)
+
+
+TRANSACTION = register(FeatureSchema('transaction', [
+    ('amount', _num('amount')),
+    ('time', _num('hour')),
+]))
+
+ANOMALY = register(FeatureSchema('anomaly', [
+    ('amount', _num('amount')),
+    ('time', _num('hour')),
+    ('upi_degree', _num('upi_degree')),
+    ('merchant_degree', _num('merchant_degree')),
+]))
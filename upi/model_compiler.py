@@ -0,0 +1,142 @@
+"""Compile fitted sklearn models into plain NumPy evaluators at load time.
+
+Most of a single sklearn prediction on two features is input validation and
+DataFrame handling, not arithmetic. `compile_model` turns:
+
+- `DecisionTreeClassifier` into contiguous node arrays (children, feature,
+  threshold, leaf values),
+- `RandomForestClassifier` into the same arrays for all trees stacked
+  together, walked in lock-step,
+- binary `LogisticRegression` into its coefficient vector and intercept,
+
+and evaluates whole batches with vectorized NumPy. Results match sklearn
+exactly: trees compare float32 inputs against the float64 thresholds like
+sklearn's Cython code, forest probabilities are summed in tree order, and the
+linear model uses the same dot product and `expit`.
+
+Anything else (e.g. the SVC pipeline) is returned as None and stays on the
+pickled model. `MODEL_COMPILE=0` keeps every model on its pickle.
+"""
+import os
+from typing import Dict, Any
+
+import numpy as np
+from scipy.special import expit
+
+ENABLED = os.environ.get('MODEL_COMPILE', '1') != '0'
+
+_LEAF = -1
+
+
+def _as_matrix(X) -> np.ndarray:
+    return np.asarray(X, dtype=np.float64)
+
+
+class _Compiled:
+    classes_ = None
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def _leaf_proba(value) -> np.ndarray:
+    """Rows normalized to sum to 1, like the tree's `predict_proba`.
+
+    Trees fitted before sklearn 1.4 store class counts in `tree_.value`, later
+    ones store fractions; sklearn divides by the row sum either way.
+    """
+    value = np.array(value, dtype=np.float64)
+    normalizer = value.sum(axis=1)[:, None]
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer
+
+
+class CompiledForest(_Compiled):
+    """One or more trees flattened into shared node arrays (a single tree is a forest of one)."""
+
+    def __init__(self, trees, classes, n_features):
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = n_features
+        self.n_trees = len(trees)
+        n_classes = len(self.classes_)
+        offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+        self.roots = offsets.astype(np.intp)
+        left, right, feature, threshold, value = [], [], [], [], []
+        for off, t in zip(offsets, trees):
+            leaf = t.children_left == _LEAF
+            # children become global node ids; leaves point at themselves so walks settle
+            own = np.arange(t.node_count) + off
+            left.append(np.where(leaf, own, t.children_left + off))
+            right.append(np.where(leaf, own, t.children_right + off))
+            feature.append(np.where(leaf, 0, t.feature))
+            threshold.append(t.threshold)
+            value.append(_leaf_proba(t.value[:, 0, :n_classes]))
+        self.left = np.ascontiguousarray(np.concatenate(left), dtype=np.intp)
+        self.right = np.ascontiguousarray(np.concatenate(right), dtype=np.intp)
+        self.feature = np.ascontiguousarray(np.concatenate(feature), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64)
+        self.value = np.ascontiguousarray(np.concatenate(value), dtype=np.float64)
+        self.max_depth = max(t.max_depth for t in trees)
+
+    def leaves(self, X) -> np.ndarray:
+        """Leaf node id per (tree, sample)."""
+        # sklearn's trees evaluate float32 inputs against float64 thresholds
+        X32 = np.asarray(X, dtype=np.float32)
+        n = X32.shape[0]
+        node = np.repeat(self.roots[:, None], n, axis=1)
+        rows = np.arange(n)
+        for _ in range(self.max_depth):
+            x = X32[rows, self.feature[node]]
+            node = np.where(x <= self.threshold[node], self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        values = self.value[self.leaves(X)]  # (trees, samples, classes)
+        if self.n_trees == 1:
+            return values[0].copy()
+        out = np.zeros(values.shape[1:], dtype=np.float64)
+        for v in values:  # tree order, like RandomForestClassifier's accumulation
+            out += v
+        out /= self.n_trees
+        return out
+
+
+class CompiledLinear(_Compiled):
+    """Binary logistic regression: expit(X . coef + intercept)."""
+
+    def __init__(self, coef, intercept, classes):
+        self.classes_ = np.asarray(classes)
+        self.coef_T = np.ascontiguousarray(np.asarray(coef, dtype=np.float64).T)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.n_features_in_ = self.coef_T.shape[0]
+
+    def predict_proba(self, X):
+        scores = (_as_matrix(X) @ self.coef_T + self.intercept).reshape(-1)
+        prob = expit(scores)
+        return np.stack([1 - prob, prob], axis=1)
+
+
+def compile_model(model):
+    """NumPy evaluator for `model`, or None if it is not a supported kind."""
+    kind = type(model).__name__
+    try:
+        if kind == 'DecisionTreeClassifier' and model.n_outputs_ == 1:
+            return CompiledForest([model.tree_], model.classes_, model.n_features_in_)
+        if kind == 'RandomForestClassifier' and model.n_outputs_ == 1:
+            return CompiledForest([e.tree_ for e in model.estimators_], model.classes_, model.n_features_in_)
+        if kind == 'LogisticRegression' and len(model.classes_) == 2:
+            return CompiledLinear(model.coef_, model.intercept_, model.classes_)
+    except AttributeError:
+        pass  # unfitted or from an incompatible sklearn version
+    return None
+
+
+def compile_models(models: Dict[str, Any], enabled: bool = None) -> Dict[str, Any]:
+    """Same mapping with every supported model replaced by its compiled evaluator."""
+    if not (ENABLED if enabled is None else enabled):
+        return dict(models)
+    out = {}
+    for name, model in models.items():
+        compiled = compile_model(model) if model is not None else None
+        out[name] = compiled if compiled is not None else model
+    return out
@@ -0,0 +1,393 @@
+"""The one scoring path behind `/predict`, `/api/ingest`, Celery and replays.
+
+`ScoringPipeline.run(payloads)` takes raw request/task payloads and runs
+these stages, each a method so it can be tuned or swapped on its own:
+
+    parse -> features -> models -> indicators -> analytics -> explanation -> persist -> publish
+
+`features` and `models` run once per batch (one model call per batch); the
+other stages run per row. Rows of the same UPI within a batch are scored in
+order: a row's velocity and profile indicators include the earlier ones.
+Time spent in each stage is accumulated in `stage_timings()`; persist is
+reported as `persist_submit` and `persist_wait`.
+
+The models run concurrently on a persistent thread pool (`MODEL_WORKERS`,
+0 = one after another on the caller's thread); sklearn and NumPy release the
+GIL for much of their work, so a request waits for the slowest model rather
+than the sum. Models that average under `MODEL_PARALLEL_MIN_MS` (e.g. the
+compiled trees) run on the caller's thread while the slow ones are out.
+Per-model latency and errors are kept in `model_timings()`. A model that
+fails or misses `MODEL_TIMEOUT_SECONDS` is reported with `prediction: None`
+and left out of the vote.
+
+The pipeline holds no app state itself; `app` wires in the models, the rule
+indicators, the velocity source, the SHAP explainer, the writer and the event
+publisher.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Tuple, Callable, Iterable
+
+MODEL_WORKERS = int(os.environ.get('MODEL_WORKERS', '4'))
+MODEL_TIMEOUT_SECONDS = float(os.environ.get('MODEL_TIMEOUT_SECONDS', '5'))
+# models averaging less than this run inline on the caller's thread
+MODEL_PARALLEL_MIN_MS = float(os.environ.get('MODEL_PARALLEL_MIN_MS', '0.5'))
+
+# persist is timed in two parts: handing the row to the writer, and waiting for its commit
+STAGES = ('parse', 'features', 'models', 'indicators', 'analytics', 'explanation', 'persist_submit', 'persist_wait', 'publish')
+
+# Rolling velocity windows (feature name -> look-back in minutes)
+VELOCITY_WINDOWS = {'count_1h': 60, 'count_6h': 6 * 60, 'count_24h': 24 * 60, 'count_7d': 7 * 24 * 60}
+
+
+def _now_str():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ScoringPipeline:
+    def __init__(self, models: Dict[str, Any], build_features: Callable, rule_indicators: Callable,
+                 velocity_snapshot: Callable, writer, publish: Callable, record: Callable = None,
+                 analytics=None, explain: Callable = None, write_timeout: float = 10.0,
+                 model_workers: int = MODEL_WORKERS, model_timeout: float = MODEL_TIMEOUT_SECONDS,
+                 parallel_min_ms: float = MODEL_PARALLEL_MIN_MS):
+        self.models = models
+        self.build_features = build_features  # rows -> model input matrix
+        self.rule_indicators = rule_indicators  # (upi, amount, hour, category, merchant, location) -> (indicators, score)
+        self.velocity_snapshot = velocity_snapshot  # (upi, windows) -> {'counts', 'last_tx'}
+        self.writer = writer
+        self.publish = publish
+        self.record = record
+        self.analytics = analytics
+        self.explain = explain
+        self.write_timeout = write_timeout
+        self.model_workers = model_workers
+        self.model_timeout = model_timeout
+        self.parallel_min_ms = parallel_min_ms
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._timings = {stage: [0, 0.0] for stage in STAGES}
+        self._model_timings = {}  # name -> [calls, errors, total seconds, last seconds]
+        self._timings_lock = threading.Lock()
+
+    # -- entry points --
+    def run(self, payloads: Iterable[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Score, persist and publish raw payloads; returns [(transaction, predictions), ...] in order."""
+        with self._timed('parse'):
+            rows = [self.parse(p) for p in payloads]
+        return self.score(rows)
+
+    def score(self, rows: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Like `run` for rows already in `parse` output form."""
+        if not rows:
+            return []
+        with self._timed('features'):
+            matrix = self.build_features(rows)
+        with self._timed('models'):
+            batch_predictions = self.predict(matrix)
+
+        scored = []
+        pending = {}  # upi -> write future of its latest row in this batch
+        for i, row in enumerate(rows):
+            fut = pending.get(row['upi_number'])
+            if fut is not None:
+                try:
+                    fut.result(timeout=self.write_timeout)  # velocity must include the earlier row
+                except Exception:
+                    pass
+            predictions = batch_predictions[i]
+            with self._timed('indicators'):
+                features, indicators, score = self.indicators(row)
+            with self._timed('analytics'):
+                score += self.enrich(row, features, indicators)
+            transaction = self.build_transaction(row, predictions, indicators, score, features)
+            with self._timed('explanation'):
+                transaction['explanation'] = self.explanation(matrix, i)
+            with self._timed('persist_submit'):
+                fut = self.persist(transaction)
+            pending[row['upi_number']] = fut
+            scored.append((transaction, predictions, fut))
+
+        results = []
+        for transaction, predictions, fut in scored:
+            with self._timed('persist_wait'):
+                try:
+                    transaction['id'] = fut.result(timeout=self.write_timeout)
+                except Exception as e:
+                    print(f"Error saving transaction to DB: {e}")
+            with self._timed('publish'):
+                self.publish_result(transaction, predictions)
+            results.append((transaction, predictions))
+        return results
+
+    # -- stages --
+    @staticmethod
+    def parse(payload) -> Dict[str, Any]:
+        """Normalize a form/JSON/task payload (types, defaults, optional behavioral signals)."""
+        payer = payload.get('payer_upi')
+        upi = payer if payer not in (None, '', 'N/A') else (payload.get('upi_number') or payload.get('upi') or 'N/A')
+        row = {
+            'upi_number': upi,
+            'amount': float(payload.get('amount', 0)),
+            'hour': int(payload.get('hour', 0)),
+            'day': int(payload.get('day', 1)),
+            'month': int(payload.get('month', 1)),
+            'year': int(payload.get('year', 2024)),
+            'merchant': payload.get('merchant', 'Unknown Merchant'),
+            'category': payload.get('category', 'Transfer'),
+            'location': payload.get('location', 'Unknown'),
+            'device_id': payload.get('device_id') or None,
+            'behavioral': None,
+        }
+        behavioral = payload.get('behavioral')
+        if behavioral is None and any(k in payload for k in ('paste_detected', 'backspace_ratio', 'focus_changes')):
+            behavioral = payload
+        if behavioral:
+            row['behavioral'] = {
+                'typing_speed': float(behavioral.get('typing_speed', 0) or 0),
+                'backspace_ratio': float(behavioral.get('backspace_ratio', 0) or 0),
+                'hesitation_time': float(behavioral.get('hesitation_time', 0) or 0),
+                'paste_detected': int(behavioral.get('paste_detected', 0) or 0),
+                'focus_changes': int(behavioral.get('focus_changes', 0) or 0),
+            }
+        return row
+
+    def predict(self, matrix) -> List[Dict[str, Dict[str, Any]]]:
+        """Per-row model votes: [{model name: {'prediction', 'confidence'}}, ...].
+
+        Each model is called once for the whole batch (`predict_proba`); the
+        label is the most probable class, so there is no separate `predict` call.
+        Models run in parallel when a pool is configured. Unavailable models
+        (not loaded, failed, timed out) get `prediction: None`.
+        """
+        n = len(matrix)
+        live = {name: model for name, model in self.models.items() if model is not None}
+        outputs = {}
+        pool = self._pool() if len(live) > 1 else None
+        offload = self._slow_models(live) if pool is not None else []
+        if not offload:
+            for name, model in live.items():
+                outputs[name] = self._run_model(name, model, matrix)
+        else:
+            # own copy: a timed-out model may still be reading after the caller reuses its buffer
+            matrix = matrix.copy()
+            futures = {pool.submit(self._run_model, name, live[name], matrix): name for name in offload}
+            # fast models run here meanwhile; a thread hop would cost more than they take
+            for name, model in live.items():
+                if name not in offload:
+                    outputs[name] = self._run_model(name, model, matrix)
+            try:
+                for fut in as_completed(futures, timeout=self.model_timeout):
+                    outputs[futures[fut]] = fut.result()
+            except FuturesTimeout:
+                for fut, name in futures.items():
+                    if name not in outputs:
+                        fut.cancel()
+                        print(f"Model {name} timed out after {self.model_timeout}s")
+                        self._record_model(name, None, error=True, call=False)  # the late finish records the call
+
+        results = [{} for _ in range(n)]
+        for name in self.models:
+            out = outputs.get(name)
+            if out is None:
+                for r in results:
+                    r[name] = {'prediction': None, 'confidence': None}
+                continue
+            labels, confs = out
+            for r, label, conf in zip(results, labels, confs):
+                r[name] = {'prediction': int(label), 'confidence': conf}
+        return results
+
+    def _run_model(self, name, model, matrix):
+        """(labels, confidences) for the batch, or None if the model failed."""
+        started = time.perf_counter()
+        try:
+            if hasattr(model, 'predict_proba'):
+                proba = model.predict_proba(matrix)
+                labels = model.classes_[proba.argmax(axis=1)]
+                confs = [round(float(c) * 100, 2) for c in proba.max(axis=1)]
+            else:
+                labels = model.predict(matrix)
+                confs = [None] * len(labels)
+        except Exception as e:
+            print(f"Error predicting with {name}: {e}")
+            self._record_model(name, time.perf_counter() - started, error=True)
+            return None
+        self._record_model(name, time.perf_counter() - started)
+        return labels, confs
+
+    def _slow_models(self, live) -> List[str]:
+        """Models worth a pool thread: unmeasured ones, or averaging at least `parallel_min_ms`."""
+        with self._timings_lock:
+            stats = {name: self._model_timings.get(name) for name in live}
+        return [name for name, t in stats.items()
+                if t is None or not t[0] or t[2] * 1000 / t[0] >= self.parallel_min_ms]
+
+    def _pool(self):
+        if self.model_workers <= 0:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.model_workers, thread_name_prefix='model')
+            return self._executor
+
+    def close(self):
+        """Shut down the model thread pool (it is recreated on next use)."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def indicators(self, row) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int]:
+        """Velocity features plus rule, location/device-change and behavioral indicators."""
+        upi, device_id, location = row['upi_number'], row['device_id'], row['location']
+        # rolling windows (1h, 6h, 24h, 7d) and last transaction info in one lookup
+        snapshot = self.velocity_snapshot(upi, VELOCITY_WINDOWS.values())
+        last_tx = snapshot['last_tx']
+        features = {name: snapshot['counts'][minutes] for name, minutes in VELOCITY_WINDOWS.items()}
+        if device_id:
+            features['device_id'] = device_id
+
+        indicators, score = self.rule_indicators(upi, row['amount'], row['hour'], row['category'], row['merchant'], location)
+
+        # location/device change: last tx exists and differs within 2 hours
+        if last_tx:
+            try:
+                last_ts = datetime.strptime(last_tx['timestamp'], '%Y-%m-%d %H:%M:%S')
+                diff_minutes = (datetime.now() - last_ts).total_seconds() / 60.0
+                if last_tx.get('location') and last_tx.get('location') != location and diff_minutes < 120:
+                    indicators.append({'name': 'Location Changed', 'description': f'Location changed from {last_tx.get("location")} to {location} within {int(diff_minutes)} minutes', 'risk': 20})
+                    score += 20
+                # attach last tx features for reference
+                features['last_location'] = last_tx.get('location')
+                features['minutes_since_last'] = int(diff_minutes)
+                last_dev = last_tx.get('device_id')
+                if last_dev and device_id and last_dev != device_id and diff_minutes < 120:
+                    indicators.append({'name': 'Device Changed', 'description': f'Device changed from {last_dev} to {device_id} within {int(diff_minutes)} minutes', 'risk': 15})
+                    score += 15
+            except Exception:
+                pass
+
+        # behavioral signals from the web form: a paste with heavy backspacing, or a restless window
+        behavioral = row.get('behavioral')
+        if behavioral:
+            if behavioral['paste_detected'] and behavioral['backspace_ratio'] > 0.2:
+                indicators.append({'name': 'Suspicious Paste Pattern', 'description': 'Detected paste with high backspace ratio', 'risk': 10})
+                score += 10
+            if behavioral['focus_changes'] > 5:
+                indicators.append({'name': 'Multiple Focus Changes', 'description': f'Window focus changed {behavioral["focus_changes"]} times', 'risk': 5})
+                score += 5
+        return features, indicators, score
+
+    def enrich(self, row, features, indicators) -> int:
+        """Graph/anomaly features from `analytics`; returns the extra indicator score."""
+        if self.analytics is None:
+            return 0
+        try:
+            extra = self.analytics.compute_features_for_tx({'upi': row['upi_number'], 'merchant': row['merchant'],
+                                                            'amount': row['amount'], 'hour': row['hour']})
+            if extra:
+                features.update(extra)
+                a_score = float(extra.get('anomaly_score') or 0)
+                if a_score > 0.7:
+                    indicators.append({'name': 'Anomalous Behavior', 'description': f'Anomaly score {a_score:.2f}', 'risk': 30})
+                    return 30
+        except Exception as e:
+            print(f'Analytics error: {e}')
+        return 0
+
+    def build_transaction(self, row, predictions, indicators, indicator_score, features) -> Dict[str, Any]:
+        # majority of the models that actually answered; none answering adds nothing
+        votes = [p['prediction'] for p in predictions.values() if p['prediction'] is not None]
+        fraud_votes = sum(1 for v in votes if v == 1)
+        model_fraud_score = 25 if votes and fraud_votes > len(votes) / 2 else 0
+        fraud_score = min(100, indicator_score + model_fraud_score)
+        fraud = fraud_score >= 50
+        now = _now_str()
+        return {
+            'id': None,
+            'timestamp': now,
+            'upi': row['upi_number'],
+            'amount': row['amount'],
+            'merchant': row['merchant'],
+            'category': row['category'],
+            'location': row['location'],
+            'risk_score': fraud_score,
+            'status': 'Fraud' if fraud else 'Legitimate',
+            'status_color': '#e74c3c' if fraud else '#27ae60',
+            'indicators': indicators,
+            'blocked': 1 if fraud else 0,
+            'blocked_by': 'system' if fraud else None,
+            'blocked_timestamp': now if fraud else None,
+            'features': features,
+        }
+
+    def explanation(self, matrix, i):
+        if self.explain is None:
+            return None
+        try:
+            return self.explain(matrix[i:i + 1].copy())
+        except Exception as e:
+            print(f"Error computing explanation: {e}")
+            return None
+
+    def persist(self, transaction):
+        """Hand the row to the write-behind writer (group-committed); returns the id future."""
+        return self.writer.submit_transaction(transaction)
+
+    def publish_result(self, transaction, predictions):
+        if self.record is not None:
+            self.record(transaction)
+        # audit: if system blocked the transaction, log it
+        try:
+            if transaction.get('blocked'):
+                self.writer.submit_audit('auto_block', actor='system', details={'tx_id': transaction.get('id'), 'upi': transaction['upi'], 'risk_score': transaction['risk_score']})
+        except Exception:
+            pass
+        # profile aggregates are updated in the same DB transaction as the insert
+        self.publish({'type': 'transaction', 'transaction': transaction, 'predictions': predictions, 'explanation': transaction.get('explanation')})
+
+    # -- instrumentation --
+    @contextmanager
+    def _timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._timings_lock:
+                t = self._timings[stage]
+                t[0] += 1
+                t[1] += elapsed
+
+    def stage_timings(self) -> Dict[str, Dict[str, float]]:
+        """{stage: {'calls', 'total_ms', 'avg_ms'}} since start (or the last `reset_timings`)."""
+        with self._timings_lock:
+            return {stage: {'calls': n, 'total_ms': round(total * 1000, 3), 'avg_ms': round(total * 1000 / n, 3) if n else 0.0}
+                    for stage, (n, total) in self._timings.items()}
+
+    def _record_model(self, name, seconds, error=False, call=True):
+        with self._timings_lock:
+            t = self._model_timings.setdefault(name, [0, 0, 0.0, None])
+            t[0] += 1 if call else 0
+            t[1] += 1 if error else 0
+            if seconds is not None:
+                t[2] += seconds
+                t[3] = seconds
+
+    def model_timings(self) -> Dict[str, Dict[str, Any]]:
+        """{model: {'calls', 'errors', 'total_ms', 'avg_ms', 'last_ms'}}; a timeout counts as an error."""
+        with self._timings_lock:
+            return {name: {'calls': n, 'errors': errors, 'total_ms': round(total * 1000, 3),
+                           'avg_ms': round(total * 1000 / n, 3) if n else 0.0,
+                           'last_ms': round(last * 1000, 3) if last is not None else None}
+                    for name, (n, errors, total, last) in self._model_timings.items()}
+
+    def reset_timings(self):
+        with self._timings_lock:
+            for t in self._timings.values():
+                t[0], t[1] = 0, 0.0
+            self._model_timings.clear()
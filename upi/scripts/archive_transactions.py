@@ -0,0 +1,38 @@
+"""Move transactions older than the retention period into monthly archive files.
+
+Usage:
+    python scripts/archive_transactions.py [--db upi.db] [--older-than-days 90] [--dir archive_partitions/] [--vacuum]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive
+import database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='hot database (default: upi.db next to database.py)')
+    parser.add_argument('--older-than-days', type=int, default=archive.RETENTION_DAYS)
+    parser.add_argument('--dir', help='archive directory (default: ARCHIVE_DIR or archive_partitions/ next to the DB)')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM the hot DB afterwards to return freed pages to the OS')
+    args = parser.parse_args(argv)
+
+    database.init_db(db_path=args.db)
+    started = time.time()
+    moved = archive.archive_old_transactions(args.older_than_days, directory=args.dir, batch=args.batch_size)
+    for month, n in moved.items():
+        print(f'  {month}: {n} rows -> {archive.partition_path(month, args.dir)}')
+    if args.vacuum and moved:
+        database.get_conn().execute('VACUUM')
+    print(f'✓ Archived {sum(moved.values())} transactions older than {args.older_than_days} days in {time.time() - started:.1f}s')
+    return moved
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Export transaction history to day-partitioned Parquet (or CSV) files.
+
+Each run continues from the last exported id recorded in the output
+directory, so it can be scheduled (e.g. nightly) to export only new rows.
+
+Usage:
+    python scripts/export_transactions.py exports/ [--db upi.db] [--format parquet|csv]
+    python scripts/export_transactions.py exports/ --since-id 0 --decrypt
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir', help='output directory (partitioned by date=YYYY-MM-DD)')
+    parser.add_argument('--db', help='source database (default: upi.db next to database.py)')
+    parser.add_argument('--format', choices=['parquet', 'csv'], help='default: parquet if pyarrow is installed, else csv')
+    parser.add_argument('--since-id', type=int, help='export rows after this id (default: resume from the last export)')
+    parser.add_argument('--decrypt', action='store_true', help='include decrypted explanation/features columns')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    database.init_db(db_path=args.db)
+    started = time.time()
+    summary = export.export_transactions(args.out_dir, fmt=args.format, since_id=args.since_id,
+                                         decrypt=args.decrypt, chunk=args.chunk_size)
+    print(f"✓ Exported {summary['rows']} transactions ({summary['format']}, {len(summary['files'])} files, "
+          f"last id {summary['last_id']}) to {args.out_dir} in {time.time() - started:.1f}s")
+    return summary
+
+
+if __name__ == '__main__':
+    main()
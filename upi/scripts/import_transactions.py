@@ -0,0 +1,96 @@
+"""Stream historical transactions from CSV or NDJSON into upi.db.
+
+Input uses the `upi_fraud_dataset.csv` layout (`amount`, `time`, `is_fraud`)
+plus `merchant`, `location` and `category`. Optional columns: `upi` (or
+`upi_number`), `timestamp`, `risk_score`, `device_id`. Files ending in `.gz`
+are decompressed on the fly. Rows are read and written one chunk at a time,
+so memory use does not depend on file size.
+
+Usage:
+    python scripts/import_transactions.py history.csv [--db upi.db] [--chunk-size 5000]
+    python scripts/import_transactions.py history.ndjson.gz --date 2025-01-31
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_records(path, fmt=None):
+    """Yield raw records (dicts) from a CSV or NDJSON file."""
+    fmt = fmt or _detect_format(path)
+    with _open_text(path) as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def to_transaction(rec, default_date):
+    """Map a dataset record onto the `transactions` column layout."""
+    is_fraud = str(rec.get('is_fraud') or '0').strip() in ('1', 'true', 'True')
+    timestamp = rec.get('timestamp')
+    if not timestamp:
+        hour = int(float(rec.get('time') or 0)) % 24
+        timestamp = f'{default_date} {hour:02d}:00:00'
+    risk = rec.get('risk_score')
+    return {
+        'timestamp': timestamp,
+        'upi': rec.get('upi') or rec.get('upi_number') or 'unknown',
+        'amount': float(rec.get('amount') or 0),
+        'merchant': rec.get('merchant') or 'Unknown Merchant',
+        'category': rec.get('category') or 'Transfer',
+        'location': rec.get('location') or 'Unknown',
+        'device_id': rec.get('device_id') or None,
+        # labelled history has no model score; map the label onto the risk scale
+        'risk_score': float(risk) if risk not in (None, '') else (100.0 if is_fraud else 0.0),
+        'status': 'Fraud' if is_fraud else 'Legitimate',
+        'indicators': [],
+        'blocked': 1 if is_fraud else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='CSV or NDJSON file (optionally .gz)')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='input format (default: from file extension)')
+    parser.add_argument('--db', help='target database (default: upi.db next to database.py)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--date', default=date.today().isoformat(),
+                        help='date used with the `time` column when rows have no timestamp')
+    args = parser.parse_args(argv)
+
+    database.init_db(db_path=args.db)
+    started = time.time()
+    txs = (to_transaction(rec, args.date) for rec in read_records(args.path, args.format))
+    total = database.save_transactions_bulk(txs, chunk_size=args.chunk_size)
+    elapsed = time.time() - started
+    print(f'✓ Imported {total} transactions into {database.DB_PATH} in {elapsed:.1f}s')
+    return total
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Recompute the /api/stats counters, time-series buckets and sketches from the full transaction history.
+
+All are maintained incrementally on every insert (and block); run this
+after editing `transactions` by hand or restoring an older database file.
+
+Usage:
+    python scripts/rebuild_stats.py [--db upi.db]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import sketches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='database to rebuild (default: upi.db next to database.py)')
+    args = parser.parse_args(argv)
+
+    database.init_db(db_path=args.db)
+    started = time.time()
+    counters = database.rebuild_stats_counters()
+    database.rebuild_stats_buckets()
+    sketches.registry.rebuild()
+    print(f'✓ Rebuilt stats counters, buckets and sketches for {database.DB_PATH} in {time.time() - started:.1f}s: {counters}')
+    return counters
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Re-encrypt stored explanation/features under the current primary key.
+
+Rotation steps:
+  1. Set the new key in DB_ENCRYPTION_KEY and move the old key(s) to
+     DB_ENCRYPTION_KEYS (comma-separated). The app keeps working, because
+     every configured key can decrypt.
+  2. Run this script (offline, or while the app runs; it commits per chunk):
+       python scripts/rotate_encryption_key.py [--db upi.db] [--chunk-size 1000]
+  3. Remove the old key(s) from DB_ENCRYPTION_KEYS.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-encrypt transaction fields under the primary key')
+    parser.add_argument('--db', help='database to rotate (default: upi.db next to database.py)')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if not os.environ.get('DB_ENCRYPTION_KEY'):
+        raise SystemExit('DB_ENCRYPTION_KEY is not set; nothing to rotate to.')
+    database.init_db(db_path=args.db)
+    started = time.time()
+    total = database.reencrypt_transactions(chunk=args.chunk_size)
+    print(f'✓ Re-encrypted {total} transactions in {database.DB_PATH} in {time.time() - started:.1f}s')
+    return total
+
+
+if __name__ == '__main__':
+    main()
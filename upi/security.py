@@ -2,32 +2,60 @@
 import os
 import base64
 import hashlib
-from typing import Optional
+import json
+from typing import Optional, List
 from werkzeug.security import generate_password_hash, check_password_hash
 
 try:
-    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 except Exception:
     Fernet = None
+    MultiFernet = None
 
 import pyotp
 
-# Fernet key should be provided via env var DB_ENCRYPTION_KEY (base64 urlsafe)
+# Fernet key should be provided via env var DB_ENCRYPTION_KEY (base64 urlsafe).
+# For key rotation, list retired keys in DB_ENCRYPTION_KEYS (comma-separated):
+# DB_ENCRYPTION_KEY encrypts, every configured key can decrypt.
 
-def get_fernet():
-    key = os.environ.get('DB_ENCRYPTION_KEY')
-    if not key or Fernet is None:
+_fernet_cache = (None, None)  # (key env values, cipher) - rebuilt only when the env changes
+
+
+def _derive_fernet(key: str):
+    # If user set a raw password-like key, derive a 32-byte key via SHA256 and urlsafe_b64encode
+    if len(key) < 43:  # likely not a valid fernet key
+        k = hashlib.sha256(key.encode('utf-8')).digest()
+        fkey = base64.urlsafe_b64encode(k)
+    else:
+        fkey = key.encode('utf-8')
+    return Fernet(fkey)
+
+
+def _build_fernet(primary: Optional[str], retired: Optional[str]):
+    if Fernet is None:
+        return None
+    keys = [primary] if primary else []
+    for k in (retired or '').split(','):
+        k = k.strip()
+        if k and k not in keys:
+            keys.append(k)
+    if not keys:
         return None
     try:
-        # If user set a raw password-like key, derive a 32-byte key via SHA256 and urlsafe_b64encode
-        if len(key) < 43:  # likely not a valid fernet key
-            k = hashlib.sha256(key.encode('utf-8')).digest()
-            fkey = base64.urlsafe_b64encode(k)
-        else:
-            fkey = key.encode('utf-8')
-        return Fernet(fkey)
+        fernets = [_derive_fernet(k) for k in keys]
     except Exception:
         return None
+    return fernets[0] if len(fernets) == 1 else MultiFernet(fernets)
+
+
+def get_fernet():
+    global _fernet_cache
+    env = (os.environ.get('DB_ENCRYPTION_KEY'), os.environ.get('DB_ENCRYPTION_KEYS'))
+    cached_env, cipher = _fernet_cache
+    if cached_env != env:
+        cipher = _build_fernet(*env)
+        _fernet_cache = (env, cipher)
+    return cipher
 
 
 def encrypt_field(plaintext: Optional[str]) -> Optional[str]:
@@ -54,13 +82,79 @@ def decrypt_field(ciphertext: Optional[str]) -> Optional[str]:
         return ciphertext
 
 
+def encrypt_many(plaintexts: List[Optional[str]]) -> List[Optional[str]]:
+    """Batch `encrypt_field`: resolves the cipher once for the whole list."""
+    f = get_fernet()
+    if f is None:
+        return list(plaintexts)
+    out = []
+    for p in plaintexts:
+        try:
+            out.append(None if p is None else f.encrypt(p.encode('utf-8')).decode('utf-8'))
+        except Exception:
+            out.append(p)
+    return out
+
+
+def decrypt_many(ciphertexts: List[Optional[str]]) -> List[Optional[str]]:
+    """Batch `decrypt_field`: resolves the cipher once for the whole list."""
+    f = get_fernet()
+    if f is None:
+        return list(ciphertexts)
+    out = []
+    for c in ciphertexts:
+        try:
+            out.append(None if c is None else f.decrypt(c.encode('utf-8')).decode('utf-8'))
+        except Exception:
+            out.append(c)
+    return out
+
+
+def rotate_many(values: List[Optional[str]]) -> List[Optional[str]]:
+    """Re-encrypt values under the primary key (offline key rotation).
+
+    Tokens from any configured key are rotated. Legacy plaintext JSON (stored
+    while encryption was off) is encrypted. Anything else is returned unchanged.
+    """
+    f = get_fernet()
+    if f is None:
+        return list(values)
+    out = []
+    for v in values:
+        if v is None:
+            out.append(None)
+            continue
+        try:
+            if isinstance(f, MultiFernet):
+                out.append(f.rotate(v.encode('utf-8')).decode('utf-8'))
+            else:
+                f.decrypt(v.encode('utf-8'))
+                out.append(v)  # single key: already current
+            continue
+        except Exception:
+            pass
+        try:
+            json.loads(v)
+            out.append(f.encrypt(v.encode('utf-8')).decode('utf-8'))
+        except Exception:
+            out.append(v)
+    return out
+
+
 # Tokenization: one-way hash of UPI/VPA/identifier with per-repo salt
 REPO_SALT = os.environ.get('TOKEN_SALT', 'default_salt_should_be_changed')
 
+_salted_hasher = (None, None)  # (salt, sha256 already fed the salt)
+
+
 def tokenize_identifier(identifier: str) -> str:
-    # deterministic one-way hash
-    h = hashlib.sha256()
-    h.update(REPO_SALT.encode('utf-8'))
+    # deterministic one-way hash; copy a pre-salted hasher instead of re-hashing the salt
+    global _salted_hasher
+    salt, base = _salted_hasher
+    if salt != REPO_SALT:
+        base = hashlib.sha256(REPO_SALT.encode('utf-8'))
+        _salted_hasher = (REPO_SALT, base)
+    h = base.copy()
     h.update(identifier.lower().strip().encode('utf-8'))
     return h.hexdigest()
 
@@ -0,0 +1,294 @@
+"""Approximate sketches for the banking report.
+
+- `HyperLogLog`: distinct UPIs per merchant and distinct devices per UPI.
+  Small cardinalities use a sparse register map, so millions of mostly
+  single-device UPIs stay cheap.
+- `SpaceSaving`: top-k merchants and locations by fraud amount.
+
+`registry` observes every saved transaction (through the `transaction_saved`
+listener in `database`) and keeps only the *changes* since its last flush in
+memory. A flush, every `SKETCH_FLUSH_SECONDS` or at exit, merges those deltas
+into one row per sketch in the `sketches` table inside a DB transaction.
+Both sketch types are mergeable, so any number of worker processes can flush
+into the same rows. Reads merge the stored row with this process's unflushed
+delta.
+"""
+import atexit
+import json
+import math
+import os
+import struct
+import threading
+import time
+from hashlib import blake2b
+from typing import Dict, Any, List, Tuple
+
+import database
+
+FLUSH_SECONDS = float(os.environ.get('SKETCH_FLUSH_SECONDS', '10'))
+TOP_K_CAPACITY = int(os.environ.get('SKETCH_TOP_K', '200'))
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog with 2**p registers (standard error ~1.04 / sqrt(2**p))."""
+
+    __slots__ = ('p', 'm', 'sparse', 'registers')
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.sparse = {}  # register index -> rank, until it would outgrow the dense array
+        self.registers = None
+
+    def add(self, value: str):
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        self._set(idx, rank)
+
+    def _set(self, idx: int, rank: int):
+        if self.registers is not None:
+            if rank > self.registers[idx]:
+                self.registers[idx] = rank
+            return
+        if rank > self.sparse.get(idx, 0):
+            self.sparse[idx] = rank
+            if len(self.sparse) > self.m // 8:
+                self._densify()
+
+    def _densify(self):
+        self.registers = bytearray(self.m)
+        for idx, rank in self.sparse.items():
+            self.registers[idx] = rank
+        self.sparse = {}
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.p != self.p:
+            raise ValueError('cannot merge HyperLogLogs of different precision')
+        if other.registers is not None:
+            if self.registers is None:
+                self._densify()
+            self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        else:
+            for idx, rank in other.sparse.items():
+                self._set(idx, rank)
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        if self.registers is not None:
+            values = self.registers
+            zeros = values.count(0)
+            total = sum(2.0 ** -r for r in values)
+        else:
+            zeros = m - len(self.sparse)
+            total = zeros + sum(2.0 ** -r for r in self.sparse.values())
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        if self.registers is not None:
+            return b'D' + bytes([self.p]) + bytes(self.registers)
+        return b'S' + bytes([self.p]) + b''.join(struct.pack('>HB', i, r) for i, r in sorted(self.sparse.items()))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        h = cls(data[1])
+        if data[:1] == b'D':
+            h.registers = bytearray(data[2:])
+        else:
+            h.sparse = {i: r for i, r in struct.iter_unpack('>HB', data[2:])}
+        return h
+
+
+class SpaceSaving:
+    """Weighted Space-Saving heavy hitters: keeps at most `capacity` counters."""
+
+    __slots__ = ('capacity', 'counts')
+
+    def __init__(self, capacity: int = TOP_K_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}  # item -> [count, overestimate]
+
+    def add(self, item: str, weight: float = 1.0):
+        c = self.counts.get(item)
+        if c is not None:
+            c[0] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = [weight, 0.0]
+        else:
+            victim = min(self.counts, key=lambda k: self.counts[k][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[item] = [floor + weight, floor]
+
+    def merge(self, other: 'SpaceSaving'):
+        for item, (count, err) in other.counts.items():
+            c = self.counts.setdefault(item, [0.0, 0.0])
+            c[0] += count
+            c[1] += err
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+            self.counts = dict(keep)
+        return self
+
+    def top(self, n: int = 10) -> List[Tuple[str, float]]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+        return [(item, c[0]) for item, c in ranked]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({'capacity': self.capacity, 'counts': self.counts}).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SpaceSaving':
+        d = json.loads(data)
+        s = cls(d['capacity'])
+        s.counts = d['counts']
+        return s
+
+
+# sketch name -> (factory, deserializer)
+SKETCHES = {
+    'merchant_upis': (lambda: HyperLogLog(12), HyperLogLog.from_bytes),
+    'upi_devices': (lambda: HyperLogLog(10), HyperLogLog.from_bytes),
+    'fraud_merchants': (lambda: SpaceSaving(), SpaceSaving.from_bytes),
+    'fraud_locations': (lambda: SpaceSaving(), SpaceSaving.from_bytes),
+}
+
+
+class SketchRegistry:
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._delta = {}  # (name, key) -> sketch changes not yet flushed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._db_path = None
+
+    def _get(self, name: str, key: str):
+        s = self._delta.get((name, key))
+        if s is None:
+            s = self._delta[(name, key)] = SKETCHES[name][0]()
+        return s
+
+    def observe(self, tx: Dict[str, Any]):
+        upi = tx.get('upi')
+        merchant = tx.get('merchant') or 'Unknown'
+        device_id = tx.get('device_id') or (tx.get('features') or {}).get('device_id')
+        with self._lock:
+            if self._db_path != database.DB_PATH:
+                # deltas belong to the DB they were observed on
+                self._delta.clear()
+                self._db_path = database.DB_PATH
+            if upi:
+                self._get('merchant_upis', merchant).add(upi)
+                if device_id:
+                    self._get('upi_devices', upi).add(str(device_id))
+            if tx.get('status') == 'Fraud':
+                amount = float(tx.get('amount') or 0)
+                self._get('fraud_merchants', '').add(merchant, amount)
+                self._get('fraud_locations', '').add(tx.get('location') or 'Unknown', amount)
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Merge unflushed deltas into the `sketches` table."""
+        with self._flush_lock:
+            with self._lock:
+                delta, self._delta = self._delta, {}
+                current = self._db_path == database.DB_PATH
+                self._last_flush = time.monotonic()
+            if not delta or not current:
+                return
+            try:
+                with database.transaction() as cur:
+                    for (name, key), sketch in delta.items():
+                        cur.execute('SELECT data FROM sketches WHERE name = ? AND key = ?', (name, key))
+                        row = cur.fetchone()
+                        merged = SKETCHES[name][1](row[0]).merge(sketch) if row else sketch
+                        cur.execute('REPLACE INTO sketches (name, key, data, updated_at) VALUES (?, ?, ?, ?)',
+                                    (name, key, merged.to_bytes(), database.datetime_now_str()))
+            except Exception as e:
+                print(f'sketches: flush failed: {e}')
+                with self._lock:
+                    # put the deltas back so the next flush retries them
+                    for k, sketch in delta.items():
+                        pending = self._delta.get(k)
+                        self._delta[k] = sketch.merge(pending) if pending is not None else sketch
+
+    def clear(self):
+        with self._lock:
+            self._delta.clear()
+
+    def _merged(self, name: str, key: str = None) -> Dict[str, Any]:
+        """key -> stored sketch merged with this process's unflushed delta."""
+        cur = database.get_conn().cursor()
+        if key is None:
+            cur.execute('SELECT key, data FROM sketches WHERE name = ?', (name,))
+        else:
+            cur.execute('SELECT key, data FROM sketches WHERE name = ? AND key = ?', (name, key))
+        out = {r[0]: SKETCHES[name][1](r[1]) for r in cur.fetchall()}
+        with self._lock:
+            if self._db_path == database.DB_PATH:
+                for (n, k), sketch in self._delta.items():
+                    if n == name and (key is None or k == key):
+                        copy = SKETCHES[name][1](sketch.to_bytes())
+                        out[k] = out[k].merge(copy) if k in out else copy
+        return out
+
+    def distinct_upis_by_merchant(self) -> Dict[str, int]:
+        return {merchant: h.count() for merchant, h in self._merged('merchant_upis').items()}
+
+    def distinct_devices(self, upi: str) -> int:
+        h = self._merged('upi_devices', upi).get(upi)
+        return h.count() if h is not None else 0
+
+    def top_fraud_merchants(self, n: int = 10) -> List[Tuple[str, float]]:
+        s = self._merged('fraud_merchants', '').get('')
+        return s.top(n) if s is not None else []
+
+    def top_fraud_locations(self, n: int = 10) -> List[Tuple[str, float]]:
+        s = self._merged('fraud_locations', '').get('')
+        return s.top(n) if s is not None else []
+
+    def rebuild(self, chunk: int = 5000):
+        """Recompute all sketches from the transactions table."""
+        self.clear()
+        with database.transaction() as cur:
+            cur.execute('DELETE FROM sketches')
+        with self._lock:
+            self._db_path = database.DB_PATH
+        columns = ('upi', 'merchant', 'device_id', 'status', 'amount', 'location')
+        for t in database.iter_transactions(chunk=chunk, columns=columns):
+            self.observe(t)
+        self.flush()
+
+    def ensure_built(self):
+        """Build sketches from history if the table is empty but transactions exist."""
+        cur = database.get_conn().cursor()
+        if cur.execute('SELECT 1 FROM sketches LIMIT 1').fetchone() is None and \
+                cur.execute('SELECT 1 FROM transactions LIMIT 1').fetchone() is not None:
+            self.rebuild()
+
+
+registry = SketchRegistry()
+atexit.register(registry.flush)
+
+
+def _on_transaction_saved(tx: Dict[str, Any], tx_id: int):
+    registry.observe(tx)
+
+
+def _on_transactions_cleared():
+    registry.clear()
+
+
+database.add_listener('transaction_saved', _on_transaction_saved)
+database.add_listener('transactions_cleared', _on_transactions_cleared)
@@ -0,0 +1,106 @@
+"""Read-only snapshot of the primary database for reporting endpoints.
+
+A background thread copies `upi.db` every `SNAPSHOT_INTERVAL_SECONDS` with
+the SQLite online backup API. It alternates between two files
+(`upi.snapshot0.db` / `upi.snapshot1.db`), so a refresh never overwrites the
+copy readers are currently using. Reporting and export endpoints read inside
+`snapshot.reader()`, which routes `database` calls to the newest copy
+(opened `mode=ro`), and report how old that copy is. The scoring path keeps
+the primary to itself.
+
+When snapshots are disabled (`SNAPSHOT_INTERVAL_SECONDS=0`), not yet taken,
+or stale (older than `SNAPSHOT_MAX_AGE_SECONDS`, e.g. because refreshes keep
+failing), readers use the primary and the age is None.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import quote
+
+import database
+
+INTERVAL_SECONDS = float(os.environ.get('SNAPSHOT_INTERVAL_SECONDS', '60'))
+MAX_AGE_SECONDS = float(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', str(max(3 * INTERVAL_SECONDS, 60))))
+
+
+class SnapshotManager:
+    def __init__(self, interval: float = INTERVAL_SECONDS, max_age: float = MAX_AGE_SECONDS):
+        self.interval = interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._current = None  # (uri, taken_at, source db path) of the newest complete copy
+        self._generation = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def path_for(generation: int, db_path: str = None) -> str:
+        root, ext = os.path.splitext(db_path or database.DB_PATH)
+        return f'{root}.snapshot{generation % 2}{ext or ".db"}'
+
+    def refresh(self) -> str:
+        """Copy the primary into the inactive snapshot file and make it current."""
+        source_path = database.DB_PATH
+        target = self.path_for(self._generation + 1, source_path)
+        src = sqlite3.connect(source_path, timeout=database.BUSY_TIMEOUT_MS / 1000.0)
+        try:
+            dest = sqlite3.connect(target, timeout=database.BUSY_TIMEOUT_MS / 1000.0)
+            try:
+                src.backup(dest)
+                # the copy inherits WAL mode; switch it back so read-only opens need no -shm file
+                dest.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                dest.close()
+        finally:
+            src.close()
+        uri = 'file:' + quote(os.path.abspath(target)) + '?mode=ro'
+        with self._lock:
+            self._generation += 1
+            self._current = (uri, time.time(), source_path)
+        return target
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was taken (None if there is no usable one)."""
+        current = self._usable()
+        return None if current is None else time.time() - current[1]
+
+    def _usable(self):
+        with self._lock:
+            current = self._current
+        if current is None or current[2] != database.DB_PATH or time.time() - current[1] > self.max_age:
+            return None
+        return current
+
+    @contextmanager
+    def reader(self):
+        """Route this thread's database reads to the snapshot; yields its age in seconds (None = primary)."""
+        current = self._usable()
+        if current is None:
+            yield None
+            return
+        with database.use_db(current[0]):
+            yield time.time() - current[1]
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='snapshot-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f'snapshot: refresh failed: {e}')
+            self._stop.wait(self.interval)
+
+
+manager = SnapshotManager()
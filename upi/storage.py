@@ -0,0 +1,608 @@
+"""Storage backends behind the app: transactions, profiles, reputation, users,
+audit log and WebAuthn credentials.
+
+`Storage` is the interface. `SQLiteStorage` delegates to the functions in
+`database` (the production store). `MemoryStorage` keeps everything in
+process memory with no disk I/O, for load tests and benchmarks that want to
+separate scoring cost from storage cost, and for fast tests.
+
+Pick one with `STORAGE_BACKEND=sqlite|memory` (default `sqlite`), or call
+`set_backend()`. Callers go through the module attribute `storage.backend`,
+so a swapped backend takes effect immediately.
+
+The memory backend keeps its own state only: it does not feed the
+`database` listeners (velocity engine, sketches) nor the snapshot replica.
+The app disables those when it is not running on SQLite.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+import database
+
+DEFAULT_WINDOWS = (60, 6 * 60, 24 * 60, 7 * 24 * 60)
+
+
+class Storage(ABC):
+    name = None
+
+    # -- lifecycle --
+    @abstractmethod
+    def init(self):
+        """Create/migrate the schema (idempotent)."""
+
+    def release(self):
+        """End-of-request hook (returns pooled connections)."""
+
+    # -- transactions --
+    @abstractmethod
+    def save_transaction(self, tx: Dict[str, Any]) -> int: ...
+
+    @abstractmethod
+    def save_transactions_bulk(self, txs: Iterable[Dict[str, Any]], chunk_size: int = 1000) -> int: ...
+
+    @abstractmethod
+    def get_transaction_by_id(self, tx_id: int) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_recent_transactions(self, limit: int = 20) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def iter_transactions(self, since_id: int = None, chunk: int = 5000, columns: Iterable[str] = None,
+                          until_epoch: int = None) -> Iterator[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_transactions_with_indicator(self, name: str, limit: int = 20) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def mark_transaction_blocked(self, tx_id: int, blocked_by: str = None) -> bool: ...
+
+    @abstractmethod
+    def clear_transactions(self) -> bool: ...
+
+    @abstractmethod
+    def get_last_transaction_for_upi(self, upi: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def count_transactions_for_upi(self, upi: str, minutes: int = 60) -> int: ...
+
+    @abstractmethod
+    def get_velocity_snapshot(self, upi: str, windows=DEFAULT_WINDOWS) -> Dict[str, Any]: ...
+
+    # -- reporting aggregates --
+    @abstractmethod
+    def get_stats_counters(self) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    def get_stats_timeseries(self, resolution: str, from_epoch: int = None, to_epoch: int = None) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_banking_rollup(self, from_epoch: int = None, to_epoch: int = None) -> Dict[str, Any]: ...
+
+    # -- profiles --
+    @abstractmethod
+    def get_user_profile(self, upi: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def save_user_profile(self, upi: str, profile: Dict[str, Any]): ...
+
+    def set_user_last_seen(self, upi: str, ts: str = None) -> Dict[str, Any]:
+        profile = self.get_user_profile(upi) or {}
+        profile['last_seen'] = ts or database.datetime_now_str()
+        self.save_user_profile(upi, profile)
+        return profile
+
+    @abstractmethod
+    def get_profile_aggregates(self, upi: str, merchant: str = None) -> Optional[Dict[str, Any]]: ...
+
+    # -- reputation --
+    @abstractmethod
+    def get_vpa_reputation(self, vpa_hash: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def set_vpa_reputation(self, vpa_hash: str, flag_count: int = 0, reputation_score: float = 1.0, reasons: list = None) -> bool: ...
+
+    # -- users / MFA --
+    @abstractmethod
+    def create_user(self, upi: str, display_name: str, password_hash: str, mfa_secret: str = None) -> int: ...
+
+    @abstractmethod
+    def get_user_by_upi(self, upi: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def set_mfa_for_user(self, upi: str, secret: str, enabled: bool = True, backup_codes: list = None) -> bool: ...
+
+    @abstractmethod
+    def get_and_consume_backup_code(self, upi: str, code: str) -> bool: ...
+
+    # -- WebAuthn credentials --
+    @abstractmethod
+    def get_webauthn_credentials(self, upi: str) -> list: ...
+
+    @abstractmethod
+    def set_webauthn_credentials(self, upi: str, credentials: list) -> bool: ...
+
+    def add_webauthn_credential(self, upi: str, credential: dict) -> bool:
+        creds = self.get_webauthn_credentials(upi) or []
+        creds.append(credential)
+        return self.set_webauthn_credentials(upi, creds)
+
+    def remove_webauthn_credential(self, upi: str, credential_id: str) -> bool:
+        creds = self.get_webauthn_credentials(upi) or []
+        new_creds = [c for c in creds if str(c.get('id')) != str(credential_id)]
+        if len(new_creds) == len(creds):
+            return False
+        return self.set_webauthn_credentials(upi, new_creds)
+
+    # -- audit --
+    @abstractmethod
+    def log_audit(self, action: str, actor: str = None, details: Dict[str, Any] = None) -> bool: ...
+
+    @abstractmethod
+    def get_recent_audit_logs(self, limit: int = 10) -> List[Dict[str, Any]]: ...
+
+
+class SQLiteStorage(Storage):
+    """The `database` module as a `Storage` (uses its current `DB_PATH`)."""
+
+    name = 'sqlite'
+
+    def init(self):
+        database.init_db()
+
+    def release(self):
+        database.release_conn()
+
+    def save_transaction(self, tx):
+        return database.save_transaction(tx)
+
+    def save_transactions_bulk(self, txs, chunk_size=1000):
+        return database.save_transactions_bulk(txs, chunk_size=chunk_size)
+
+    def get_transaction_by_id(self, tx_id):
+        return database.get_transaction_by_id(tx_id)
+
+    def get_recent_transactions(self, limit=20):
+        return database.get_recent_transactions(limit)
+
+    def iter_transactions(self, since_id=None, chunk=5000, columns=None, until_epoch=None):
+        return database.iter_transactions(since_id=since_id, chunk=chunk, columns=columns, until_epoch=until_epoch)
+
+    def get_transactions_with_indicator(self, name, limit=20):
+        return database.get_transactions_with_indicator(name, limit)
+
+    def mark_transaction_blocked(self, tx_id, blocked_by=None):
+        return database.mark_transaction_blocked(tx_id, blocked_by=blocked_by)
+
+    def clear_transactions(self):
+        return database.clear_transactions()
+
+    def get_last_transaction_for_upi(self, upi):
+        return database.get_last_transaction_for_upi(upi)
+
+    def count_transactions_for_upi(self, upi, minutes=60):
+        return database.count_transactions_for_upi(upi, minutes)
+
+    def get_velocity_snapshot(self, upi, windows=DEFAULT_WINDOWS):
+        return database.get_velocity_snapshot(upi, windows=windows)
+
+    def get_stats_counters(self):
+        return database.get_stats_counters()
+
+    def get_stats_timeseries(self, resolution, from_epoch=None, to_epoch=None):
+        return database.get_stats_timeseries(resolution, from_epoch, to_epoch)
+
+    def get_banking_rollup(self, from_epoch=None, to_epoch=None):
+        return database.get_banking_rollup(from_epoch, to_epoch)
+
+    def get_user_profile(self, upi):
+        return database.get_user_profile(upi)
+
+    def save_user_profile(self, upi, profile):
+        return database.save_user_profile(upi, profile)
+
+    def set_user_last_seen(self, upi, ts=None):
+        return database.set_user_last_seen(upi, ts)
+
+    def get_profile_aggregates(self, upi, merchant=None):
+        return database.get_profile_aggregates(upi, merchant=merchant)
+
+    def get_vpa_reputation(self, vpa_hash):
+        return database.get_vpa_reputation(vpa_hash)
+
+    def set_vpa_reputation(self, vpa_hash, flag_count=0, reputation_score=1.0, reasons=None):
+        return database.set_vpa_reputation(vpa_hash, flag_count, reputation_score, reasons)
+
+    def create_user(self, upi, display_name, password_hash, mfa_secret=None):
+        return database.create_user(upi, display_name, password_hash, mfa_secret)
+
+    def get_user_by_upi(self, upi):
+        return database.get_user_by_upi(upi)
+
+    def set_mfa_for_user(self, upi, secret, enabled=True, backup_codes=None):
+        return database.set_mfa_for_user(upi, secret, enabled=enabled, backup_codes=backup_codes)
+
+    def get_and_consume_backup_code(self, upi, code):
+        return database.get_and_consume_backup_code(upi, code)
+
+    def get_webauthn_credentials(self, upi):
+        return database.get_webauthn_credentials(upi)
+
+    def set_webauthn_credentials(self, upi, credentials):
+        return database.set_webauthn_credentials(upi, credentials)
+
+    def add_webauthn_credential(self, upi, credential):
+        return database.add_webauthn_credential(upi, credential)
+
+    def remove_webauthn_credential(self, upi, credential_id):
+        return database.remove_webauthn_credential(upi, credential_id)
+
+    def log_audit(self, action, actor=None, details=None):
+        return database.log_audit(action, actor, details)
+
+    def get_recent_audit_logs(self, limit=10):
+        return database.get_recent_audit_logs(limit)
+
+
+_TX_COLUMNS = ('id', 'timestamp', 'ts_epoch', 'upi', 'upi_token', 'amount', 'merchant', 'category', 'location', 'device_id',
+               'risk_score', 'status', 'indicators', 'blocked', 'blocked_by', 'blocked_timestamp', 'explanation', 'features')
+
+
+class MemoryStorage(Storage):
+    """Process-local, non-persistent storage with the same behaviour as SQLite.
+
+    Derived aggregates (stats counters, rollups, time-series buckets, profile
+    aggregates, per-UPI epochs for velocity) are maintained on insert like
+    their SQLite tables, so reads stay cheap.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset_all()
+
+    def _reset_all(self):
+        self._reset_transactions()
+        self._profiles = {}  # upi -> profile dict
+        self._reputation = {}  # vpa_hash -> record
+        self._users = {}  # upi -> user row
+        self._audit = []
+        self._next_user_id = 1
+
+    def _reset_transactions(self):
+        self._txs = {}  # id -> row (insertion order == id order)
+        self._next_tx_id = 1
+        self._by_upi = {}  # upi -> ([sorted epochs], last row)
+        self._by_indicator = {}  # indicator name -> [tx ids]
+        self._aggregates = {}  # upi -> profile aggregate dict
+        self._merchants = {}  # upi -> set of merchants
+        self._counters = {'tx_count': 0, 'fraud_count': 0, 'fraud_amount': 0.0, 'risk_sum': 0.0,
+                          'blocked_count': 0, 'last_fraud_timestamp': None}
+        self._last_fraud_epoch = None
+        self._rollup_merchants = {}
+        self._rollup_indicators = {}
+        self._buckets = {}
+
+    def init(self):
+        pass
+
+    # -- transactions --
+    def save_transaction(self, tx):
+        with self._lock:
+            return self._insert(tx)
+
+    def save_transactions_bulk(self, txs, chunk_size=1000):
+        n = 0
+        with self._lock:
+            for tx in txs:
+                self._insert(tx)
+                n += 1
+        return n
+
+    def _insert(self, tx):
+        tx_id = self._next_tx_id
+        self._next_tx_id += 1
+        ts = tx.get('timestamp')
+        epoch = database.timestamp_to_epoch(ts)
+        upi = tx.get('upi')
+        amount = tx.get('amount')
+        status = tx.get('status')
+        indicators = list(tx.get('indicators', []) or [])
+        row = {
+            'id': tx_id, 'timestamp': ts, 'ts_epoch': epoch, 'upi': upi, 'upi_token': None, 'amount': amount,
+            'merchant': tx.get('merchant'), 'category': tx.get('category'), 'location': tx.get('location'),
+            'device_id': tx.get('device_id') or (tx.get('features') or {}).get('device_id'),
+            'risk_score': tx.get('risk_score'), 'status': status, 'indicators': indicators,
+            'blocked': int(tx.get('blocked', 0)), 'blocked_by': tx.get('blocked_by'),
+            'blocked_timestamp': tx.get('blocked_timestamp'),
+            'explanation': tx.get('explanation'), 'features': tx.get('features'),
+        }
+        self._txs[tx_id] = row
+
+        if upi:
+            epochs, last = self._by_upi.get(upi, ([], None))
+            if epoch is not None:
+                bisect.insort(epochs, epoch)
+            if last is None or (epoch or 0, tx_id) >= (last['ts_epoch'] or 0, last['id']):
+                last = row
+            self._by_upi[upi] = (epochs, last)
+            self._update_aggregates(row)
+        for ind in indicators:
+            self._by_indicator.setdefault(database.indicator_name(ind), []).append(tx_id)
+
+        c = self._counters
+        c['tx_count'] += 1
+        c['risk_sum'] += row['risk_score'] or 0
+        c['blocked_count'] += 1 if row['blocked'] else 0
+        if status == 'Fraud':
+            c['fraud_count'] += 1
+            c['fraud_amount'] += amount or 0
+            if epoch is not None and (self._last_fraud_epoch is None or epoch >= self._last_fraud_epoch):
+                self._last_fraud_epoch = epoch
+                c['last_fraud_timestamp'] = ts
+        database.add_to_rollups(self._rollup_merchants, self._rollup_indicators, epoch, ts, row['merchant'], amount, status, indicators)
+        database.add_to_stats_buckets(self._buckets, epoch, amount, status, row['risk_score'])
+        return tx_id
+
+    def _update_aggregates(self, row):
+        upi, amount, epoch = row['upi'], float(row['amount'] or 0), row['ts_epoch']
+        a = self._aggregates.get(upi)
+        if a is None:
+            a = self._aggregates[upi] = {'upi': upi, 'tx_count': 0, 'fraud_count': 0, 'amount_sum': 0.0, 'amount_sq_sum': 0.0,
+                                         'amount_min': None, 'amount_max': None, 'first_epoch': None, 'last_epoch': None,
+                                         'last_timestamp': None, 'last_device_id': None, 'last_location': None}
+        a['tx_count'] += 1
+        a['fraud_count'] += 1 if row['status'] == 'Fraud' else 0
+        a['amount_sum'] += amount
+        a['amount_sq_sum'] += amount * amount
+        a['amount_min'] = amount if a['amount_min'] is None else min(a['amount_min'], amount)
+        a['amount_max'] = amount if a['amount_max'] is None else max(a['amount_max'], amount)
+        if epoch is not None:
+            a['first_epoch'] = epoch if a['first_epoch'] is None else min(a['first_epoch'], epoch)
+            if a['last_epoch'] is None or epoch >= a['last_epoch']:
+                a['last_epoch'] = epoch
+                a['last_timestamp'], a['last_device_id'], a['last_location'] = row['timestamp'], row['device_id'], row['location']
+        self._merchants.setdefault(upi, set()).add(row['merchant'] or '')
+
+    @staticmethod
+    def _copy(row, columns=None):
+        if columns is None:
+            return dict(row)
+        return {c: row[c] for c in columns}
+
+    def get_transaction_by_id(self, tx_id):
+        with self._lock:
+            row = self._txs.get(tx_id)
+            return self._copy(row) if row is not None else None
+
+    def get_recent_transactions(self, limit=20):
+        with self._lock:
+            ids = list(self._txs)[-limit:] if limit > 0 else []
+            return [self._copy(self._txs[i]) for i in ids]
+
+    def iter_transactions(self, since_id=None, chunk=5000, columns=None, until_epoch=None):
+        cols = None
+        if columns is not None:
+            cols = ['id'] + [c for c in columns if c != 'id']
+            unknown = [c for c in cols if c not in _TX_COLUMNS]
+            if unknown:
+                raise ValueError(f'invalid column names: {unknown}')
+        last_id = since_id or 0
+        while True:
+            # same keyset paging as SQLite: the lock is not held while the caller consumes rows
+            with self._lock:
+                page = []
+                for tx_id in range(last_id + 1, self._next_tx_id):
+                    row = self._txs.get(tx_id)
+                    if row is None or (until_epoch is not None and (row['ts_epoch'] is None or row['ts_epoch'] > until_epoch)):
+                        continue
+                    page.append(self._copy(row, cols))
+                    if len(page) >= chunk:
+                        break
+            if not page:
+                return
+            yield from page
+            last_id = page[-1]['id']
+            if len(page) < chunk:
+                return
+
+    def get_transactions_with_indicator(self, name, limit=20):
+        with self._lock:
+            ids = self._by_indicator.get(name, [])[-limit:]
+            return [self._copy(self._txs[i]) for i in ids if i in self._txs]
+
+    def mark_transaction_blocked(self, tx_id, blocked_by=None):
+        with self._lock:
+            row = self._txs.get(tx_id)
+            if row is None:
+                return False
+            if not row['blocked']:
+                self._counters['blocked_count'] += 1
+            row.update(blocked=1, blocked_by=blocked_by, blocked_timestamp=database.datetime_now_str())
+            return True
+
+    def clear_transactions(self):
+        with self._lock:
+            self._reset_transactions()
+        return True
+
+    def get_last_transaction_for_upi(self, upi):
+        with self._lock:
+            entry = self._by_upi.get(upi)
+            return self._copy(entry[1]) if entry else None
+
+    def count_transactions_for_upi(self, upi, minutes=60):
+        return self.get_velocity_snapshot(upi, (minutes,))['counts'][minutes]
+
+    def get_velocity_snapshot(self, upi, windows=DEFAULT_WINDOWS):
+        windows = [int(w) for w in windows]
+        now = int(time.time())
+        with self._lock:
+            epochs, last = self._by_upi.get(upi, ([], None))
+            counts = {w: len(epochs) - bisect.bisect_right(epochs, now - w * 60) for w in windows}
+            last_tx = None
+            if last is not None:
+                last_tx = {'timestamp': last['timestamp'], 'location': last['location'], 'device_id': last['device_id']}
+        return {'counts': counts, 'last_tx': last_tx}
+
+    # -- reporting aggregates --
+    def get_stats_counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def get_stats_timeseries(self, resolution, from_epoch=None, to_epoch=None):
+        if resolution not in database.STATS_RESOLUTIONS:
+            raise ValueError(f'unknown resolution: {resolution!r}')
+        lo = database.local_bucket(int(from_epoch), database.STATS_RESOLUTIONS[resolution]) if from_epoch is not None else None
+        with self._lock:
+            points = sorted((bucket, v) for (res, bucket), v in self._buckets.items()
+                            if res == resolution and (lo is None or bucket >= lo) and (to_epoch is None or bucket < to_epoch))
+        return [{'bucket': b, 'count': v[0], 'fraud_count': v[1], 'amount_at_risk': v[2],
+                 'mean_risk': v[3] / v[0] if v[0] else 0} for b, v in points]
+
+    def get_banking_rollup(self, from_epoch=None, to_epoch=None):
+        lo = database.rollup_bucket(from_epoch) if from_epoch is not None else None
+
+        def in_range(bucket):
+            return (lo is None or bucket >= lo) and (to_epoch is None or bucket < to_epoch)
+
+        merchants, indicators = {}, {}
+        last = (None, None)
+        with self._lock:
+            for (bucket, merchant), v in self._rollup_merchants.items():
+                if not in_range(bucket):
+                    continue
+                m = merchants.setdefault(merchant, {'count': 0, 'fraud_count': 0, 'total_amount': 0.0, 'fraud_amount': 0.0})
+                m['count'] += v[0]
+                m['fraud_count'] += v[1]
+                m['total_amount'] += v[2]
+                m['fraud_amount'] += v[3]
+                if v[4] is not None and (last[0] is None or v[4] > last[0]):
+                    last = (v[4], v[5])
+            for (bucket, name), n in self._rollup_indicators.items():
+                if in_range(bucket):
+                    indicators[name] = indicators.get(name, 0) + n
+        return {'merchants': merchants, 'indicators': indicators, 'last_fraud_timestamp': last[1]}
+
+    # -- profiles --
+    def get_user_profile(self, upi):
+        with self._lock:
+            p = self._profiles.get(upi)
+            return json.loads(p) if p is not None else None
+
+    def save_user_profile(self, upi, profile):
+        # stored serialized, like SQLite, so later caller mutations are not persisted
+        with self._lock:
+            self._profiles[upi] = json.dumps(profile)
+
+    def get_profile_aggregates(self, upi, merchant=None):
+        with self._lock:
+            a = self._aggregates.get(upi)
+            if a is None:
+                return None
+            agg = dict(a)
+            merchants = self._merchants.get(upi, set())
+            agg['merchant_count'] = len(merchants)
+            agg['merchant_seen'] = (merchant or '') in merchants if merchant is not None else None
+        n = agg['tx_count']
+        agg['amount_avg'] = agg['amount_sum'] / n if n else None
+        agg['amount_std'] = max(agg['amount_sq_sum'] / n - agg['amount_avg'] ** 2, 0.0) ** 0.5 if n else None
+        return agg
+
+    # -- reputation --
+    def get_vpa_reputation(self, vpa_hash):
+        with self._lock:
+            rec = self._reputation.get(vpa_hash)
+            return json.loads(json.dumps(rec)) if rec is not None else None
+
+    def set_vpa_reputation(self, vpa_hash, flag_count=0, reputation_score=1.0, reasons=None):
+        with self._lock:
+            self._reputation[vpa_hash] = {'vpa_hash': vpa_hash, 'flag_count': flag_count,
+                                          'reputation_score': reputation_score, 'reasons': list(reasons or [])}
+        return True
+
+    # -- users / MFA --
+    def create_user(self, upi, display_name, password_hash, mfa_secret=None):
+        with self._lock:
+            if upi in self._users:
+                raise ValueError(f'user already exists: {upi}')  # UNIQUE(upi) in SQLite
+            uid = self._next_user_id
+            self._next_user_id += 1
+            self._users[upi] = {'id': uid, 'upi': upi, 'display_name': display_name, 'password_hash': password_hash,
+                                'mfa_enabled': 1 if mfa_secret else 0, 'mfa_secret': mfa_secret, 'mfa_backup_codes': None,
+                                'created_at': database.datetime_now_str(), 'webauthn_credentials': None}
+            return uid
+
+    def get_user_by_upi(self, upi):
+        with self._lock:
+            u = self._users.get(upi)
+            return dict(u) if u is not None else None
+
+    def set_mfa_for_user(self, upi, secret, enabled=True, backup_codes=None):
+        with self._lock:
+            u = self._users.get(upi)
+            if u is None:
+                return False
+            u.update(mfa_secret=secret, mfa_enabled=1 if enabled else 0,
+                     mfa_backup_codes=json.dumps(backup_codes) if backup_codes is not None else None)
+            return True
+
+    def get_and_consume_backup_code(self, upi, code):
+        with self._lock:
+            u = self._users.get(upi)
+            codes = json.loads(u['mfa_backup_codes']) if u and u['mfa_backup_codes'] else []
+            if code not in codes:
+                return False
+            codes.remove(code)
+            u['mfa_backup_codes'] = json.dumps(codes)
+            return True
+
+    # -- WebAuthn credentials --
+    def get_webauthn_credentials(self, upi):
+        with self._lock:
+            u = self._users.get(upi)
+            return json.loads(u['webauthn_credentials']) if u and u['webauthn_credentials'] else []
+
+    def set_webauthn_credentials(self, upi, credentials):
+        with self._lock:
+            u = self._users.get(upi)
+            if u is None:
+                return False
+            u['webauthn_credentials'] = json.dumps(credentials)
+            return True
+
+    # -- audit --
+    def log_audit(self, action, actor=None, details=None):
+        with self._lock:
+            self._audit.append({'id': len(self._audit) + 1, 'timestamp': database.datetime_now_str(), 'action': action,
+                                'actor': actor, 'details': json.loads(json.dumps(details)) if details is not None else None})
+        return True
+
+    def get_recent_audit_logs(self, limit=10):
+        with self._lock:
+            return [dict(l) for l in reversed(self._audit[-limit:])] if limit > 0 else []
+
+
+BACKENDS = {'sqlite': SQLiteStorage, 'memory': MemoryStorage}
+
+
+def create_backend(name: str) -> Storage:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f'unknown storage backend: {name!r} (choose from {", ".join(BACKENDS)})')
+
+
+def set_backend(new_backend: Storage) -> Storage:
+    """Swap the process-wide backend; returns the previous one."""
+    global backend
+    previous, backend = backend, new_backend
+    return previous
+
+
+backend = create_backend(os.environ.get('STORAGE_BACKEND', 'sqlite'))
@@ -17,28 +17,29 @@ celery = Celery('upi', broker=CELERY_BROKER, backend=CELERY_BACKEND)
 
 @celery.task(bind=True)
 def process_transaction_task(self, payload: dict):
-    """Process a transaction in background by delegating to `app.process_transaction()`.
+    """Process a transaction in background through the app's scoring pipeline.
 
-    The payload is expected to contain keys used by `process_transaction`.
+    The payload is parsed like an `/api/ingest` request body.
     """
     try:
         # import lazily to avoid circular import issues at module import time
-        from app import process_transaction
+        from app import score_batch
 
-        upi = payload.get('upi_number') or payload.get('upi')
-        amount = float(payload.get('amount', 0))
-        hour = int(payload.get('hour', 0))
-        day = int(payload.get('day', 1))
-        month = int(payload.get('month', 1))
-        year = int(payload.get('year', 2024))
-        merchant = payload.get('merchant', 'Unknown Merchant')
-        category = payload.get('category', 'Transfer')
-        location = payload.get('location', 'Unknown')
-        device_id = payload.get('device_id')
-
-        tx, preds = process_transaction(upi, amount, hour, day, month, year, merchant, category, location, device_id=device_id)
+        tx, preds = score_batch([payload])[0]
 
         # Return simple JSON-serializable structure
         return {'success': True, 'transaction': tx, 'predictions': preds}
     except Exception as e:
         return {'success': False, 'error': str(e)}
+
+
+@celery.task(bind=True)
+def score_batch_task(self, payloads: list):
+    """Score a list of transaction payloads as one batch via `app.score_batch()`."""
+    try:
+        from app import score_batch
+
+        results = score_batch(payloads)
+        return {'success': True, 'results': [{'transaction': tx, 'predictions': preds} for tx, preds in results]}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
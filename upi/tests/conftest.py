@@ -0,0 +1,44 @@
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+
+# Commit write-behind writes inline so tests can read them back immediately
+os.environ.setdefault('WRITE_BEHIND_MODE', 'sync')
+# Reporting endpoints read the primary DB rather than a periodic snapshot
+os.environ.setdefault('SNAPSHOT_INTERVAL_SECONDS', '0')
+
+import database
+import storage
+
+# Tests that go through the app on SQLite use a throwaway DB, never the tracked upi.db.
+# Set before any test module imports `app`, which opens the DB at import time.
+_SESSION_DIR = tempfile.mkdtemp(prefix='upi-tests-')
+database.DB_PATH = os.path.join(_SESSION_DIR, 'upi.db')
+
+
+def pytest_unconfigure(config):
+    database.release_conn()
+    shutil.rmtree(_SESSION_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    # isolate each test on its own DB file and restore the session DB afterwards
+    previous = database.DB_PATH
+    database.init_db(db_path=str(tmp_path / 'test.db'))
+    yield database.DB_PATH
+    database.release_conn()
+    database.DB_PATH = previous
+
+
+@pytest.fixture
+def memory_backend():
+    # for tests that do not exercise SQLite: no disk I/O at all
+    previous = storage.set_backend(storage.MemoryStorage())
+    yield storage.backend
+    storage.set_backend(previous)
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+import archive
+import database
+
+
+def _ts(days_ago):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - days_ago * 86400))
+
+
+def test_archive_moves_old_rows_and_query_fans_out(temp_db, tmp_path, monkeypatch):
+    # default location: its own folder next to the hot DB, not the tracked archive/
+    monkeypatch.setattr(archive, 'ARCHIVE_DIR', None)
+    arc_dir = archive.archive_dir()
+    assert arc_dir == str(tmp_path / 'archive_partitions')
+    for days_ago in (400, 200, 199, 5, 1):
+        database.save_transaction({'timestamp': _ts(days_ago), 'upi': 'a@upi', 'amount': days_ago,
+                                   'indicators': [{'name': 'High Amount'}]})
+
+    moved = archive.archive_old_transactions(older_than_days=30, directory=arc_dir, batch=1)
+    assert sum(moved.values()) == 3
+    assert len(archive.list_partitions(arc_dir)) == len(moved)
+    hot = [t['amount'] for t in database.iter_transactions(columns=('amount',))]
+    assert hot == [5, 1]
+    # derived rows of archived transactions leave the hot DB too
+    assert database.get_conn().execute('SELECT COUNT(*) FROM transaction_indicators').fetchone()[0] == 2
+
+    rows = archive.query_transactions(directory=arc_dir)
+    assert [r['amount'] for r in rows] == [400, 200, 199, 5, 1]
+    assert [r['id'] for r in rows] == [1, 2, 3, 4, 5]  # ids are preserved
+    recent = archive.query_transactions(from_epoch=time.time() - 250 * 86400, to_epoch=time.time() - 2 * 86400, directory=arc_dir)
+    assert [r['amount'] for r in recent] == [200, 199, 5]
+    assert archive.query_transactions(directory=arc_dir, limit=2)[-1]['amount'] == 200
+
+    # nothing left to move; archives are only attached for the duration of a query
+    assert sum(archive.archive_old_transactions(older_than_days=30, directory=arc_dir).values()) == 0
+    assert [r[1] for r in database.get_conn().execute('PRAGMA database_list')] == ['main']
+
+
+def test_archive_files_are_attached_read_only(temp_db, tmp_path):
+    arc_dir = str(tmp_path / 'archive_partitions')
+    database.save_transaction({'timestamp': _ts(100), 'upi': 'ro@upi', 'amount': 1})
+    (month,) = archive.archive_old_transactions(older_than_days=30, directory=arc_dir)
+    with archive.attached([month], arc_dir) as (alias,):
+        with pytest.raises(Exception):
+            database.get_conn().execute(f'DELETE FROM {alias}.transactions')
+
+
+def test_interrupted_archive_run_is_finished_by_the_next(temp_db, tmp_path, monkeypatch):
+    arc_dir = str(tmp_path / 'archive_partitions')
+    for amount in (1, 2):
+        database.save_transaction({'timestamp': _ts(100), 'upi': 'crash@upi', 'amount': amount})
+    real_transaction, calls = database.transaction, []
+
+    def crash_before_delete():
+        calls.append(1)
+        if len(calls) == 2:  # the copy committed; "crash" before the delete
+            raise RuntimeError('crash')
+        return real_transaction()
+
+    monkeypatch.setattr(database, 'transaction', crash_before_delete)
+    with pytest.raises(RuntimeError):
+        archive.archive_old_transactions(older_than_days=30, directory=arc_dir)
+    monkeypatch.setattr(database, 'transaction', real_transaction)
+    # rows are in both files now, but are returned once
+    assert [r['amount'] for r in archive.query_transactions(directory=arc_dir)] == [1, 2]
+
+    assert sum(archive.archive_old_transactions(older_than_days=30, directory=arc_dir).values()) == 2
+    assert list(database.iter_transactions()) == []
+    (month,) = archive.list_partitions(arc_dir)
+    with archive.attached([month], arc_dir) as (alias,):
+        assert database.get_conn().execute(f'SELECT COUNT(*) FROM {alias}.transactions').fetchone()[0] == 2
+
+
+def test_query_by_upi_matches_tokenized_rows(temp_db, tmp_path):
+    arc_dir = str(tmp_path / 'archive_partitions')
+    if database.tokenize_upi('tok@upi') is None:
+        pytest.skip('tokenization unavailable')
+    for days_ago in (100, 1):
+        database.save_transaction({'timestamp': _ts(days_ago), 'upi': 'tok@upi', 'amount': days_ago})
+    with database.transaction() as cur:
+        cur.execute('UPDATE transactions SET upi = NULL')  # only the token is stored
+    archive.archive_old_transactions(older_than_days=30, directory=arc_dir)
+    assert [r['amount'] for r in archive.query_transactions(upi='tok@upi', directory=arc_dir)] == [100, 1]
+    assert archive.query_transactions(upi='other@upi', directory=arc_dir) == []
+
+
+def test_indicators_are_archived_and_queryable(temp_db, tmp_path):
+    arc_dir = str(tmp_path / 'archive_partitions')
+    for days_ago, names in ((100, ['High Amount']), (100, ['Late Night Transaction']), (1, ['High Amount'])):
+        database.save_transaction({'timestamp': _ts(days_ago), 'upi': 'ind@upi', 'amount': days_ago,
+                                   'indicators': [{'name': n} for n in names]})
+    (month,) = archive.archive_old_transactions(older_than_days=30, directory=arc_dir)
+    with archive.attached([month], arc_dir) as (alias,):
+        names = database.get_conn().execute(f'SELECT tx_id, name FROM {alias}.transaction_indicators ORDER BY tx_id').fetchall()
+    assert [tuple(r) for r in names] == [(1, 'High Amount'), (2, 'Late Night Transaction')]
+    rows = archive.query_transactions(directory=arc_dir, indicator='High Amount')
+    assert [r['id'] for r in rows] == [1, 3]
+    assert [r['id'] for r in archive.query_transactions(directory=arc_dir, indicator='Late Night Transaction')] == [2]
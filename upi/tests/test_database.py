@@ -0,0 +1,299 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+import database
+
+
+def test_connection_is_reused_per_thread(temp_db):
+    assert database.get_conn() is database.get_conn()
+
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(database.get_conn()))
+    t.start()
+    t.join()
+    assert seen[0] is not database.get_conn()
+
+
+def test_released_connection_returns_to_pool(temp_db):
+    conn = database.get_conn()
+    database.release_conn()
+    assert database.get_conn() is conn
+
+
+def test_connection_pragmas(temp_db):
+    cur = database.get_conn().cursor()
+    assert cur.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert cur.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert cur.execute('PRAGMA busy_timeout').fetchone()[0] == database.BUSY_TIMEOUT_MS
+
+
+def test_failed_write_rolls_back(temp_db):
+    with pytest.raises(RuntimeError):
+        with database.transaction() as cur:
+            cur.execute("INSERT INTO audit_log (timestamp, action) VALUES ('t', 'rollback_me')")
+            raise RuntimeError('boom')
+    assert not database.get_conn().in_transaction
+    assert all(l['action'] != 'rollback_me' for l in database.get_recent_audit_logs(10))
+
+
+def test_velocity_count_uses_epoch_index(temp_db):
+    now = database.datetime_now_str()
+    for _ in range(3):
+        database.save_transaction({'timestamp': now, 'upi': 'idx@upi', 'amount': 10})
+    database.save_transaction({'timestamp': '2020-01-01 00:00:00', 'upi': 'idx@upi', 'amount': 10})
+    assert database.count_transactions_for_upi('idx@upi', minutes=60) == 3
+
+    cur = database.get_conn().cursor()
+    plan = ' '.join(r[3] for r in cur.execute(
+        'EXPLAIN QUERY PLAN SELECT COUNT(*) FROM transactions WHERE (upi = ? OR upi_token = ?) AND ts_epoch > ?', ('a', 'b', 0)))
+    assert 'idx_transactions_upi_ts' in plan and 'idx_transactions_upi_token_ts' in plan
+
+
+def test_ts_epoch_backfilled_for_existing_rows(tmp_path):
+    import sqlite3
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, upi TEXT, amount REAL, merchant TEXT, category TEXT, location TEXT, risk_score REAL, status TEXT, indicators TEXT)')
+    conn.execute("INSERT INTO transactions (timestamp, upi) VALUES ('2025-06-01 10:00:00', 'old@upi')")
+    conn.commit()
+    conn.close()
+
+    previous = database.DB_PATH
+    try:
+        database.init_db(db_path=path)
+        row = database.get_conn().execute('SELECT ts_epoch FROM transactions').fetchone()
+        assert row['ts_epoch'] == database.timestamp_to_epoch('2025-06-01 10:00:00')
+    finally:
+        database.release_conn()
+        database.DB_PATH = previous
+
+
+def test_device_id_backfilled_from_features(tmp_path):
+    import json
+    import sqlite3
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, upi TEXT, amount REAL, merchant TEXT, category TEXT, location TEXT, risk_score REAL, status TEXT, indicators TEXT, features TEXT)')
+    for features in ({'device_id': 'old-phone'}, {}, None):
+        raw = json.dumps(features) if features is not None else None
+        if raw and database.security is not None:
+            raw = database.security.encrypt_field(raw)
+        conn.execute("INSERT INTO transactions (timestamp, upi, features) VALUES ('2025-06-01 10:00:00', 'old@upi', ?)", (raw,))
+    conn.commit()
+    conn.close()
+
+    previous = database.DB_PATH
+    try:
+        database.init_db(db_path=path)
+        rows = database.get_conn().execute('SELECT device_id FROM transactions ORDER BY id').fetchall()
+        assert [r['device_id'] for r in rows] == ['old-phone', None, None]
+    finally:
+        database.release_conn()
+        database.DB_PATH = previous
+
+
+def test_velocity_snapshot_single_query(temp_db):
+    assert database.get_velocity_snapshot('snap@upi', windows=[60]) == {'counts': {60: 0}, 'last_tx': None}
+
+    database.save_transaction({'timestamp': '2020-01-01 00:00:00', 'upi': 'snap@upi', 'amount': 5, 'location': 'Old'})
+    database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': 'snap@upi', 'amount': 5,
+                               'location': 'Pune', 'features': {'device_id': 'dev-1'}})
+    snap = database.get_velocity_snapshot('snap@upi', windows=[60, 24 * 60])
+    assert snap['counts'] == {60: 1, 24 * 60: 1}
+    assert snap['last_tx']['location'] == 'Pune'
+    assert snap['last_tx']['device_id'] == 'dev-1'
+
+
+def test_iter_transactions_pages_and_projects(temp_db):
+    database.save_transactions_bulk(
+        {'timestamp': database.datetime_now_str(), 'upi': f'it{i}@upi', 'amount': i, 'status': 'Legitimate',
+         'indicators': [{'name': 'High Amount'}], 'explanation': {'i': i}} for i in range(12))
+
+    rows = list(database.iter_transactions(chunk=5, columns=('amount', 'indicators')))
+    assert [r['id'] for r in rows] == list(range(1, 13))
+    assert set(rows[0]) == {'id', 'amount', 'indicators'}
+    assert rows[0]['indicators'] == [{'name': 'High Amount'}]
+
+    resumed = list(database.iter_transactions(since_id=10, chunk=5))
+    assert [r['id'] for r in resumed] == [11, 12]
+    assert resumed[0]['explanation'] == {'i': 10}
+
+    with pytest.raises(ValueError):
+        list(database.iter_transactions(columns=('amount; DROP TABLE transactions',)))
+
+
+def test_transaction_row_decodes_lazily(temp_db, monkeypatch):
+    import json
+    import pickle
+    import security
+    tx_id = database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': 'lazy@upi', 'amount': 42,
+                                       'status': 'Legitimate', 'indicators': [{'name': 'X'}],
+                                       'explanation': {'why': 'because'}, 'features': {'count_1h': 1}})
+    calls = []
+    real = security.decrypt_field
+    monkeypatch.setattr(security, 'decrypt_field', lambda v: calls.append(v) or real(v))
+
+    row = database.get_transaction_by_id(tx_id)
+    assert row['status'] == 'Legitimate' and row.get('amount') == 42
+    assert calls == [] and not row.is_decoded('features')
+
+    assert row['features'] == {'count_1h': 1}
+    assert len(calls) == 1
+    row['features']
+    assert len(calls) == 1  # cached
+
+    as_dict = dict(row)
+    assert as_dict['explanation'] == {'why': 'because'} and as_dict['indicators'] == [{'name': 'X'}]
+    assert json.loads(json.dumps(row))['explanation'] == {'why': 'because'}
+    assert pickle.loads(pickle.dumps(row)) == as_dict
+
+
+def test_profile_aggregates_follow_inserts(temp_db):
+    for i, (merchant, amount, status) in enumerate([('Amazon', 100.0, 'Legitimate'), ('Flipkart', 300.0, 'Fraud'), ('Amazon', 200.0, 'Legitimate')]):
+        database.save_transaction({'timestamp': f'2025-01-01 10:0{i}:00', 'upi': 'agg@upi', 'amount': amount, 'merchant': merchant,
+                                   'location': f'City{i}', 'device_id': f'd{i}', 'status': status})
+    database.save_transactions_bulk([{'timestamp': '2024-12-31 09:00:00', 'upi': 'agg@upi', 'amount': 400.0, 'merchant': 'Swiggy', 'location': 'Old'}])
+
+    agg = database.get_profile_aggregates('agg@upi', merchant='Amazon')
+    assert agg['tx_count'] == 4 and agg['fraud_count'] == 1
+    assert agg['amount_min'] == 100.0 and agg['amount_max'] == 400.0 and agg['amount_avg'] == 250.0
+    assert agg['merchant_count'] == 3 and agg['merchant_seen'] is True
+    # an older, late-arriving row does not replace the latest device/location
+    assert (agg['last_timestamp'], agg['last_device_id'], agg['last_location']) == ('2025-01-01 10:02:00', 'd2', 'City2')
+    assert database.get_profile_aggregates('agg@upi', merchant='Zomato')['merchant_seen'] is False
+    assert database.get_profile_merchants('agg@upi') == ['Amazon', 'Flipkart', 'Swiggy']
+
+    database.clear_transactions()
+    assert database.get_profile_aggregates('agg@upi') is None
+
+
+def test_profile_aggregates_backfilled_on_upgrade(temp_db):
+    database.save_transaction({'timestamp': '2025-01-01 10:00:00', 'upi': 'old@upi', 'amount': 10.0, 'merchant': 'A', 'location': 'X'})
+    database.save_user_profile('old@upi', {'transactions': [{'merchant': 'A'}], 'last_seen': 'then'})
+    with database.transaction() as cur:
+        cur.execute('DROP TABLE profile_aggregates')
+        cur.execute('DROP TABLE profile_merchants')
+    database.init_db(db_path=temp_db)
+    agg = database.get_profile_aggregates('old@upi', merchant='A')
+    assert agg['tx_count'] == 1 and agg['merchant_seen'] and agg['last_location'] == 'X'
+    assert database.get_user_profile('old@upi') == {'last_seen': 'then'}
+
+
+def test_stats_counters_track_writes_and_rebuild(temp_db):
+    database.save_transaction({'timestamp': '2025-01-01 10:00:00', 'upi': 's@upi', 'amount': 100.0, 'risk_score': 10, 'status': 'Legitimate'})
+    fraud_id = database.save_transaction({'timestamp': '2025-01-01 11:00:00', 'upi': 's@upi', 'amount': 250.0, 'risk_score': 90, 'status': 'Fraud'})
+    database.save_transactions_bulk([{'timestamp': '2025-01-01 09:00:00', 'upi': 's@upi', 'amount': 50.0, 'risk_score': 80, 'status': 'Fraud', 'blocked': 1}])
+    database.mark_transaction_blocked(fraud_id, blocked_by='ops')
+    database.mark_transaction_blocked(fraud_id, blocked_by='ops')  # already blocked: counted once
+
+    counters = database.get_stats_counters()
+    assert counters == {'tx_count': 3, 'fraud_count': 2, 'fraud_amount': 300.0, 'risk_sum': 180.0,
+                        'blocked_count': 2, 'last_fraud_timestamp': '2025-01-01 11:00:00'}
+    with database.transaction() as cur:
+        cur.execute('UPDATE stats_counters SET tx_count = 0')
+    assert database.rebuild_stats_counters() == counters
+
+    database.clear_transactions()
+    assert database.get_stats_counters()['tx_count'] == 0
+
+
+def test_banking_rollups_match_history_and_filter_by_range(temp_db):
+    database.save_transaction({'timestamp': '2025-01-01 10:15:00', 'upi': 'r@upi', 'amount': 100.0, 'merchant': 'Amazon', 'status': 'Legitimate',
+                               'indicators': [{'name': 'High Amount'}]})
+    database.save_transaction({'timestamp': '2025-01-01 10:45:00', 'upi': 'r@upi', 'amount': 300.0, 'merchant': 'Amazon', 'status': 'Fraud',
+                               'indicators': [{'name': 'High Amount'}, {'name': 'Late Night Transaction'}]})
+    database.save_transactions_bulk([{'timestamp': '2025-01-02 09:00:00', 'upi': 'r@upi', 'amount': 50.0, 'merchant': 'Swiggy', 'status': 'Fraud',
+                                      'indicators': ['Unknown Merchant']}])
+
+    everything = database.get_banking_rollup()
+    assert everything['merchants']['Amazon'] == {'count': 2, 'fraud_count': 1, 'total_amount': 400.0, 'fraud_amount': 300.0}
+    assert everything['indicators'] == {'High Amount': 2, 'Late Night Transaction': 1, 'Unknown Merchant': 1}
+    assert everything['last_fraud_timestamp'] == '2025-01-02 09:00:00'
+
+    day_one = database.get_banking_rollup(database.timestamp_to_epoch('2025-01-01 00:00:00'), database.timestamp_to_epoch('2025-01-02 00:00:00'))
+    assert set(day_one['merchants']) == {'Amazon'}
+    assert day_one['last_fraud_timestamp'] == '2025-01-01 10:45:00'
+
+    # rebuilding from history gives the same rollups
+    with database.transaction() as cur:
+        cur.execute('DROP TABLE rollup_merchant_hourly')
+        cur.execute('DROP TABLE rollup_indicator_hourly')
+    database.init_db(db_path=temp_db)
+    assert database.get_banking_rollup() == everything
+
+
+@pytest.fixture
+def ist(monkeypatch):
+    # a half-hour zone, where UTC hours and local hours differ
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_banking_rollups_use_local_hours(ist, temp_db):
+    for ts in ('2025-01-01 09:45:00', '2025-01-01 10:15:00'):
+        database.save_transaction({'timestamp': ts, 'upi': 'h@upi', 'amount': 1.0, 'merchant': 'Amazon', 'status': 'Legitimate'})
+    ten, eleven = database.timestamp_to_epoch('2025-01-01 10:00:00'), database.timestamp_to_epoch('2025-01-01 11:00:00')
+    assert database.get_banking_rollup(ten, eleven)['merchants']['Amazon']['count'] == 1
+    # same range, same answer as the stats timeseries
+    assert [p['count'] for p in database.get_stats_timeseries('1h', ten, eleven)] == [1]
+
+    # rollups from before the switch (UTC-hour buckets) are rebuilt on the next init
+    with database.transaction() as cur:
+        cur.execute('UPDATE rollup_merchant_hourly SET bucket = bucket + 1800')
+    database.init_db(db_path=temp_db)
+    buckets = [r[0] for r in database.get_conn().execute('SELECT bucket FROM rollup_merchant_hourly ORDER BY bucket')]
+    assert buckets == [ten - 3600, ten]
+
+
+def test_transaction_indicators_are_normalized(temp_db):
+    first = database.save_transaction({'timestamp': '2025-01-01 10:00:00', 'upi': 'i@upi', 'amount': 1,
+                                       'indicators': [{'name': 'High Amount', 'risk': 25}, {'name': 'Unknown Merchant', 'risk': 15}]})
+    database.save_transactions_bulk([
+        {'timestamp': '2025-01-01 11:00:00', 'upi': 'i@upi', 'amount': 2, 'indicators': [{'name': 'High Amount', 'risk': 25}]},
+        {'timestamp': '2025-01-01 12:00:00', 'upi': 'i@upi', 'amount': 3, 'indicators': []},
+        {'timestamp': '2025-01-01 13:00:00', 'upi': 'i@upi', 'amount': 4, 'indicators': ['Device Changed']},
+    ])
+    assert database.get_top_indicators() == [('High Amount', 2), ('Device Changed', 1), ('Unknown Merchant', 1)]
+    flagged = database.get_transactions_with_indicator('High Amount')
+    assert [t['amount'] for t in flagged] == [1, 2] and flagged[0]['id'] == first
+    assert database.get_transactions_with_indicator('Device Changed')[0]['amount'] == 4
+
+    # the migration rebuilds the same rows from the JSON column
+    with database.transaction() as cur:
+        before = cur.execute('SELECT tx_id, name_id, risk FROM transaction_indicators ORDER BY rowid').fetchall()
+        cur.execute('DROP TABLE transaction_indicators')
+    database.init_db(db_path=temp_db)
+    after = database.get_conn().execute('SELECT tx_id, name_id, risk FROM transaction_indicators ORDER BY rowid').fetchall()
+    assert [tuple(r) for r in after] == [tuple(r) for r in before]
+    plan = ' '.join(r[3] for r in database.get_conn().execute(
+        "EXPLAIN QUERY PLAN SELECT tx_id FROM transaction_indicators WHERE name_id = 1 ORDER BY tx_id DESC"))
+    assert 'idx_transaction_indicators_name' in plan
+
+
+def test_stats_timeseries_buckets(temp_db):
+    for ts, amount, status, risk in [('2025-01-01 10:00:10', 100.0, 'Fraud', 90), ('2025-01-01 10:00:50', 50.0, 'Legitimate', 10),
+                                     ('2025-01-01 10:05:00', 30.0, 'Fraud', 70), ('2025-01-02 09:00:00', 20.0, 'Legitimate', 20)]:
+        database.save_transaction({'timestamp': ts, 'upi': 'ts@upi', 'amount': amount, 'status': status, 'risk_score': risk})
+    start = database.timestamp_to_epoch('2025-01-01 00:00:00')
+
+    minutes = database.get_stats_timeseries('1m', start, start + 86400)
+    assert [p['bucket'] for p in minutes] == [database.timestamp_to_epoch('2025-01-01 10:00:00'), database.timestamp_to_epoch('2025-01-01 10:05:00')]
+    assert minutes[0] == {'bucket': minutes[0]['bucket'], 'count': 2, 'fraud_count': 1, 'amount_at_risk': 100.0, 'mean_risk': 50.0}
+
+    days = database.get_stats_timeseries('1d')
+    assert [p['bucket'] for p in days] == [start, start + 86400]  # local midnight
+    assert [p['count'] for p in days] == [3, 1]
+
+    before = database.get_stats_timeseries('1h')
+    database.rebuild_stats_buckets()
+    assert database.get_stats_timeseries('1h') == before
+    with pytest.raises(ValueError):
+        database.get_stats_timeseries('5m')
@@ -75,3 +75,44 @@ def test_tokenize_and_encrypt():
 if __name__ == '__main__':
     test_tokenize_and_encrypt()
     print('test_tokenize_and_encrypt: OK')
+
+
+def test_cipher_is_cached_and_batch_apis_roundtrip(monkeypatch):
+    import security
+    monkeypatch.setenv('DB_ENCRYPTION_KEY', 'cache_key')
+    monkeypatch.delenv('DB_ENCRYPTION_KEYS', raising=False)
+    assert security.get_fernet() is security.get_fernet()
+
+    values = ['{"a": 1}', None, 'plain']
+    enc = security.encrypt_many(values)
+    assert enc[1] is None and enc[0] != values[0]
+    assert security.decrypt_many(enc) == values
+    assert security.decrypt_field(enc[2]) == 'plain'
+
+
+def test_key_rotation_reencrypts_rows(tmp_path, monkeypatch):
+    import security
+    previous = database.DB_PATH
+    try:
+        monkeypatch.setenv('DB_ENCRYPTION_KEY', 'old_key')
+        monkeypatch.delenv('DB_ENCRYPTION_KEYS', raising=False)
+        database.init_db(db_path=str(tmp_path / 'rotate.db'))
+        rid = database.save_transaction({'timestamp': '2025-01-01 10:00:00', 'upi': 'rot@upi', 'amount': 1,
+                                         'explanation': {'why': 'x'}, 'features': {'f': 1}})
+        old_raw = database.get_conn().execute('SELECT features FROM transactions WHERE id = ?', (rid,)).fetchone()[0]
+
+        # new primary key, old key retired but still able to decrypt
+        monkeypatch.setenv('DB_ENCRYPTION_KEY', 'new_key')
+        monkeypatch.setenv('DB_ENCRYPTION_KEYS', 'old_key')
+        assert database.get_transaction_by_id(rid)['features'] == {'f': 1}
+        assert database.reencrypt_transactions(chunk=10) == 1
+
+        # only the new key is needed afterwards
+        monkeypatch.delenv('DB_ENCRYPTION_KEYS')
+        row = database.get_transaction_by_id(rid)
+        assert row['features'] == {'f': 1} and row['explanation'] == {'why': 'x'}
+        new_raw = database.get_conn().execute('SELECT features FROM transactions WHERE id = ?', (rid,)).fetchone()[0]
+        assert new_raw != old_raw
+    finally:
+        database.release_conn()
+        database.DB_PATH = previous
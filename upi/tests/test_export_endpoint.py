@@ -0,0 +1,43 @@
+# tests for the streaming transaction export endpoint
+import csv
+import gzip
+import io
+import json
+
+import pytest
+import database
+from app import app
+
+
+@pytest.fixture
+def seeded_db(temp_db):
+    for i in range(5):
+        database.save_transaction({'timestamp': f'2025-01-0{i + 1} 10:00:00', 'upi': 'x@upi', 'amount': float(i),
+                                   'indicators': [{'name': 'High Amount'}], 'features': {'secret': i}})
+    return temp_db
+
+
+def test_ndjson_export_resumes_from_cursor(seeded_db):
+    client = app.test_client()
+    resp = client.get('/api/transactions/export?since_id=2')
+    assert resp.status_code == 200 and resp.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r['id'] for r in rows] == [3, 4, 5]
+    assert rows[0]['indicators'] == '[{"name": "High Amount"}]' and 'features' not in rows[0]
+
+    until = client.get('/api/transactions/export?until=2025-01-02 23:59:59').get_data(as_text=True)
+    assert [json.loads(line)['id'] for line in until.splitlines()] == [1, 2]
+
+
+def test_gzip_csv_export(seeded_db):
+    client = app.test_client()
+    resp = client.get('/api/transactions/export?format=csv', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(resp.get_data()).decode('utf-8'))))
+    assert [r['amount'] for r in rows] == ['0.0', '1.0', '2.0', '3.0', '4.0']
+
+
+def test_export_rejects_bad_params(seeded_db):
+    client = app.test_client()
+    assert client.get('/api/transactions/export?format=xml').status_code == 400
+    assert client.get('/api/transactions/export?until=yesterday').status_code == 400
@@ -0,0 +1,45 @@
+# tests for the feature-schema registry
+import os
+import sys
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+import feature_schema
+
+
+def _fit(model, columns):
+    X = pd.DataFrame(np.random.default_rng(0).normal(size=(50, len(columns))), columns=columns)
+    return model.fit(X, (X.iloc[:, 0] > 0).astype(int))
+
+
+def test_matrix_fills_rows_in_schema_order():
+    schema = feature_schema.get('transaction')
+    assert schema.names == ['amount', 'time']
+    m = schema.matrix([{'amount': 10, 'hour': 3}, {'amount': '2.5', 'hour': None}])
+    assert m.dtype == np.float64 and m.tolist() == [[10.0, 3.0], [2.5, 0.0]]
+    assert np.array_equal(schema.vector({'amount': 1, 'hour': 2}), [[1.0, 2.0]])
+
+
+def test_bind_model_accepts_arrays_without_name_warning():
+    schema = feature_schema.TRANSACTION
+    for model in (_fit(LogisticRegression(), ['amount', 'time']),
+                  _fit(make_pipeline(StandardScaler(), LogisticRegression()), ['amount', 'time'])):
+        schema.bind_model(model)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            model.predict_proba(schema.matrix([{'amount': 1, 'hour': 2}]))
+
+
+def test_bind_model_rejects_other_column_order():
+    model = _fit(LogisticRegression(), ['time', 'amount'])
+    with pytest.raises(ValueError):
+        feature_schema.TRANSACTION.bind_model(model)
+    assert list(model.feature_names_in_) == ['time', 'amount']
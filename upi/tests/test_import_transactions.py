@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts'))
+
+import database
+import import_transactions
+
+
+def test_bulk_insert_and_csv_import(tmp_path):
+    src = tmp_path / 'history.csv'
+    src.write_text('amount,time,is_fraud,merchant,location,category\n'
+                   + ''.join(f'{100 + i},{i % 24},{i % 2},Shop{i % 3},City,Food\n' for i in range(25)))
+    previous = database.DB_PATH
+    try:
+        total = import_transactions.main([str(src), '--db', str(tmp_path / 'import.db'), '--chunk-size', '10', '--date', '2025-01-31'])
+        assert total == 25
+        cur = database.get_conn().cursor()
+        assert cur.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == 25
+        row = cur.execute('SELECT * FROM transactions WHERE id = 2').fetchone()
+        assert row['status'] == 'Fraud' and row['merchant'] == 'Shop1'
+        assert row['timestamp'] == '2025-01-31 01:00:00' and row['ts_epoch'] == database.timestamp_to_epoch('2025-01-31 01:00:00')
+    finally:
+        database.release_conn()
+        database.DB_PATH = previous
@@ -0,0 +1,84 @@
+# parity tests: compiled NumPy evaluators must reproduce sklearn exactly
+import os
+import pickle
+import sys
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+import model_compiler
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+
+
+def _inputs(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    amount = np.concatenate([rng.uniform(0, 100000, n), rng.integers(0, 100000, n).astype(float)])
+    time = np.concatenate([rng.integers(0, 24, n), rng.uniform(0, 24, n)])
+    return pd.DataFrame({'amount': amount, 'time': time})
+
+
+def _load(name):
+    path = os.path.join(MODELS_DIR, f'{name}_model.pkl')
+    if not os.path.exists(path):
+        pytest.skip(f'{path} not present')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+@pytest.mark.parametrize('name', ['decision_tree', 'random_forest', 'logistic_regression'])
+def test_shipped_models_match_sklearn(name):
+    model = _load(name)
+    compiled = model_compiler.compile_model(model)
+    assert compiled is not None
+    X = _inputs()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = model.predict_proba(X)
+    got = compiled.predict_proba(X)
+    assert got.dtype == expected.dtype and np.array_equal(got, expected)
+    assert np.array_equal(compiled.predict(X.to_numpy()), model.classes_[expected.argmax(axis=1)])
+
+
+def test_freshly_fitted_models_match_sklearn():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(500, 3)) * [1000, 5, 0.1]
+    y = ((X[:, 0] > 0) ^ (X[:, 1] > 2)).astype(int)
+    for model in (DecisionTreeClassifier(max_depth=8, random_state=0), RandomForestClassifier(20, random_state=0),
+                  LogisticRegression(max_iter=1000)):
+        model.fit(X, y)
+        Xt = rng.normal(size=(300, 3)) * [1000, 5, 0.1]
+        assert np.array_equal(model_compiler.compile_model(model).predict_proba(Xt), model.predict_proba(Xt))
+
+
+def test_count_valued_leaves_are_normalized():
+    # trees fitted before sklearn 1.4 store class counts in tree_.value
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(300, 2))
+    model = DecisionTreeClassifier(max_depth=5, random_state=0).fit(X, (X[:, 0] > X[:, 1]).astype(int))
+    expected = model.predict_proba(X)
+    model.tree_.value[:] *= model.tree_.weighted_n_node_samples[:, None, None]
+    counts = model.tree_.value[model.apply(X), 0, :]
+    got = model_compiler.compile_model(model).predict_proba(X)
+    assert np.array_equal(got, counts / counts.sum(axis=1, keepdims=True))
+    assert np.allclose(got, expected)
+
+
+def test_unsupported_models_and_switch():
+    svm = _load('support_vector_machine')
+    assert model_compiler.compile_model(svm) is None
+    tree = _load('decision_tree')
+    models = {'decision_tree': tree, 'support_vector_machine': svm, 'missing': None}
+    compiled = model_compiler.compile_models(models, enabled=True)
+    assert isinstance(compiled['decision_tree'], model_compiler.CompiledForest)
+    assert compiled['support_vector_machine'] is svm and compiled['missing'] is None
+    assert model_compiler.compile_models(models, enabled=False) == models
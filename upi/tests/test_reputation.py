@@ -8,7 +8,7 @@ def sha256hex_py(s: str) -> str:
     return hashlib.sha256(s.strip().lower().encode('utf-8')).hexdigest()
 
 
-def test_reputation_endpoint():
+def test_reputation_endpoint(memory_backend):
     client = app.test_client()
     sample_vpa = 'recipient@example'
     h = sha256hex_py(sample_vpa)
@@ -0,0 +1,117 @@
+# tests for the shared scoring pipeline (one predict_proba call per model per batch)
+import sys
+import time
+
+import numpy as np
+import pytest
+import feature_schema
+import pipeline
+import writer
+import app as appmod
+
+
+class CountingModel:
+    def __init__(self, model):
+        self.model = model
+        self.classes_ = model.classes_
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        return self.model.predict_proba(X)
+
+
+def _input(upi, amount, hour=12):
+    return {'upi_number': upi, 'amount': amount, 'hour': hour, 'merchant': 'Shop', 'category': 'Food', 'location': 'Pune'}
+
+
+def test_score_batch_calls_each_model_once(memory_backend, monkeypatch):
+    wrapped = {name: CountingModel(m) for name, m in appmod.models.items() if m is not None}
+    if not wrapped:
+        pytest.skip('no models loaded')
+    monkeypatch.setattr(appmod.scoring, 'models', wrapped)
+    inputs = [_input('a@upi', 100.0), _input('b@upi', 90000.0, hour=2), _input('a@upi', 150.0)]
+    results = appmod.score_batch(inputs)
+
+    assert all(m.calls == 1 for m in wrapped.values())
+    assert [tx['upi'] for tx, _ in results] == ['a@upi', 'b@upi', 'a@upi']
+    assert [tx['id'] for tx, _ in results] == [1, 2, 3]
+    # rows of the same UPI see the earlier ones in the batch
+    assert results[2][0]['features']['count_1h'] == 1
+    # batch scoring gives the same votes as scoring rows one at a time
+    for tx_in, (_, predictions) in zip(inputs, results):
+        single = appmod.scoring.predict(appmod.build_feature_vector(tx_in['amount'], tx_in['hour']))[0]
+        assert predictions == single
+
+
+def test_ingest_accepts_a_batch(memory_backend, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tasks', None)  # no Celery broker here: score inline
+    client = appmod.app.test_client()
+    resp = client.post('/api/ingest', json={'transactions': [{'upi_number': 'x@upi', 'amount': 10},
+                                                             {'upi_number': 'y@upi', 'amount': 20}]})
+    data = resp.get_json()
+    assert data['success'] and [r['transaction']['amount'] for r in data['results']] == [10.0, 20.0]
+    single = client.post('/api/ingest', json={'upi_number': 'z@upi', 'amount': 5}).get_json()
+    assert single['success'] and single['transaction']['upi'] == 'z@upi'
+    assert memory_backend.get_stats_counters()['tx_count'] == 3
+
+
+def test_predict_form_scores_once_and_persists_behavioral_indicators(memory_backend, monkeypatch):
+    wrapped = {name: CountingModel(m) for name, m in appmod.models.items() if m is not None}
+    monkeypatch.setattr(appmod.scoring, 'models', wrapped)
+    appmod.scoring.reset_timings()
+    resp = appmod.app.test_client().post('/predict', data={
+        'amount': '100', 'hour': '12', 'payer_upi': 'p@upi', 'merchant': 'Shop', 'category': 'Food', 'location': 'Pune',
+        'paste_detected': '1', 'backspace_ratio': '0.5', 'focus_changes': '0'})
+    assert resp.status_code == 200
+    assert all(m.calls == 1 for m in wrapped.values())
+    tx = memory_backend.get_recent_transactions(1)[0]
+    assert tx['upi'] == 'p@upi' and 'Suspicious Paste Pattern' in [i['name'] for i in tx['indicators']]
+    timings = appmod.scoring.stage_timings()
+    assert timings['models']['calls'] == 1
+    # one call per row for each half of persist
+    assert timings['persist_submit']['calls'] == timings['persist_wait']['calls'] == 1
+
+
+class FixedModel:
+    classes_ = np.array([0, 1])
+
+    def __init__(self, label, delay=0.0, fail=False):
+        self.label, self.delay, self.fail = label, delay, fail
+
+    def predict_proba(self, X):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('boom')
+        p = np.zeros((len(X), 2))
+        p[:, self.label] = 1.0
+        return p
+
+
+def _pipeline(models, **kw):
+    return pipeline.ScoringPipeline(
+        models, build_features=feature_schema.TRANSACTION.matrix, rule_indicators=lambda *a: ([], 30),
+        velocity_snapshot=lambda upi, windows: {'counts': {w: 0 for w in windows}, 'last_tx': None},
+        writer=writer.WriteBehindWriter(synchronous=True), publish=lambda event: None, **kw)
+
+
+def test_models_run_in_parallel_and_vote_over_available(memory_backend):
+    models = {'a': FixedModel(1, delay=0.2), 'b': FixedModel(1, delay=0.2), 'c': FixedModel(0, fail=True),
+              'd': FixedModel(0, delay=2.0), 'e': None}
+    p = _pipeline(models, model_workers=4, model_timeout=0.5)
+    started = time.perf_counter()
+    (tx, predictions), = p.run([{'upi_number': 'v@upi', 'amount': 10, 'hour': 12}])
+    assert time.perf_counter() - started < 1.0  # not 0.2 + 0.2 + 2.0 in sequence
+    assert [predictions[k]['prediction'] for k in 'abcde'] == [1, 1, None, None, None]
+    # 2 of the 2 answering models vote fraud: 30 + 25
+    assert tx['risk_score'] == 55 and tx['status'] == 'Fraud'
+    timings = p.model_timings()
+    assert timings['a']['calls'] == 1 and timings['a']['last_ms'] >= 200
+    assert timings['c']['errors'] == 1 and timings['d']['errors'] == 1
+    p.close()
+
+
+def test_no_model_answering_adds_no_model_score(memory_backend):
+    p = _pipeline({'a': FixedModel(1, fail=True)}, model_workers=0)
+    (tx, _), = p.run([{'upi_number': 'w@upi', 'amount': 10, 'hour': 12}])
+    assert tx['risk_score'] == 30
@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import database
+import sketches
+
+
+def test_hyperloglog_estimates_and_merges():
+    a, b = sketches.HyperLogLog(12), sketches.HyperLogLog(12)
+    for i in range(20000):
+        (a if i % 2 else b).add(f'user{i}@upi')
+    assert a.registers is not None  # grew out of the sparse representation
+    merged = sketches.HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+    assert abs(merged.count() - 20000) / 20000 < 0.05
+
+    small = sketches.HyperLogLog(10)
+    for d in ('d1', 'd2', 'd3', 'd1'):
+        small.add(d)
+    assert small.registers is None and small.count() == 3
+    assert sketches.HyperLogLog.from_bytes(small.to_bytes()).count() == 3
+
+
+def test_space_saving_keeps_heavy_hitters():
+    s = sketches.SpaceSaving(capacity=5)
+    for i in range(200):
+        s.add(f'noise{i}', 1)
+        if i % 4 == 0:
+            s.add('Amazon', 10)
+        if i % 10 == 0:
+            s.add('Flipkart', 10)
+    top = s.top(2)
+    assert [m for m, _ in top] == ['Amazon', 'Flipkart']
+    assert top[0][1] >= 500
+    restored = sketches.SpaceSaving.from_bytes(s.to_bytes())
+    assert restored.top(2) == top
+
+
+def test_registries_in_different_workers_merge_on_flush(temp_db):
+    w1, w2 = sketches.SketchRegistry(flush_seconds=3600), sketches.SketchRegistry(flush_seconds=3600)
+    w1.observe({'upi': 'a@upi', 'merchant': 'Amazon', 'device_id': 'd1', 'status': 'Fraud', 'amount': 100, 'location': 'Delhi'})
+    w2.observe({'upi': 'b@upi', 'merchant': 'Amazon', 'device_id': 'd1', 'status': 'Fraud', 'amount': 50, 'location': 'Goa'})
+    w2.observe({'upi': 'a@upi', 'merchant': 'Amazon', 'device_id': 'd2', 'status': 'Legitimate', 'amount': 5})
+    # unflushed deltas are visible to their own process only
+    assert w1.distinct_devices('a@upi') == 1
+    w1.flush()
+    w2.flush()
+    reader = sketches.SketchRegistry()
+    assert reader.distinct_upis_by_merchant() == {'Amazon': 2}
+    assert reader.distinct_devices('a@upi') == 2
+    assert reader.top_fraud_merchants() == [('Amazon', 150.0)]
+    assert reader.top_fraud_locations(1) == [('Delhi', 100.0)]
+
+
+def test_rebuild_from_history(temp_db):
+    for i in range(10):
+        database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': f'u{i % 3}@upi', 'amount': 10,
+                                   'merchant': 'Swiggy', 'status': 'Fraud' if i < 2 else 'Legitimate', 'location': 'Pune'})
+    registry = sketches.SketchRegistry()
+    registry.rebuild()
+    assert registry.distinct_upis_by_merchant() == {'Swiggy': 3}
+    assert registry.top_fraud_locations() == [('Pune', 20.0)]
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+import database
+import snapshot
+
+
+def _save(upi):
+    database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': upi, 'amount': 1})
+
+
+def test_reader_sees_snapshot_not_later_writes(temp_db):
+    mgr = snapshot.SnapshotManager(interval=0, max_age=60)
+    with mgr.reader() as age:
+        assert age is None  # no snapshot yet: primary
+    _save('before@upi')
+    first = mgr.refresh()
+    _save('after@upi')
+
+    with mgr.reader() as age:
+        assert 0 <= age < 60
+        assert [t['upi'] for t in database.get_recent_transactions(10)] == ['before@upi']
+        with pytest.raises(Exception):
+            database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': 'ro@upi', 'amount': 1})
+    assert len(database.get_recent_transactions(10)) == 2  # primary is untouched outside the reader
+
+    # the next refresh goes to the other file and picks up the new row
+    second = mgr.refresh()
+    assert second != first
+    with mgr.reader():
+        assert len(database.get_recent_transactions(10)) == 2
+
+
+def test_stale_snapshot_falls_back_to_primary(temp_db):
+    mgr = snapshot.SnapshotManager(interval=0, max_age=-1)
+    mgr.refresh()
+    assert mgr.age() is None
+    with mgr.reader() as age:
+        assert age is None
+
+
+def test_stats_endpoint_reports_snapshot_age(temp_db, monkeypatch):
+    from app import app
+    mgr = snapshot.SnapshotManager(interval=0, max_age=60)
+    monkeypatch.setattr(snapshot, 'manager', mgr)
+    client = app.test_client()
+    assert client.get('/api/stats').get_json()['snapshot_age_seconds'] is None
+    _save('stats@upi')
+    mgr.refresh()
+    _save('late@upi')
+    data = client.get('/api/stats').get_json()
+    assert data['snapshot_age_seconds'] is not None and data['total_transactions'] == 1
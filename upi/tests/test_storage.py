@@ -0,0 +1,137 @@
+# contract tests run against both storage backends, plus the app on the memory backend
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+import database
+import storage
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield storage.MemoryStorage()
+        return
+    previous = database.DB_PATH
+    database.init_db(db_path=str(tmp_path / 'storage.db'))
+    yield storage.SQLiteStorage()
+    database.release_conn()
+    database.DB_PATH = previous
+
+
+def _tx(ts, upi='s@upi', amount=100.0, status='Legitimate', **extra):
+    return dict({'timestamp': ts, 'upi': upi, 'amount': amount, 'merchant': 'Shop', 'location': 'Pune',
+                 'risk_score': 80 if status == 'Fraud' else 10, 'status': status,
+                 'indicators': [{'name': 'High Amount'}] if status == 'Fraud' else [],
+                 'features': {'amount': amount}}, **extra)
+
+
+def test_transactions_and_aggregates(backend):
+    a = backend.save_transaction(_tx('2025-01-01 10:00:00', amount=100.0))
+    b = backend.save_transaction(_tx('2025-01-01 10:30:00', amount=300.0, status='Fraud', device_id='d1'))
+    assert backend.save_transactions_bulk([_tx('2025-01-01 11:00:00', upi='o@upi')]) == 1
+
+    assert [t['id'] for t in backend.get_recent_transactions(2)] == [b, b + 1]
+    tx = backend.get_transaction_by_id(b)
+    assert tx['features'] == {'amount': 300.0} and tx['indicators'] == [{'name': 'High Amount'}]
+    assert [t['id'] for t in backend.get_transactions_with_indicator('High Amount')] == [b]
+    assert [t['upi'] for t in backend.iter_transactions(since_id=a, columns=('upi',))] == ['s@upi', 'o@upi']
+    assert backend.get_last_transaction_for_upi('s@upi')['id'] == b
+
+    assert backend.mark_transaction_blocked(b, blocked_by='op')
+    assert backend.mark_transaction_blocked(b, blocked_by='op')  # counted once
+    counters = backend.get_stats_counters()
+    assert (counters['tx_count'], counters['fraud_count'], counters['blocked_count']) == (3, 1, 1)
+    assert counters['fraud_amount'] == 300.0 and counters['last_fraud_timestamp'] == '2025-01-01 10:30:00'
+
+    agg = backend.get_profile_aggregates('s@upi', merchant='Shop')
+    assert agg['tx_count'] == 2 and agg['amount_avg'] == 200.0 and agg['amount_std'] == 100.0
+    assert agg['merchant_seen'] is True and agg['last_device_id'] == 'd1'
+    assert backend.get_profile_aggregates('s@upi', merchant='Elsewhere')['merchant_seen'] is False
+
+    rollup = backend.get_banking_rollup()
+    assert rollup['merchants']['Shop'] == {'count': 3, 'fraud_count': 1, 'total_amount': 500.0, 'fraud_amount': 300.0}
+    assert rollup['indicators'] == {'High Amount': 1}
+    hours = backend.get_stats_timeseries('1h')
+    assert [p['count'] for p in hours] == [2, 1] and hours[0]['fraud_count'] == 1
+
+    assert backend.clear_transactions()
+    assert backend.get_recent_transactions(5) == [] and backend.get_stats_counters()['tx_count'] == 0
+
+
+def test_velocity_counts_windows(backend):
+    now = int(time.time())
+    for age in (30, 90 * 60):
+        backend.save_transaction(_tx(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - age))))
+    snap = backend.get_velocity_snapshot('s@upi', windows=(60, 24 * 60))
+    assert snap['counts'] == {60: 1, 24 * 60: 2} and snap['last_tx']['location'] == 'Pune'
+    assert backend.count_transactions_for_upi('s@upi', 60) == 1
+    assert backend.get_velocity_snapshot('none@upi')['last_tx'] is None
+
+
+def test_users_profiles_reputation_and_audit(backend):
+    backend.create_user('u@upi', 'U', 'hash')
+    assert backend.get_user_by_upi('u@upi')['display_name'] == 'U'
+    assert backend.set_mfa_for_user('u@upi', 'SECRET', backup_codes=['a', 'b'])
+    assert backend.get_and_consume_backup_code('u@upi', 'a')
+    assert not backend.get_and_consume_backup_code('u@upi', 'a')
+
+    backend.add_webauthn_credential('u@upi', {'id': 'c1'})
+    backend.add_webauthn_credential('u@upi', {'id': 'c2'})
+    assert backend.remove_webauthn_credential('u@upi', 'c1')
+    assert backend.get_webauthn_credentials('u@upi') == [{'id': 'c2'}]
+
+    backend.save_user_profile('u@upi', {'name': 'U'})
+    assert backend.set_user_last_seen('u@upi', '2025-01-01 00:00:00')['name'] == 'U'
+    assert backend.get_user_profile('u@upi') == {'name': 'U', 'last_seen': '2025-01-01 00:00:00'}
+
+    backend.set_vpa_reputation('h1', flag_count=2, reputation_score=0.3, reasons=['x'])
+    rep = backend.get_vpa_reputation('h1')
+    assert (rep['flag_count'], rep['reputation_score'], rep['reasons']) == (2, 0.3, ['x'])
+    assert backend.get_vpa_reputation('missing') is None
+
+    backend.log_audit('first', actor='t')
+    backend.log_audit('second', details={'k': 1})
+    logs = backend.get_recent_audit_logs(2)
+    assert [l['action'] for l in logs] == ['second', 'first'] and logs[0]['details'] == {'k': 1}
+
+
+def test_app_runs_on_memory_backend():
+    import app as appmod
+    sqlite_count = database.get_stats_counters()['tx_count']
+    previous = storage.set_backend(storage.MemoryStorage())
+    try:
+        transaction, _ = appmod.process_transaction('m@upi', 60000.0, 2, 1, 1, 2025, 'Shop', 'Shopping', 'Pune')
+        client = appmod.app.test_client()
+        txs = client.get('/api/transactions').get_json()['transactions']
+        assert [t['id'] for t in txs] == [transaction['id']]
+        assert client.get('/api/stats').get_json()['total_transactions'] == 1
+        assert client.get('/api/user/m@upi').get_json()['profile']['aggregates']['tx_count'] == 1
+        assert client.post('/api/block', json={'id': transaction['id']}).get_json()['success']
+        assert client.get('/api/banking-report').get_json()['total_transactions_analyzed'] == 1
+    finally:
+        storage.set_backend(previous)
+    assert database.get_stats_counters()['tx_count'] == sqlite_count  # nothing reached SQLite
+
+
+def test_backup_code_login_uses_active_backend(memory_backend):
+    import app as appmod
+    memory_backend.create_user('mfa@upi', 'MFA', 'hash')
+    memory_backend.set_mfa_for_user('mfa@upi', 'JBSWY3DPEHPK3PXP', backup_codes=['0a1b2c3d'])
+    client = appmod.app.test_client()
+    with client.session_transaction() as sess:
+        sess['pending_mfa_user'] = 'mfa@upi'
+    resp = client.post('/mfa', data={'token': '0a1b2c3d'})
+    assert resp.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess['user']['upi'] == 'mfa@upi' and 'pending_mfa_user' not in sess
+    # consumed: the same code does not work twice
+    assert not memory_backend.get_and_consume_backup_code('mfa@upi', '0a1b2c3d')
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        storage.create_backend('nosuch')
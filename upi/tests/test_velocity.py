@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import database
+import velocity
+
+
+def test_ring_counts_and_eviction():
+    ring = velocity._Ring(4)
+    for epoch in (10, 20, 30, 40, 50, 60):
+        ring.append(epoch)
+    assert ring.count_after(35) == 3
+    assert ring.count_after(20) == 4
+    # 10 and 20 were evicted, so a window reaching past them cannot be answered exactly
+    assert ring.count_after(5) is None
+
+
+def test_ring_grows_to_capacity():
+    ring = velocity._Ring(512)
+    ring.append(10)
+    assert len(ring.buf) == 1
+    for epoch in range(11, 600):
+        ring.append(epoch)
+    assert len(ring.buf) == 512 and ring.size == 512
+    assert ring.newest() == 599 and ring._at(0) == 88
+
+
+def test_ring_out_of_order_append():
+    ring = velocity._Ring(8)
+    for epoch in (10, 30, 20):
+        ring.append(epoch)
+    assert [ring._at(i) for i in range(ring.size)] == [10, 20, 30]
+    assert ring.count_after(15) == 2
+
+
+def test_engine_matches_database_snapshot(temp_db):
+    engine = velocity.VelocityEngine(capacity=16)
+    now = int(time.time())
+    fmt = '%Y-%m-%d %H:%M:%S'
+    for minutes_ago in (5, 90, 600, 3000):
+        ts = time.strftime(fmt, time.localtime(now - minutes_ago * 60))
+        database.save_transaction({'timestamp': ts, 'upi': 'mem@upi', 'amount': 1, 'location': 'Delhi'})
+    engine.rehydrate()
+
+    windows = [60, 6 * 60, 24 * 60, 7 * 24 * 60]
+    assert engine.snapshot('mem@upi', windows) == database.get_velocity_snapshot('mem@upi', windows)
+    # unknown UPIs defer to the database
+    assert engine.snapshot('nobody@upi', windows) is None
+
+
+def test_engine_sweeps_upis_idle_past_horizon():
+    engine = velocity.VelocityEngine(capacity=16, horizon_minutes=60)
+    now = int(time.time())
+    engine.record('old@upi', now - 2 * 3600)
+    engine.record('new@upi', now - 60)
+    assert len(engine) == 2
+    assert engine.sweep() == 1
+    assert len(engine) == 1 and 'old@upi' not in engine._last
+
+
+def test_engine_follows_saves_and_clear(temp_db):
+    velocity.engine.rehydrate()
+    database.save_transaction({'timestamp': database.datetime_now_str(), 'upi': 'live@upi', 'amount': 1,
+                               'location': 'Goa', 'features': {'device_id': 'd-9'}})
+    snap = velocity.engine.snapshot('live@upi', [60])
+    assert snap['counts'] == {60: 1}
+    assert snap['last_tx']['device_id'] == 'd-9'
+
+    database.clear_transactions()
+    assert velocity.engine.snapshot('live@upi', [60]) is None
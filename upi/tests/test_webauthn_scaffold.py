@@ -11,7 +11,7 @@ def test_webauthn_module_available():
     assert callable(webauthn.is_supported)
 
 
-def test_begin_registration_demo_endpoint():
+def test_begin_registration_demo_endpoint(memory_backend):
     # Use Flask test client to exercise the route (ensures session context exists)
     client = app.test_client()
     res = client.post('/webauthn/register/begin', json={'upi': 'tester@upi'})
@@ -4,7 +4,7 @@ os.environ['PYTHONPATH'] = os.environ.get('PYTHONPATH', '') + ('' if os.environ.
 from app import app
 
 
-def test_webauthn_manage_contains_register_button():
+def test_webauthn_manage_contains_register_button(memory_backend):
     client = app.test_client()
     res = client.get('/webauthn_manage')
     assert res.status_code == 200
@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+import database
+from writer import WriteBehindWriter
+
+
+def _tx(i):
+    return {'timestamp': database.datetime_now_str(), 'upi': f'w{i}@upi', 'amount': float(i), 'status': 'Legitimate'}
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_async_writer_group_commits_and_returns_ids(temp_db):
+    w = WriteBehindWriter(batch_rows=50, batch_ms=50)
+    try:
+        futures = [w.submit_transaction(_tx(i)) for i in range(20)]
+        audit = w.submit_audit('bulk_test', actor='tests', details={'n': 20})
+        ids = [f.result(timeout=5) for f in futures]
+        audit.result(timeout=5)
+    finally:
+        w.close()
+    assert ids == sorted(ids) and len(set(ids)) == 20
+    assert database.get_transaction_by_id(ids[-1])['upi'] == 'w19@upi'
+    assert database.get_recent_audit_logs(1)[0]['action'] == 'bulk_test'
+
+
+def test_flush_waits_for_pending_writes(temp_db):
+    w = WriteBehindWriter(batch_rows=1000, batch_ms=200)
+    try:
+        w.submit_audit('flush_test')
+        w.flush(timeout=5)
+        assert database.get_recent_audit_logs(1)[0]['action'] == 'flush_test'
+    finally:
+        w.close()
+
+
+def test_failed_write_does_not_sink_batch(temp_db):
+    w = WriteBehindWriter(batch_rows=10, batch_ms=200)
+    try:
+        bad = w.submit_transaction({'timestamp': database.datetime_now_str(), 'upi': 'bad@upi', 'amount': object()})
+        good = w.submit_transaction(_tx(1))
+        with pytest.raises(Exception):
+            bad.result(timeout=5)
+        assert good.result(timeout=5) > 0
+    finally:
+        w.close()
+
+
+def test_submit_during_close_is_written(temp_db, monkeypatch):
+    w = WriteBehindWriter(batch_rows=10, batch_ms=1)
+    gate = threading.Event()
+    write_batch, held = w._write_batch, []
+
+    def slow_first_batch(batch):
+        if not held:
+            held.append(batch)
+            gate.wait(5)
+        write_batch(batch)
+
+    monkeypatch.setattr(w, '_write_batch', slow_first_batch)
+    first = w.submit_transaction(_tx(1))
+    _wait_until(lambda: held)
+    queued = w.submit_transaction(_tx(2))  # still in the queue when close() starts
+    closer = threading.Thread(target=w.close)
+    closer.start()
+    _wait_until(lambda: w._stopping)
+    late = w.submit_transaction(_tx(3))  # the writer is shutting down: written inline
+    gate.set()
+    closer.join(5)
+    assert all(f.result(timeout=5) > 0 for f in (first, queued, late))
+    assert database.get_stats_counters()['tx_count'] == 3
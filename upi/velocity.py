@@ -0,0 +1,193 @@
+"""In-process sliding-window velocity counters.
+
+Keeps a bounded, array-backed ring of transaction epochs per UPI so rolling
+window counts (`count_1h`, `count_24h`, ...) are answered from memory with a
+binary search instead of a SQLite query. Rings grow with the UPI's activity up
+to `MAX_EVENTS_PER_KEY`, and UPIs with nothing inside the horizon are swept
+out every `VELOCITY_SWEEP_SECONDS`. The engine is rehydrated from the
+`transactions` table at startup and updated through the
+`transaction_saved` listener in `database`.
+
+State is per process: writes made by other processes (e.g. a Celery worker)
+are not seen. Whenever the engine cannot answer exactly it returns None and
+callers fall back to `database.get_velocity_snapshot`.
+"""
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Any, Iterable, Optional
+
+import database
+
+# Max epochs retained per UPI; counts stay exact while a window fits in the ring
+MAX_EVENTS_PER_KEY = int(os.environ.get('VELOCITY_MAX_EVENTS', '512'))
+# Longest window the engine serves (and how far back rehydration reads)
+HORIZON_MINUTES = int(os.environ.get('VELOCITY_HORIZON_MINUTES', str(7 * 24 * 60)))
+# How often record() drops UPIs whose newest epoch has left the horizon
+SWEEP_SECONDS = int(os.environ.get('VELOCITY_SWEEP_SECONDS', '60'))
+
+
+class _Ring:
+    """Circular buffer of ascending epoch seconds; grows on demand up to `capacity`."""
+
+    __slots__ = ('buf', 'capacity', 'start', 'size', 'evicted_max')
+
+    def __init__(self, capacity: int):
+        self.buf = array('q')
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        # newest epoch pushed out of the ring; windows reaching past it are inexact
+        self.evicted_max = None
+
+    def _at(self, i: int) -> int:
+        return self.buf[(self.start + i) % len(self.buf)]
+
+    def newest(self) -> int:
+        return self._at(self.size - 1)
+
+    def append(self, epoch: int):
+        if self.size and epoch < self.newest():
+            # out-of-order insert (e.g. replayed history): rebuild in sorted order
+            values = sorted([self._at(i) for i in range(self.size)] + [epoch])
+            self.buf, self.start, self.size = array('q'), 0, 0
+            for v in values:
+                self._push(v)
+            return
+        self._push(epoch)
+
+    def _push(self, epoch: int):
+        cap = self.capacity
+        if self.size < cap:
+            # not yet wrapped (start is 0), so the buffer just grows
+            self.buf.append(epoch)
+            self.size += 1
+            return
+        evicted = self.buf[self.start]
+        self.evicted_max = evicted if self.evicted_max is None else max(self.evicted_max, evicted)
+        self.buf[self.start] = epoch
+        self.start = (self.start + 1) % cap
+
+    def count_after(self, cutoff: int) -> Optional[int]:
+        """Number of epochs strictly greater than `cutoff`, or None if some were evicted."""
+        if self.evicted_max is not None and self.evicted_max > cutoff:
+            return None
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at(mid) > cutoff:
+                hi = mid
+            else:
+                lo = mid + 1
+        return self.size - lo
+
+
+class VelocityEngine:
+    def __init__(self, capacity: int = MAX_EVENTS_PER_KEY, horizon_minutes: int = HORIZON_MINUTES):
+        self.capacity = capacity
+        self.horizon_minutes = horizon_minutes
+        self._rings = {}  # upi -> _Ring
+        self._last = {}  # upi -> (epoch, timestamp, location, device_id)
+        self._lock = threading.Lock()
+        self._db_path = None  # DB this engine mirrors; None until rehydrated
+        self._swept_at = time.time()
+
+    def rehydrate(self):
+        """Reload the engine from transactions inside the horizon of the current DB."""
+        cutoff = int(time.time()) - self.horizon_minutes * 60
+        cur = database.get_conn().cursor()
+        cur.execute('SELECT upi, ts_epoch, timestamp, location, device_id FROM transactions '
+                    'WHERE ts_epoch > ? AND upi IS NOT NULL ORDER BY ts_epoch, id', (cutoff,))
+        with self._lock:
+            self._rings.clear()
+            self._last.clear()
+            while True:
+                rows = cur.fetchmany(5000)
+                if not rows:
+                    break
+                for r in rows:
+                    self._record(r['upi'], r['ts_epoch'], r['timestamp'], r['location'], r['device_id'])
+            self._db_path = database.DB_PATH
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+            self._last.clear()
+
+    def record(self, upi: str, epoch: int, timestamp: str = None, location: str = None, device_id: str = None):
+        if not upi or epoch is None:
+            return
+        with self._lock:
+            self._record(upi, int(epoch), timestamp, location, device_id)
+            if time.time() - self._swept_at >= SWEEP_SECONDS:
+                self._sweep()
+
+    def sweep(self) -> int:
+        """Drop UPIs with no epoch inside the horizon; returns how many were dropped."""
+        with self._lock:
+            return self._sweep()
+
+    def _sweep(self) -> int:
+        now = time.time()
+        cutoff = int(now) - self.horizon_minutes * 60
+        stale = [upi for upi, last in self._last.items() if last[0] <= cutoff]
+        for upi in stale:
+            # snapshot() then defers to the DB, which still has the older last transaction
+            del self._last[upi]
+            self._rings.pop(upi, None)
+        self._swept_at = now
+        return len(stale)
+
+    def __len__(self):
+        return len(self._rings)
+
+    def _record(self, upi, epoch, timestamp, location, device_id):
+        ring = self._rings.get(upi)
+        if ring is None:
+            ring = self._rings[upi] = _Ring(self.capacity)
+        ring.append(epoch)
+        last = self._last.get(upi)
+        if last is None or epoch >= last[0]:
+            self._last[upi] = (epoch, timestamp, location, device_id)
+
+    def is_current(self) -> bool:
+        return self._db_path is not None and self._db_path == database.DB_PATH
+
+    def snapshot(self, upi: str, windows: Iterable[int]) -> Optional[Dict[str, Any]]:
+        """Same shape as `database.get_velocity_snapshot`, or None when the engine cannot answer exactly."""
+        windows = [int(w) for w in windows]
+        if not self.is_current() or any(w > self.horizon_minutes for w in windows):
+            return None
+        now = int(time.time())
+        with self._lock:
+            last = self._last.get(upi)
+            ring = self._rings.get(upi)
+            if last is None or ring is None:
+                # no activity inside the horizon: an older last transaction may still exist in the DB
+                return None
+            counts = {}
+            for w in windows:
+                n = ring.count_after(now - w * 60)
+                if n is None:
+                    return None
+                counts[w] = n
+        return {'counts': counts, 'last_tx': {'timestamp': last[1], 'location': last[2], 'device_id': last[3]}}
+
+
+engine = VelocityEngine()
+
+
+def _on_transaction_saved(tx: Dict[str, Any], tx_id: int):
+    if not engine.is_current():
+        return
+    device_id = tx.get('device_id') or (tx.get('features') or {}).get('device_id')
+    engine.record(tx.get('upi'), database.timestamp_to_epoch(tx.get('timestamp')), tx.get('timestamp'), tx.get('location'), device_id)
+
+
+def _on_transactions_cleared():
+    engine.clear()
+
+
+database.add_listener('transaction_saved', _on_transaction_saved)
+database.add_listener('transactions_cleared', _on_transactions_cleared)
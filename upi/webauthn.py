@@ -17,7 +17,7 @@ except Exception:
     FIDO2_AVAILABLE = False
 
 from flask import session
-import database
+import storage
 
 RP_ID = os.environ.get('WEB_AUTHN_RP_ID', 'localhost')
 RP_NAME = os.environ.get('WEB_AUTHN_RP_NAME', 'UPI Fraud Demo')
@@ -85,7 +85,7 @@ def complete_registration(upi: str, attestation_response: dict) -> Dict[str, Any
             cred = server.register_complete(state, clientData, attObj)
             # store credential descriptor and public key
             cred_dict = {'id': cred.credential_id.hex(), 'public_key': cred.public_key.encode('pem').decode('utf-8')}
-            database.add_webauthn_credential(upi, cred_dict)
+            storage.backend.add_webauthn_credential(upi, cred_dict)
             return {'success': True, 'credential': cred_dict}
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -93,12 +93,12 @@ def complete_registration(upi: str, attestation_response: dict) -> Dict[str, Any
     if not isinstance(attestation_response, dict):
         return {'success': False, 'error': 'invalid_attestation'}
     cred_placeholder = {'id': attestation_response.get('id', 'demo-id'), 'raw': attestation_response}
-    database.add_webauthn_credential(upi, cred_placeholder)
+    storage.backend.add_webauthn_credential(upi, cred_placeholder)
     return {'success': True, 'credential': cred_placeholder, 'warning': 'demo stored (python-fido2 not installed)'}
 
 
 def begin_authentication(upi: str) -> Dict[str, Any]:
-    creds = database.get_webauthn_credentials(upi)
+    creds = storage.backend.get_webauthn_credentials(upi)
     if not creds:
         return {'success': False, 'error': 'no_credentials'}
     if FIDO2_AVAILABLE and server:
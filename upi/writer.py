@@ -0,0 +1,191 @@
+"""Write-behind, group-commit writer for the scoring path.
+
+`process_transaction` hands transaction and audit writes to a single
+background thread through a bounded queue. The thread groups whatever has
+queued up (up to `WRITE_BEHIND_BATCH_ROWS` rows or `WRITE_BEHIND_BATCH_MS`
+milliseconds) into one SQLite transaction, so concurrent requests share one
+commit/fsync instead of paying one each. Every submit returns a
+`concurrent.futures.Future` resolving to the inserted row id.
+
+Set `WRITE_BEHIND_MODE=sync` to execute each write inline on the caller's
+thread (used by the test suite so reads observe writes immediately).
+`close()` (also run at interpreter exit) writes everything already queued;
+writes submitted while it runs are executed inline. With a non-SQLite
+`storage.backend` the writes are applied one by one through its methods.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any
+
+import database
+import storage
+
+BATCH_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_BATCH_ROWS', '256'))
+BATCH_MAX_MS = int(os.environ.get('WRITE_BEHIND_BATCH_MS', '10'))
+QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', '10000'))
+MODE = os.environ.get('WRITE_BEHIND_MODE', 'async')  # 'async' | 'sync'
+
+_FLUSH = 'flush'
+
+
+class WriteBehindWriter:
+    def __init__(self, batch_rows: int = BATCH_MAX_ROWS, batch_ms: int = BATCH_MAX_MS,
+                 queue_size: int = QUEUE_SIZE, synchronous: bool = False):
+        self.batch_rows = batch_rows
+        self.batch_ms = batch_ms
+        self.synchronous = synchronous
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # held while checking `_stopping` and queueing, so nothing is queued after close() starts draining
+        self._submit_lock = threading.Lock()
+        self._stopping = False
+
+    # -- public API --
+    def submit_transaction(self, tx: Dict[str, Any]) -> Future:
+        return self._submit('transaction', (tx,))
+
+    def submit_audit(self, action: str, actor: str = None, details: Dict[str, Any] = None) -> Future:
+        # timestamp taken now, not when the batch commits
+        return self._submit('audit', (action, actor, details, database.datetime_now_str()))
+
+    def flush(self, timeout: float = None):
+        """Block until everything submitted so far has been committed."""
+        if self.synchronous or self._thread is None or not self._thread.is_alive():
+            return
+        self._submit(_FLUSH, ()).result(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Write everything queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        with self._submit_lock:
+            self._stopping = True
+        self._thread.join(timeout)
+        self._thread = None
+        self._stopping = False
+
+    # -- internals --
+    def _submit(self, kind: str, args: tuple) -> Future:
+        fut = Future()
+        if not self.synchronous:
+            with self._submit_lock:
+                if not self._stopping:
+                    self._ensure_started()
+                    self._queue.put((kind, args, fut))  # blocks when full: backpressure on producers
+                    return fut
+        # synchronous mode, or the writer is closing
+        self._write_batch([(kind, args, fut)])
+        return fut
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.batch_ms / 1000.0
+            while len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+        # closing: nothing can be queued any more, so write what is left
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_rows:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                break
+            self._write_batch(batch)
+        database.release_conn()
+
+    def _write_batch(self, batch):
+        if storage.backend.name != 'sqlite':
+            self._write_to_backend(storage.backend, batch)
+            return
+        items = [b for b in batch if b[0] != _FLUSH]
+        # tokenization/encryption happen before the write lock is taken
+        prepared = []
+        for kind, args, fut in items:
+            try:
+                row = database.prepare_transaction_row(args[0]) if kind == 'transaction' else None
+                prepared.append((kind, args, fut, row))
+            except Exception as e:
+                fut.set_exception(e)
+        results = None
+        try:
+            with database.transaction() as cur:
+                results = [self._apply(cur, kind, args, row) for kind, args, fut, row in prepared]
+        except Exception:
+            results = None
+        if results is None:
+            # one bad write must not sink the batch: retry each in its own transaction
+            results = []
+            for kind, args, fut, row in prepared:
+                try:
+                    with database.transaction() as cur:
+                        results.append(self._apply(cur, kind, args, row))
+                except Exception as e:
+                    results.append(e)
+        for (kind, args, fut, row), res in zip(prepared, results):
+            if isinstance(res, Exception):
+                print(f'write-behind: {kind} write failed: {res}')
+                fut.set_exception(res)
+                continue
+            if kind == 'transaction':
+                database.emit('transaction_saved', args[0], res)
+            fut.set_result(res)
+        for kind, args, fut in batch:
+            if kind == _FLUSH:
+                fut.set_result(None)
+
+    @staticmethod
+    def _write_to_backend(backend, batch):
+        # non-SQLite backends have no shared commit to group into: apply each write directly
+        for kind, args, fut in batch:
+            try:
+                if kind == 'transaction':
+                    res = backend.save_transaction(args[0])
+                elif kind == 'audit':
+                    res = backend.log_audit(args[0], args[1], args[2])
+                else:
+                    res = None
+            except Exception as e:
+                print(f'write-behind: {kind} write failed: {e}')
+                fut.set_exception(e)
+                continue
+            fut.set_result(res)
+
+    @staticmethod
+    def _apply(cur, kind, args, row):
+        if kind == 'transaction':
+            return database.insert_transaction(cur, args[0], row)
+        if kind == 'audit':
+            database.insert_audit(cur, args[0], args[1], args[2], ts=args[3])
+            return cur.lastrowid
+        raise ValueError(f'unknown write kind: {kind}')
+
+
+writer = WriteBehindWriter(synchronous=(MODE == 'sync'))
+atexit.register(writer.close)